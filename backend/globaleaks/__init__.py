@@ -10,7 +10,7 @@ __copyright__ = u'Hermes Center for Transparency and Digital Human Rights.'
 __email__ = u'info@globaleaks.org'
 __version__ = u'2.60.119'
 
-DATABASE_VERSION = 24
+DATABASE_VERSION = 27
 FIRST_DATABASE_VERSION_SUPPORTED = 11
 
 # Add here by hand the languages supported!
@@ -15,9 +15,11 @@ from twisted.internet import defer
 from globaleaks import event
 from globaleaks.handlers.admin.user import get_admin_users
 from globaleaks.handlers.admin.notification import get_notification
+from globaleaks.orm import transact
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
-from globaleaks.utils.mailutils import sendmail
+from globaleaks.jobs.wakeup import GLWorkBus
+from globaleaks.utils.mailutils import schedule_email
 from globaleaks.utils.utility import log, datetime_now, is_expired, bytes_to_pretty_str
 
 
@@ -56,6 +58,13 @@ def compute_activity_level():
                   round(max(requests_timing), 2),
                   round(min(requests_timing), 2)))
 
+    orm_stats = transact.stats()
+    if orm_stats['rw']['queued'] or orm_stats['ro']['queued']:
+        log.info("ORM queues: writer %d queued (max %d), readers %d queued (max %d) on %d/%d busy threads" %
+                 (orm_stats['rw']['queued'], orm_stats['rw']['max_queued'],
+                  orm_stats['ro']['queued'], orm_stats['ro']['max_queued'],
+                  orm_stats['ro']['working'], orm_stats['ro']['threads']))
+
     for event_name, threshold in Alarm.OUTCOMING_ANOMALY_MAP.iteritems():
         if event_name in current_event_matrix:
             if current_event_matrix[event_name] > threshold:
@@ -100,7 +109,10 @@ def compute_activity_level():
     mailinfos = yield Alarm.admin_alarm_generate_mail(current_event_matrix)
     for mailinfo in mailinfos:
         Alarm.last_alarm_email = datetime_now()
-        yield sendmail(mailinfo['mail_address'], mailinfo['subject'], mailinfo['body'])
+        yield schedule_email(mailinfo['mail_address'], mailinfo['subject'], mailinfo['body'])
+
+    if len(mailinfos):
+        GLWorkBus.signal('mailflush')
 
     defer.returnValue(Alarm.stress_levels['activity'] - previous_activity_sl)
 
@@ -0,0 +1,12 @@
+# -*- encoding: utf-8 -*-
+
+from globaleaks.db.migrations.update import MigrationBase
+
+
+class MigrationScript(MigrationBase):
+    """
+    The version 25 does not change any model; the new db is created
+    from sqlite.sql that introduces the index on whistleblowertip.receipt_hash
+    used on every whistleblower login.
+    """
+    pass
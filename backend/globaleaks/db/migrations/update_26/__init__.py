@@ -0,0 +1,11 @@
+# -*- encoding: utf-8 -*-
+
+from globaleaks.db.migrations.update import MigrationBase
+
+
+class MigrationScript(MigrationBase):
+    """
+    The version 26 introduces the table mail implementing the outbox of the
+    mails to be sent; the table is created empty from sqlite.sql.
+    """
+    pass
@@ -0,0 +1,13 @@
+# -*- encoding: utf-8 -*-
+
+from globaleaks.db.migrations.update import MigrationBase
+
+
+class MigrationScript(MigrationBase):
+    """
+    The version 27 does not change any model; the new db is created
+    from sqlite.sql that introduces the indexes on the foreign keys used
+    by the tip lists and by the jobs, and the indexes on the 'new'
+    flags scanned by the delivery and notification jobs.
+    """
+    pass
@@ -515,6 +515,17 @@ CREATE TABLE securefiledelete (
     PRIMARY KEY (id)
 );
 
+CREATE TABLE mail (
+    id TEXT NOT NULL,
+    creation_date TEXT NOT NULL,
+    address TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    processing_attempts INTEGER NOT NULL,
+    next_attempt TEXT NOT NULL,
+    PRIMARY KEY (id)
+);
+
 CREATE TABLE counter (
     id TEXT NOT NULL,
     key TEXT NOT NULL,
@@ -530,3 +541,21 @@ CREATE INDEX fieldoption__field_id_index ON fieldoption(field_id);
 CREATE INDEX optionactivatefield__field_id_index ON optionactivatefield(field_id);
 CREATE INDEX step__context_id_index ON step(context_id);
 CREATE INDEX fieldanswer__internaltip_id_index ON fieldanswer(internaltip_id);
+CREATE INDEX whistleblowertip__receipt_hash_index ON whistleblowertip(receipt_hash);
+CREATE INDEX mail__next_attempt_index ON mail(next_attempt);
+CREATE INDEX receivertip__receiver_id_index ON receivertip(receiver_id);
+CREATE INDEX receivertip__internaltip_id_index ON receivertip(internaltip_id);
+CREATE INDEX receiverfile__receivertip_id_index ON receiverfile(receivertip_id);
+CREATE INDEX receiverfile__internalfile_id_index ON receiverfile(internalfile_id);
+CREATE INDEX receiverfile__receiver_id_index ON receiverfile(receiver_id);
+CREATE INDEX internalfile__internaltip_id_index ON internalfile(internaltip_id);
+CREATE INDEX comment__internaltip_id_index ON comment(internaltip_id);
+CREATE INDEX message__receivertip_id_index ON message(receivertip_id);
+CREATE INDEX eventlogs__mail_sent_index ON eventlogs(mail_sent);
+CREATE INDEX eventlogs__receivertip_id_index ON eventlogs(receivertip_id);
+CREATE INDEX internaltip__expiration_date_index ON internaltip(expiration_date);
+CREATE INDEX receivertip__new_index ON receivertip(new);
+CREATE INDEX receiverfile__new_index ON receiverfile(new);
+CREATE INDEX internalfile__new_index ON internalfile(new);
+CREATE INDEX comment__new_index ON comment(new);
+CREATE INDEX message__new_index ON message(new);
@@ -14,21 +14,25 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import transport_security_check, authenticated
 from globaleaks.handlers.admin.field import db_import_fields
 from globaleaks.handlers.admin.step import db_create_step
-from globaleaks.handlers.node import anon_serialize_step
+from globaleaks.handlers.node import anon_serialize_step, QuestionnaireTree
 from globaleaks.rest import errors, requests
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.utils.structures import fill_localized_keys, get_localized_values
 from globaleaks.utils.utility import log, datetime_now, datetime_null, datetime_to_ISO8601
 
 
-def admin_serialize_context(store, context, language):
+def admin_serialize_context(store, context, language, tree=None):
     """
     Serialize the specified context
 
     :param store: the store on which perform queries.
     :param language: the language in which to localize data.
+    :param tree: the QuestionnaireTree including the context, if already loaded.
     :return: a dictionary representing the serialization of the context.
     """
+    if tree is None:
+        tree = QuestionnaireTree(store, [context.id])
+
     ret_dict = {
         'id': context.id,
         'custodians': [c.id for c in context.custodians],
@@ -48,7 +52,7 @@ def admin_serialize_context(store, context, language):
         'show_receivers_in_alphabetical_order': context.show_receivers_in_alphabetical_order,
         'questionnaire_layout': context.questionnaire_layout,
         'reset_questionnaire': False,
-        'steps': [anon_serialize_step(store, s, language) for s in context.steps]
+        'steps': [anon_serialize_step(store, s, language, tree) for s in tree.steps[context.id]]
     }
 
     return get_localized_values(ret_dict, context, context.localized_keys, language)
@@ -63,7 +67,9 @@ def get_context_list(store, language):
     :param language: the language in which to localize data.
     :return: a dictionary representing the serialization of the contexts.
     """
-    return [admin_serialize_context(store, context, language)
+    tree = QuestionnaireTree(store)
+
+    return [admin_serialize_context(store, context, language, tree)
         for context in store.find(models.Context)]
 
 
@@ -120,7 +126,9 @@ def db_get_context_steps(store, context_id, language):
         log.err("Requested invalid context")
         raise errors.ContextIdNotFound
 
-    return [anon_serialize_step(store, s, language) for s in context.steps]
+    tree = QuestionnaireTree(store, [context.id])
+
+    return [anon_serialize_step(store, s, language, tree) for s in tree.steps[context.id]]
 
 
 @transact_ro
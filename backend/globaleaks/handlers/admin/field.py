@@ -14,7 +14,7 @@ from globaleaks import models
 from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.authentication import authenticated, transport_security_check
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.node import anon_serialize_field
+from globaleaks.handlers.node import anon_serialize_field, QuestionnaireTree
 from globaleaks.rest import errors, requests
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.utils.structures import fill_localized_keys
@@ -407,9 +407,13 @@ def get_fieldtemplates_list(store, language):
     """
     ret = []
 
-    for f in store.find(models.Field, models.Field.instance == u'template'):
-        if not store.find(models.FieldField, models.FieldField.child_id == f.id).one():
-            ret.append(anon_serialize_field(store, f, language))
+    templates = list(store.find(models.Field, models.Field.instance == u'template'))
+
+    tree = QuestionnaireTree(store, [], field_ids=[f.id for f in templates])
+
+    for f in templates:
+        if f.id not in tree.field_parent:
+            ret.append(anon_serialize_field(store, f, language, tree))
 
     return ret
 
@@ -483,6 +487,7 @@ class FieldTemplateInstance(BaseHandler):
         response = yield update_field(field_id, request, self.request.language)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(202) # Updated
         self.finish(response)
@@ -500,6 +505,7 @@ class FieldTemplateInstance(BaseHandler):
         yield delete_field(field_id)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(200)
 
@@ -527,6 +533,7 @@ class FieldCollection(BaseHandler):
         response = yield create_field(request, self.request.language)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(201)
         self.finish(response)
@@ -554,6 +561,7 @@ class FieldInstance(BaseHandler):
         response = yield get_field(field_id, self.request.language)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(200)
         self.finish(response)
@@ -577,6 +585,7 @@ class FieldInstance(BaseHandler):
         response = yield update_field(field_id, request, self.request.language)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(202) # Updated
         self.finish(response)
@@ -595,5 +604,6 @@ class FieldInstance(BaseHandler):
         yield delete_field(field_id)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(200)
@@ -7,9 +7,11 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import authenticated, transport_security_check
 from globaleaks.models import Notification
 from globaleaks.rest import requests
-from globaleaks.security import GLBPGP
+from globaleaks.rest.apicache import GLApiCache
+from globaleaks.security import GLBPGP, GLBPGPCache
 from globaleaks.utils.utility import log, datetime_to_ISO8601
 from globaleaks.utils.structures import fill_localized_keys, get_localized_values
+from globaleaks.utils.templating import Templating
 
 
 def parse_pgp_options(notification, request):
@@ -27,6 +29,10 @@ def parse_pgp_options(notification, request):
     # the default
     notification.exception_email_pgp_key_status = u'disabled'
 
+    if (remove_key or new_pgp_key) and notification.exception_email_pgp_key_fingerprint:
+        # the keyring loaded for the previous key is no more needed
+        GLBPGPCache.invalidate(notification.exception_email_pgp_key_fingerprint)
+
     if remove_key:
         # In all the cases below, the key is marked disabled as request
         notification.exception_email_pgp_key_status = u'disabled'
@@ -86,12 +92,16 @@ def admin_serialize_notification(notif, language):
     return get_localized_values(ret_dict, notif, notif.localized_keys, language)
 
 
-@transact_ro
-def get_notification(store, language):
+def db_get_notification(store, language):
     notif = store.find(Notification).one()
     return admin_serialize_notification(notif, language)
 
 
+@transact_ro
+def get_notification(store, language):
+    return db_get_notification(store, language)
+
+
 @transact
 def update_notification(store, request, language):
     notif = store.find(Notification).one()
@@ -146,5 +156,8 @@ class NotificationInstance(BaseHandler):
 
         response = yield update_notification(request, self.request.language)
 
+        Templating.invalidate()
+        GLApiCache.invalidate('mail_notification')
+
         self.set_status(202)
         self.finish(response)
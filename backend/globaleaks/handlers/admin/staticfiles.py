@@ -21,6 +21,7 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import transport_security_check, authenticated
 from globaleaks.utils.utility import log
 from globaleaks.rest import errors
+from globaleaks.rest.apicache import GLApiCache
 from globaleaks.rest.requests import receiver_img_regexp
 
 from globaleaks.security import directory_traversal_check
@@ -203,6 +204,9 @@ class StaticFileInstance(BaseHandler):
 
         log.debug("Admin uploaded new static file: %s" % dumped_file['filename'])
 
+        # the public node description reports the presence of the custom homepage
+        GLApiCache.invalidate('node')
+
         self.set_status(201)  # Created
         self.finish()
 
@@ -222,6 +226,8 @@ class StaticFileInstance(BaseHandler):
 
         os.remove(path)
 
+        GLApiCache.invalidate('node')
+
         self.set_status(200)
         self.finish()
 
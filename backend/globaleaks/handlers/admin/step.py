@@ -134,6 +134,7 @@ class StepCollection(BaseHandler):
         response = yield create_step(request, self.request.language)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(201)
         self.finish(response)
@@ -183,6 +184,7 @@ class StepInstance(BaseHandler):
         response = yield update_step(step_id, request, self.request.language)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(202) # Updated
         self.finish(response)
@@ -202,5 +204,6 @@ class StepInstance(BaseHandler):
         yield delete_step(step_id)
 
         GLApiCache.invalidate('contexts')
+        GLApiCache.invalidate('questionnaire')
 
         self.set_status(200)
@@ -5,11 +5,11 @@
 #
 # Files collection handlers and utils
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 from storm.expr import And
 
 from globaleaks import security
-from globaleaks.orm import transact_ro
+from globaleaks.orm import transact, transact_ro
 from globaleaks.models import User
 from globaleaks.settings import GLSettings
 from globaleaks.models import WhistleblowerTip
@@ -176,12 +176,11 @@ def transport_security_check(wrapped_handler_role):
     return wrapper
 
 
-@transact_ro  # read only transact; manual commit on success needed
-def login_whistleblower(store, receipt, using_tor2web):
+@transact
+def _login_whistleblower(store, hashed_receipt, using_tor2web):
     """
     login_whistleblower returns the WhistleblowerTip.id
     """
-    hashed_receipt = security.hash_password(receipt, GLSettings.memory_copy.receipt_salt)
     wbtip = store.find(WhistleblowerTip,
                         WhistleblowerTip.receipt_hash == unicode(hashed_receipt)).one()
 
@@ -198,19 +197,47 @@ def login_whistleblower(store, receipt, using_tor2web):
 
     log.debug("Whistleblower login: Valid receipt")
     wbtip.last_access = utility.datetime_now()
-    store.commit()  # the transact was read only! on success we apply the commit()
     return wbtip.id
 
 
-@transact_ro  # read only transact; manual commit on success needed
-def login(store, username, password, using_tor2web):
+@inlineCallbacks
+def login_whistleblower(receipt, using_tor2web):
     """
-    login returns a tuple (user_id, state, pcn)
+    login_whistleblower returns the WhistleblowerTip.id
+
+    The receipt is hashed on the KDF thread pool before entering the transaction.
+    """
+    hashed_receipt = yield security.run_kdf(security.hash_password,
+                                            receipt, GLSettings.memory_copy.receipt_salt)
+
+    wbtip_id = yield _login_whistleblower(hashed_receipt, using_tor2web)
+
+    returnValue(wbtip_id)
+
+
+@transact_ro
+def get_user_credentials(store, username):
+    """
+    returns a tuple (user_id, password_hash, salt) or None if the user does not exist
     """
     user = store.find(User, And(User.username == username,
                                 User.state != u'disabled')).one()
 
-    if not user or not security.check_password(password,  user.password, user.salt):
+    if not user:
+        return None
+
+    return user.id, user.password, user.salt
+
+
+@transact
+def _login(store, user_id, using_tor2web):
+    """
+    login returns a tuple (user_id, state, pcn)
+    """
+    user = store.find(User, And(User.id == user_id,
+                                User.state != u'disabled')).one()
+
+    if not user:
         log.debug("Login: Invalid credentials")
         GLSettings.failed_login_attempts += 1
         raise errors.InvalidAuthentication
@@ -223,10 +250,34 @@ def login(store, username, password, using_tor2web):
 
     log.debug("Login: Success (%s)" % user.role)
     user.last_login = utility.datetime_now()
-    store.commit()  # the transact was read only! on success we apply the commit()
     return user.id, user.state, user.role, user.password_change_needed
 
 
+@inlineCallbacks
+def login(username, password, using_tor2web):
+    """
+    login returns a tuple (user_id, state, pcn)
+
+    The password is verified on the KDF thread pool between the lookup
+    of the user and the transaction updating its last login date.
+    """
+    credentials = yield get_user_credentials(username)
+
+    valid = False
+    if credentials:
+        user_id, password_hash, salt = credentials
+        valid = yield security.run_kdf(security.check_password, password, password_hash, salt)
+
+    if not valid:
+        log.debug("Login: Invalid credentials")
+        GLSettings.failed_login_attempts += 1
+        raise errors.InvalidAuthentication
+
+    ret = yield _login(user_id, using_tor2web)
+
+    returnValue(ret)
+
+
 class AuthenticationHandler(BaseHandler):
     """
     Login handler for admins and receivers
@@ -16,9 +16,11 @@ import types
 
 from StringIO import StringIO
 
-from twisted.internet import fdesc
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import fdesc, reactor
+from twisted.internet.defer import inlineCallbacks, maybeDeferred, Deferred, succeed
+from twisted.internet.interfaces import IPushProducer
 from twisted.python.failure import Failure
+from zope.interface import implementer
 
 from cyclone import escape, httputil
 from cyclone.escape import native_str
@@ -112,6 +114,123 @@ class GLHTTPConnection(HTTPConnection):
             self.transport.loseConnection()
 
 
+@implementer(IPushProducer)
+class ChunkProducer(object):
+    """
+    Push producer streaming through a request handler the chunks returned by
+    read_chunk(), one chunk per reactor iteration.
+
+    The transport pauses the producer when its write buffer is full, so that
+    the memory used by a download is bounded by a chunk regardless of the
+    size of the whole response.
+
+    read_chunk() may return a deferred; a chunk equal to None signals the end
+    of the stream.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.transport = handler.request.connection.transport
+        self.finish = Deferred()
+        self.paused = False
+        self.reading = False
+        self.stopped = False
+        self.call = None
+
+    def read_chunk(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def start(self):
+        self.transport.registerProducer(self, True)
+        self.schedule()
+        return self.finish
+
+    def schedule(self):
+        if self.call is None and not (self.paused or self.reading or self.stopped):
+            self.call = reactor.callLater(0, self.send_chunk)
+
+    def send_chunk(self):
+        self.call = None
+        self.reading = True
+
+        d = maybeDeferred(self.read_chunk)
+        d.addCallback(self.write_chunk)
+        d.addErrback(self.stop)
+
+    def write_chunk(self, chunk):
+        self.reading = False
+
+        if self.stopped or chunk is None:
+            self.stop()
+            return
+
+        if chunk:
+            self.handler.write(chunk)
+            self.handler.flush()
+
+        self.schedule()
+
+    def cancel(self):
+        if self.call is not None:
+            self.call.cancel()
+            self.call = None
+
+    def stop(self, failure=None):
+        self.reading = False
+        self.cancel()
+        self.close()
+
+        if self.stopped:
+            # the connection has been lost while the chunk was being read
+            return
+
+        self.stopped = True
+        self.transport.unregisterProducer()
+
+        if failure is None:
+            self.finish.callback(None)
+        else:
+            self.finish.errback(failure)
+
+    def pauseProducing(self):
+        self.paused = True
+        self.cancel()
+
+    def resumeProducing(self):
+        self.paused = False
+        self.schedule()
+
+    def stopProducing(self):
+        # the connection has been lost
+        if self.stopped:
+            return
+
+        self.stopped = True
+        self.cancel()
+
+        if not self.reading:
+            self.close()
+
+        self.finish.callback(None)
+
+
+class FileProducer(ChunkProducer):
+    """
+    Producer streaming the content of a file object.
+    """
+    def __init__(self, handler, fd):
+        ChunkProducer.__init__(self, handler)
+        self.fd = fd
+
+    def read_chunk(self):
+        return self.fd.read(GLSettings.file_chunk_size) or None
+
+    def close(self):
+        self.fd.close()
+
+
 class BaseHandler(RequestHandler):
     handler_exec_time_threshold = HANDLER_EXEC_TIME_THRESHOLD
 
@@ -375,18 +494,20 @@ class BaseHandler(RequestHandler):
             log.err("Unable to open %s: %s" % (GLSettings.httplogfile, excep))
 
     def write_file(self, filepath):
+        """
+        Stream the file to the client; the returned deferred is fired
+        when the whole file has been handed to the transport.
+        """
         if not (os.path.exists(filepath) or os.path.isfile(filepath)):
-            return
+            return succeed(None)
 
         try:
-            with open(filepath, "rb") as f:
-                while True:
-                    chunk = f.read(GLSettings.file_chunk_size)
-                    if len(chunk) == 0:
-                        break
-                    self.write(chunk)
+            fd = open(filepath, "rb")
         except IOError as srcerr:
             log.err("Unable to open %s: %s " % (filepath, srcerr.strerror))
+            return succeed(None)
+
+        return FileProducer(self, fd).start()
 
     def write_error(self, status_code, **kw):
         exception = kw.get('exception')
@@ -416,6 +537,33 @@ class BaseHandler(RequestHandler):
         else:
             RequestHandler.write(self, chunk)
 
+    def finish_cached(self, response):
+        """
+        Finish the request with a CachedResponse of GLApiCache.
+
+        The body is sent already encoded (and already compressed when the
+        client accepts gzip) and the client is allowed to keep a copy of the
+        public resource as long as it revalidates it with If-None-Match.
+
+        The gzip body is sent under the same conditions of the gzip
+        transform of cyclone that adds Accept-Encoding to the Vary header.
+        """
+        self.set_header("Cache-control", "no-cache, must-revalidate")
+        self.set_header("Vary", "GL-Language")
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Etag", response.etag)
+
+        inm = self.request.headers.get("If-None-Match")
+        if inm and (inm.strip() == '*' or inm.find(response.etag) != -1):
+            self.set_status(304)
+            self.finish()
+        elif self.request.supports_http_1_1() and \
+                'gzip' in self.request.headers.get("Accept-Encoding", ""):
+            self.set_header("Content-Encoding", "gzip")
+            self.finish(response.gzip_body)
+        else:
+            self.finish(response.body)
+
     @inlineCallbacks
     def uniform_answers_delay(self):
         """
@@ -615,7 +763,18 @@ class BaseStaticFileHandler(BaseHandler):
         if mime_type:
             self.set_header("Content-Type", mime_type)
 
-        self.write_file(abspath)
+        # the body is streamed so that the ETag automatically computed by
+        # cyclone on the whole buffer is replaced by one based on file stats
+        stat = os.stat(abspath)
+        etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+        self.set_header("Etag", etag)
+
+        inm = self.request.headers.get("If-None-Match")
+        if inm and inm.find(etag) != -1:
+            self.set_status(304)
+            return
+
+        return self.write_file(abspath)
 
     def parse_url_path(self, url_path):
         if os.path.sep != "/":
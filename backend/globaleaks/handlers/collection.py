@@ -6,16 +6,18 @@
 # File Collections handlers and utils
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
 
 from globaleaks.orm import transact_ro
 from globaleaks.handlers.admin import node, context, receiver, notification
 from globaleaks.handlers.authentication import transport_security_check, authenticated
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, ChunkProducer
 from globaleaks.handlers.files import download_all_files, serialize_receiver_file
 from globaleaks.handlers.submission import serialize_usertip
 from globaleaks.models import ReceiverTip, ReceiverFile
 from globaleaks.notification import Event
 from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.zipstream import ZipStream
 
@@ -64,13 +66,36 @@ def get_receiver_from_rtip(store, rtip_id, language):
     return receiver.admin_serialize_receiver(rtip.receiver, language)
 
 
-class CollectionStreamer(object):
-    def __init__(self, handler):
-        self.handler = handler
+class CollectionStreamer(ChunkProducer):
+    """
+    Producer streaming a ZipStream; the archive is generated lazily as the
+    transport drains and every chunk is compressed in a thread in order to
+    not block the reactor.
+    """
+    def __init__(self, handler, zipstream):
+        ChunkProducer.__init__(self, handler)
+        self.zipstream = iter(zipstream)
+
+    def read_chunk(self):
+        return deferToThread(self._read_chunk)
+
+    def _read_chunk(self):
+        chunk = []
+        size = 0
+
+        for data in self.zipstream:
+            chunk.append(data)
+            size += len(data)
+            if size >= GLSettings.file_chunk_size:
+                break
+
+        if not chunk:
+            return None
+
+        return ''.join(chunk)
 
-    def write(self, data):
-        if len(data) > 0:
-            self.handler.write(data)
+    def close(self):
+        self.zipstream.close()
 
 
 class CollectionDownload(BaseHandler):
@@ -114,7 +139,6 @@ class CollectionDownload(BaseHandler):
         self.set_header('Content-Type', 'application/octet-stream')
         self.set_header('Content-Disposition', 'attachment; filename=\"collection.zip\"')
 
-        for data in ZipStream(files_dict):
-            self.write(data)
+        yield CollectionStreamer(self, ZipStream(files_dict)).start()
 
         self.finish()
@@ -1,5 +1,7 @@
 import os
 
+from twisted.internet.defer import inlineCallbacks
+
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.settings import GLSettings
 from globaleaks.security import directory_traversal_check
@@ -8,6 +10,7 @@ from globaleaks.security import directory_traversal_check
 class CSSFileHandler(BaseHandler):
     original_css_filename = 'styles.css'
 
+    @inlineCallbacks
     def get(self):
         self.set_header("Content-Type", 'text/css')
 
@@ -17,5 +20,5 @@ class CSSFileHandler(BaseHandler):
         directory_traversal_check(GLSettings.client_path, original_css)
         directory_traversal_check(GLSettings.static_path, custom_css)
 
-        self.write_file(original_css)
-        self.write_file(custom_css)
+        yield self.write_file(original_css)
+        yield self.write_file(custom_css)
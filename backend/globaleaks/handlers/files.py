@@ -17,6 +17,7 @@ from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import transport_security_check, authenticated, unauthenticated
 from globaleaks.handlers.rtip import db_access_rtip
+from globaleaks.jobs.wakeup import GLWorkBus
 from globaleaks.models import ReceiverFile, InternalTip, InternalFile, WhistleblowerTip
 from globaleaks.rest import errors
 from globaleaks.settings import GLSettings
@@ -168,6 +169,8 @@ class FileAdd(BaseHandler):
             log.err("Unable to register (append) file in DB: %s" % excep)
             raise errors.InternalServerError("Unable to accept new files")
 
+        GLWorkBus.signal('delivery')
+
     @transport_security_check('whistleblower')
     @authenticated('whistleblower')
     @inlineCallbacks
@@ -293,6 +296,6 @@ class Download(BaseHandler):
 
         filelocation = os.path.join(GLSettings.submission_path, rfile['path'])
 
-        self.write_file(filelocation)
+        yield self.write_file(filelocation)
 
         self.finish()
@@ -40,4 +40,4 @@ class LanguageFileHandler(BaseStaticFileHandler):
             directory_traversal_check(GLSettings.client_path, path)
             self.root = os.path.abspath(os.path.join(GLSettings.client_path, 'l10n'))
 
-        BaseStaticFileHandler.get(self, path)
+        return BaseStaticFileHandler.get(self, path)
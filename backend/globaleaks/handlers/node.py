@@ -6,6 +6,9 @@
 # exposed API.
 import os
 
+from collections import defaultdict
+
+from storm.expr import In
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models, LANGUAGES_SUPPORTED
@@ -89,19 +92,145 @@ def anon_serialize_node(store, language):
         'accept_submissions': GLSettings.accept_submissions,
         'enable_captcha': node.enable_captcha,
         'enable_proof_of_work': node.enable_proof_of_work,
+        'custom_homepage': os.path.isfile(os.path.join(GLSettings.static_path, "custom_homepage.html"))
     }
 
     return get_localized_values(ret_dict, node, node.localized_keys, language)
 
 
-def anon_serialize_context(store, context, language):
+def find_in(store, model, column, values):
+    """
+    :return: the objects of the model having the column in values
+    """
+    values = list(values)
+    if not values:
+        return []
+
+    return store.find(model, In(column, values))
+
+
+class QuestionnaireTree(object):
+    """
+    The steps of the contexts with the fields, attrs, options and
+    activations of their questionnaires, loaded with a constant number of
+    queries for each level of nested fields and indexed so that the
+    questionnaires are assembled in memory.
+
+    The children are listed in the order of the corresponding references
+    (e.g. Step.children), on which the hash of the questionnaires depends.
+    """
+    def __init__(self, store, context_ids=None, step_ids=(), field_ids=()):
+        """
+        :param context_ids: the ids of the contexts of which load the steps
+            (all the contexts and the field templates if None)
+        :param step_ids: the ids of further steps to be loaded
+        :param field_ids: the ids of further fields to be loaded
+        """
+        self.steps = defaultdict(list)
+        self.fields = {}
+        self.step_children = defaultdict(list)
+        self.field_step = {}
+        self.field_children = defaultdict(list)
+        self.field_parent = {}
+        self.attrs = defaultdict(list)
+        self.options = defaultdict(list)
+        self.option_activations = defaultdict(list)
+        self.field_activations = defaultdict(list)
+
+        if context_ids is None:
+            # the whole node is loaded without restricting the queries
+            steps = store.find(models.Step)
+            fields = store.find(models.Field)
+            step_links = store.find(models.StepField)
+            field_links = store.find(models.FieldField)
+        else:
+            steps = list(find_in(store, models.Step, models.Step.context_id, context_ids))
+            steps.extend(find_in(store, models.Step, models.Step.id, step_ids))
+
+            step_links = list(find_in(store, models.StepField, models.StepField.step_id,
+                                      [step.id for step in steps]))
+
+            fields, field_links = [], []
+
+            level = set(field_ids) | set(sf.field_id for sf in step_links)
+            while level:
+                level_fields = list(find_in(store, models.Field, models.Field.id, level))
+
+                # the templates are loaded along with their instances
+                loaded = level | set(f.id for f in fields)
+                templates = set(f.template_id for f in level_fields if f.template_id) - loaded
+                level_fields.extend(find_in(store, models.Field, models.Field.id, templates))
+
+                fields.extend(level_fields)
+
+                links = list(find_in(store, models.FieldField, models.FieldField.parent_id,
+                                     [f.id for f in level_fields]))
+                field_links.extend(links)
+
+                level = set(ff.child_id for ff in links) - set(f.id for f in fields)
+
+        for step in steps:
+            self.steps[step.context_id].append(step)
+
+        for field in fields:
+            self.fields[field.id] = field
+
+        # the references to the children are looked up on the primary keys
+        # of the linking tables, listing the children by their id
+        for sf in sorted(step_links, key=lambda sf: sf.field_id):
+            self.step_children[sf.step_id].append(self.fields[sf.field_id])
+            self.field_step[sf.field_id] = sf.step_id
+
+        for ff in sorted(field_links, key=lambda ff: ff.child_id):
+            self.field_children[ff.parent_id].append(self.fields[ff.child_id])
+            self.field_parent[ff.child_id] = ff.parent_id
+
+        if context_ids is None:
+            attrs = store.find(models.FieldAttr)
+            options = store.find(models.FieldOption)
+            option_links = field_option_links = list(store.find(models.OptionActivateField))
+        else:
+            # the step and the parent of the fields loaded directly
+            for sf in find_in(store, models.StepField, models.StepField.field_id,
+                              set(field_ids) - set(self.field_step)):
+                self.field_step[sf.field_id] = sf.step_id
+
+            for ff in find_in(store, models.FieldField, models.FieldField.child_id,
+                              set(field_ids) - set(self.field_parent)):
+                self.field_parent[ff.child_id] = ff.parent_id
+
+            attrs = find_in(store, models.FieldAttr, models.FieldAttr.field_id, self.fields)
+            options = list(find_in(store, models.FieldOption, models.FieldOption.field_id, self.fields))
+            option_links = find_in(store, models.OptionActivateField, models.OptionActivateField.option_id,
+                                   [option.id for option in options])
+            field_option_links = find_in(store, models.OptionActivateField, models.OptionActivateField.field_id,
+                                         self.fields)
+
+        for attr in attrs:
+            self.attrs[attr.field_id].append(attr)
+
+        for option in options:
+            self.options[option.field_id].append(option)
+
+        for activation in sorted(option_links, key=lambda a: a.field_id):
+            self.option_activations[activation.option_id].append(activation.field_id)
+
+        for activation in field_option_links:
+            self.field_activations[activation.field_id].append(activation.option_id)
+
+
+def anon_serialize_context(store, context, language, tree=None):
     """
     Serialize context description
 
     @param context: a valid Storm object
+    @param tree: the QuestionnaireTree including the context, if already loaded
     @return: a dict describing the contexts available for submission,
         (e.g. checks if almost one receiver is associated)
     """
+    if tree is None:
+        tree = QuestionnaireTree(store, [context.id])
+
     ret_dict = {
         'id': context.id,
         'presentation_order': context.presentation_order,
@@ -121,25 +250,31 @@ def anon_serialize_context(store, context, language):
         'questionnaire_layout': context.questionnaire_layout,
         'custodians': [c.id for c in context.custodians],
         'receivers': [r.id for r in context.receivers],
-        'steps': [anon_serialize_step(store, s, language) for s in context.steps]
+        'steps': [anon_serialize_step(store, s, language, tree) for s in tree.steps[context.id]]
     }
 
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
-def anon_serialize_field_option(option, language):
+def anon_serialize_field_option(option, language, tree=None):
     """
     Serialize a field option, localizing its content depending on the language.
 
     :param option: the field option object to be serialized
     :param language: the language in which to localize data
+    :param tree: the QuestionnaireTree including the option, if already loaded
     :return: a serialization of the object
     """
+    if tree is not None:
+        activated_fields = tree.option_activations[option.id]
+    else:
+        activated_fields = [field.id for field in option.activated_fields]
+
     ret_dict = {
         'id': option.id,
         'presentation_order': option.presentation_order,
         'score_points': option.score_points,
-        'activated_fields': [field.id for field in option.activated_fields]
+        'activated_fields': activated_fields
     }
 
     return get_localized_values(ret_dict, option, option.localized_keys, language)
@@ -168,31 +303,33 @@ def anon_serialize_field_attr(attr, language):
     return ret_dict
 
 
-def anon_serialize_field(store, field, language):
+def anon_serialize_field(store, field, language, tree=None):
     """
     Serialize a field, localizing its content depending on the language.
 
     :param field: the field object to be serialized
     :param language: the language in which to localize data
+    :param tree: the QuestionnaireTree including the field, if already loaded
     :return: a serialization of the object
     """
     # naif likes if we add reference links
     # this code is inspired by:
     #  - https://www.youtube.com/watch?v=KtNsUgKgj9g
 
-    if field.template:
-        f_to_serialize = field.template
+    if tree is None:
+        tree = QuestionnaireTree(store, [], field_ids=[field.id])
+
+    if field.template_id:
+        f_to_serialize = tree.fields[field.template_id]
     else:
         f_to_serialize = field
 
-    sf = store.find(models.StepField, models.StepField.field_id == field.id).one()
-    step_id = sf.step_id if sf else ''
+    step_id = tree.field_step.get(field.id, '')
 
-    ff = store.find(models.FieldField, models.FieldField.child_id == field.id).one()
-    fieldgroup_id = ff.parent_id if ff else ''
+    fieldgroup_id = tree.field_parent.get(field.id, '')
 
     attrs = {}
-    for attr in store.find(models.FieldAttr, models.FieldAttr.field_id == f_to_serialize.id):
+    for attr in tree.attrs[f_to_serialize.id]:
         attrs[attr.name] = anon_serialize_field_attr(attr, language)
 
     ret_dict = {
@@ -213,27 +350,31 @@ def anon_serialize_field(store, field, language):
         'y': field.y,
         'width': field.width,
         'activated_by_score': field.activated_by_score,
-        'activated_by_options': [activation.option_id for activation in field.activated_by_options],
-        'options': [anon_serialize_field_option(o, language) for o in f_to_serialize.options],
-        'children': [anon_serialize_field(store, f, language) for f in f_to_serialize.children]
+        'activated_by_options': tree.field_activations[field.id],
+        'options': [anon_serialize_field_option(o, language, tree) for o in tree.options[f_to_serialize.id]],
+        'children': [anon_serialize_field(store, f, language, tree) for f in tree.field_children[f_to_serialize.id]]
     }
 
     return get_localized_values(ret_dict, f_to_serialize, field.localized_keys, language)
 
 
-def anon_serialize_step(store, step, language):
+def anon_serialize_step(store, step, language, tree=None):
     """
     Serialize a step, localizing its content depending on the language.
 
     :param step: the step to be serialized.
     :param language: the language in which to localize data
+    :param tree: the QuestionnaireTree including the step, if already loaded
     :return: a serialization of the object
     """
+    if tree is None:
+        tree = QuestionnaireTree(store, [], step_ids=[step.id])
+
     ret_dict = {
         'id': step.id,
         'context_id': step.context_id,
         'presentation_order': step.presentation_order,
-        'children': [anon_serialize_field(store, f, language) for f in step.children]
+        'children': [anon_serialize_field(store, f, language, tree) for f in tree.step_children[step.id]]
     }
 
     return get_localized_values(ret_dict, step, step.localized_keys, language)
@@ -268,9 +409,11 @@ def anon_serialize_receiver(receiver, language):
 def get_public_context_list(store, language):
     context_list = []
 
+    tree = QuestionnaireTree(store)
+
     for context in store.find(models.Context):
         if context.receivers.count():
-            context_list.append(anon_serialize_context(store, context, language))
+            context_list.append(anon_serialize_context(store, context, language, tree))
 
     return context_list
 
@@ -299,13 +442,10 @@ class NodeInstance(BaseHandler):
         """
         Get the node infos.
         """
-        ret = yield GLApiCache.get('node', self.request.language,
-                                   anon_serialize_node, self.request.language)
-
-        ret['custom_homepage'] = os.path.isfile(os.path.join(GLSettings.static_path,
-                                                             "custom_homepage.html"))
+        ret = yield GLApiCache.get_response('node', self.request.language,
+                                            anon_serialize_node, self.request.language)
 
-        self.finish(ret)
+        self.finish_cached(ret)
 
 
 class AhmiaDescriptionHandler(BaseHandler):
@@ -320,10 +460,10 @@ class AhmiaDescriptionHandler(BaseHandler):
                                          anon_serialize_node, self.request.language)
 
         if node_info['ahmia']:
-            ret = yield GLApiCache.get('ahmia', self.request.language,
-                                       anon_serialize_ahmia, self.request.language)
+            ret = yield GLApiCache.get_response('ahmia', self.request.language,
+                                                anon_serialize_ahmia, self.request.language)
 
-            self.finish(ret)
+            self.finish_cached(ret)
         else:  # in case of disabled option we return 404
             self.set_status(404)
             self.finish()
@@ -337,9 +477,9 @@ class ContextsCollection(BaseHandler):
         """
         Get all the contexts.
         """
-        ret = yield GLApiCache.get('contexts', self.request.language,
-                                   get_public_context_list, self.request.language)
-        self.finish(ret)
+        ret = yield GLApiCache.get_response('contexts', self.request.language,
+                                            get_public_context_list, self.request.language)
+        self.finish_cached(ret)
 
 
 class ReceiversCollection(BaseHandler):
@@ -350,6 +490,6 @@ class ReceiversCollection(BaseHandler):
         """
         Get all the receivers.
         """
-        ret = yield GLApiCache.get('receivers', self.request.language,
-                                   get_public_receivers_list, self.request.language)
-        self.finish(ret)
+        ret = yield GLApiCache.get_response('receivers', self.request.language,
+                                            get_public_receivers_list, self.request.language)
+        self.finish_cached(ret)
@@ -6,7 +6,7 @@
 # Used by receivers to update personal preferences and access to personal data
 
 from twisted.internet.defer import inlineCallbacks
-from storm.expr import And, In
+from storm.expr import And, In, Asc, Desc, Count, SQL
 
 from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.user import db_user_update_user
@@ -15,12 +15,13 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_rtip
 from globaleaks.handlers.submission import db_get_archived_preview_schema
 from globaleaks.handlers.user import user_serialize_user
-from globaleaks.models import Receiver, ReceiverTip
+from globaleaks.models import Receiver, ReceiverTip, InternalTip, InternalFile, \
+    Comment, Message, Context
 from globaleaks.rest import requests, errors
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta, get_localized_values
-from globaleaks.utils.utility import log, datetime_to_ISO8601
+from globaleaks.utils.utility import log, datetime_to_ISO8601, ISO8601_to_datetime
 
 # https://www.youtube.com/watch?v=BMxaLEGCVdg
 def receiver_serialize_receiver(receiver, language):
@@ -72,36 +73,146 @@ def update_receiver_settings(store, receiver_id, request, language):
     return receiver_serialize_receiver(receiver, language)
 
 
-@transact_ro
-def get_receivertip_list(store, receiver_id, language):
-    rtiplist = store.find(ReceiverTip, ReceiverTip.receiver_id == receiver_id)
+# the keys by which the receiver tip list could be sorted; the order of
+# the contexts is given by their localized names (see db_context_order)
+receivertip_sort_keys = {
+    'creation_date': InternalTip.creation_date,
+    'update_date': InternalTip.update_date,
+    'expiration_date': InternalTip.expiration_date,
+    'progressive': InternalTip.progressive,
+    'context': None,
+    'label': ReceiverTip.label
+}
+
+
+def db_get_context_names(store, language, context_ids=None):
+    """
+    :return: the localized names of the contexts (of all if context_ids is None)
+    """
+    if context_ids is None:
+        contexts = store.find(Context)
+    else:
+        contexts = store.find(Context, In(Context.id, context_ids))
+
+    context_names = {}
+    for context in contexts:
+        mo = Rosetta(context.localized_keys)
+        mo.acquire_storm_object(context)
+        context_names[context.id] = mo.dump_localized_key('name', language)
+
+    return context_names
+
+
+def db_context_order(store, language):
+    """
+    :return: an expression ranking the contexts by their localized name; the
+             names are sorted here as they are not sortable by the database
+    """
+    context_names = db_get_context_names(store, language)
+    context_ids = sorted(context_names, key=lambda c: (context_names[c], c))
+
+    whens = ' '.join('WHEN ? THEN %d' % i for i in range(len(context_ids)))
+    return SQL('CASE internaltip.context_id %s ELSE %d END' % (whens, len(context_ids)), context_ids)
+
+
+def db_get_receivertip_page(store, receiver_id, language, limit=None, offset=0,
+                            sort='creation_date', order='desc', context_id=None, label=None,
+                            created_after=None, created_before=None, expiring_before=None):
+    """
+    Serialize a page of the tips of the receiver; the counters of the
+    files, comments and messages are fetched for the whole page with
+    grouped queries, and the contexts and the preview schemas are loaded
+    once per page.
+
+    :return: the number of the tips matching the filters and the page
+    """
+    conditions = [ReceiverTip.receiver_id == receiver_id,
+                  ReceiverTip.internaltip_id == InternalTip.id]
+
+    if context_id is not None:
+        conditions.append(InternalTip.context_id == context_id)
+
+    if label is not None:
+        conditions.append(ReceiverTip.label == label)
+
+    if created_after is not None:
+        conditions.append(InternalTip.creation_date >= created_after)
+
+    if created_before is not None:
+        conditions.append(InternalTip.creation_date < created_before)
+
+    if expiring_before is not None:
+        conditions.append(InternalTip.expiration_date < expiring_before)
+
+    total = store.find(ReceiverTip, *conditions).count()
+
+    if sort == 'context':
+        sort_key = db_context_order(store, language)
+    else:
+        sort_key = receivertip_sort_keys[sort]
+
+    sort_order = Asc if order == 'asc' else Desc
+    rtips = store.find((ReceiverTip, InternalTip), *conditions)
+    rtips = rtips.order_by(sort_order(sort_key), sort_order(ReceiverTip.id))
+
+    rtips = list(rtips[offset:offset + limit] if limit is not None else rtips[offset:])
+
+    if not rtips:
+        return total, []
+
+    rtip_ids = [rtip.id for rtip, _ in rtips]
+    itip_ids = [itip.id for _, itip in rtips]
+
+    file_counters = dict(store.find((InternalFile.internaltip_id, Count()),
+                                    In(InternalFile.internaltip_id, itip_ids)).group_by(InternalFile.internaltip_id))
+
+    comment_counters = dict(store.find((Comment.internaltip_id, Count()),
+                                       In(Comment.internaltip_id, itip_ids)).group_by(Comment.internaltip_id))
+
+    message_counters = dict(store.find((Message.receivertip_id, Count()),
+                                       In(Message.receivertip_id, rtip_ids)).group_by(Message.receivertip_id))
+
+    context_names = db_get_context_names(store, language, list(set(itip.context_id for _, itip in rtips)))
+
+    preview_schemas = {}
 
     rtip_summary_list = []
 
-    for rtip in rtiplist:
-        mo = Rosetta(rtip.internaltip.context.localized_keys)
-        mo.acquire_storm_object(rtip.internaltip.context)
+    for rtip, itip in rtips:
+        if itip.questionnaire_hash not in preview_schemas:
+            preview_schemas[itip.questionnaire_hash] = db_get_archived_preview_schema(store, itip.questionnaire_hash, language)
 
         rtip_summary_list.append({
             'id': rtip.id,
-            'creation_date': datetime_to_ISO8601(rtip.internaltip.creation_date),
+            'creation_date': datetime_to_ISO8601(itip.creation_date),
             'last_access': datetime_to_ISO8601(rtip.last_access),
-            'update_date': datetime_to_ISO8601(rtip.internaltip.update_date),
-            'expiration_date': datetime_to_ISO8601(rtip.internaltip.expiration_date),
-            'progressive': rtip.internaltip.progressive,
-            'context_name': mo.dump_localized_key('name', language),
+            'update_date': datetime_to_ISO8601(itip.update_date),
+            'expiration_date': datetime_to_ISO8601(itip.expiration_date),
+            'progressive': itip.progressive,
+            'context_id': itip.context_id,
+            'context_name': context_names.get(itip.context_id, ''),
             'access_counter': rtip.access_counter,
-            'file_counter': rtip.internaltip.internalfiles.count(),
-            'comment_counter': rtip.internaltip.comments.count(),
-            'message_counter': rtip.messages.count(),
-            'tor2web': rtip.internaltip.tor2web,
-            'questionnaire_hash': rtip.internaltip.questionnaire_hash,
-            'preview_schema': db_get_archived_preview_schema(store, rtip.internaltip.questionnaire_hash, language),
-            'preview': rtip.internaltip.preview,
+            'file_counter': file_counters.get(itip.id, 0),
+            'comment_counter': comment_counters.get(itip.id, 0),
+            'message_counter': message_counters.get(rtip.id, 0),
+            'tor2web': itip.tor2web,
+            'questionnaire_hash': itip.questionnaire_hash,
+            'preview_schema': preview_schemas[itip.questionnaire_hash],
+            'preview': itip.preview,
             'label': rtip.label
         })
 
-    return rtip_summary_list
+    return total, rtip_summary_list
+
+
+@transact_ro
+def get_receivertip_page(store, receiver_id, language, **kwargs):
+    return db_get_receivertip_page(store, receiver_id, language, **kwargs)
+
+
+@transact_ro
+def get_receivertip_list(store, receiver_id, language):
+    return db_get_receivertip_page(store, receiver_id, language)[1]
 
 
 @transact
@@ -182,18 +293,56 @@ class TipsCollection(BaseHandler):
     """
     This interface return the summary list of the Tips available for the authenticated Receiver
     GET /tips
+
+    The list is paginated with the arguments limit (receiver_tips_page_limit
+    by default) and offset, sorted with sort (one of receivertip_sort_keys)
+    and order (asc or desc) and filtered with context_id, label,
+    created_after, created_before and expiring_before (ISO8601 dates); the
+    number of the tips matching the filters is returned in the X-Total-Count
+    header.
     """
+    def get_tips_query(self):
+        query = {}
+
+        try:
+            query['limit'] = int(self.get_argument('limit', GLSettings.receiver_tips_page_limit))
+            if not 0 < query['limit'] <= GLSettings.receiver_tips_page_limit:
+                raise ValueError
+
+            query['offset'] = int(self.get_argument('offset', 0))
+            if query['offset'] < 0:
+                raise ValueError
+
+            for date_key in ['created_after', 'created_before', 'expiring_before']:
+                date = self.get_argument(date_key, None)
+                if date is not None:
+                    query[date_key] = ISO8601_to_datetime(date)
+        except ValueError:
+            raise errors.InvalidInputFormat("invalid tips pagination")
+
+        query['sort'] = self.get_argument('sort', 'creation_date')
+        query['order'] = self.get_argument('order', 'desc')
+        if query['sort'] not in receivertip_sort_keys or query['order'] not in ['asc', 'desc']:
+            raise errors.InvalidInputFormat("invalid tips sorting")
+
+        query['context_id'] = self.get_argument('context_id', None)
+        query['label'] = self.get_argument('label', None)
+
+        return query
+
     @transport_security_check('receiver')
     @authenticated('receiver')
     @inlineCallbacks
     def get(self):
         """
         Response: receiverTipList
-        Errors: InvalidAuthentication
+        Errors: InvalidAuthentication, InvalidInputFormat
         """
-        answer = yield get_receivertip_list(self.current_user.user_id,
-                                            self.request.language)
+        total, answer = yield get_receivertip_page(self.current_user.user_id,
+                                                   self.request.language,
+                                                   **self.get_tips_query())
 
+        self.set_header('X-Total-Count', str(total))
         self.set_status(200)
         self.finish(answer)
 
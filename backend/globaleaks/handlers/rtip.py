@@ -15,6 +15,7 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.authentication import transport_security_check, authenticated
 from globaleaks.handlers.custodian import serialize_identityaccessrequest
 from globaleaks.handlers.submission import serialize_usertip
+from globaleaks.jobs.wakeup import GLWorkBus
 from globaleaks.models import Notification, Comment, Message, \
     ReceiverFile, ReceiverTip, EventLogs,  InternalTip, ArchivedSchema, \
     SecureFileDelete, IdentityAccessRequest
@@ -429,6 +430,8 @@ class RTipCommentCollection(BaseHandler):
 
         answer = yield create_comment_receiver(self.current_user.user_id, tip_id, request)
 
+        GLWorkBus.signal('notification')
+
         self.set_status(201)  # Created
         self.finish(answer)
 
@@ -7,8 +7,10 @@
 #   by an HTTP client in /submission URI
 
 import copy
-
 import json
+import threading
+
+from collections import OrderedDict
 
 from storm.expr import And, In
 
@@ -19,9 +21,11 @@ from globaleaks.orm import transact
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.admin.context import db_get_context_steps
 from globaleaks.handlers.authentication import transport_security_check, unauthenticated, get_tor2web_header
+from globaleaks.jobs.wakeup import GLWorkBus
 from globaleaks.utils.token import TokenList
 from globaleaks.rest import errors, requests
-from globaleaks.security import hash_password, sha256, rstr
+from globaleaks.rest.apicache import GLApiCache
+from globaleaks.security import hash_password, run_kdf, sha256, rstr
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta, get_localized_values
 from globaleaks.utils.utility import log, utc_future_date, datetime_now, datetime_to_ISO8601
@@ -67,22 +71,69 @@ def _db_get_archived_field_recursively(field, language):
     return get_localized_values(field, field, models.Field.localized_keys, language)
 
 
+class ArchivedSchemaCache(object):
+    """
+    Localized archived schemas indexed by (hash, type, language); the
+    ArchivedSchema rows are immutable and addressed by the hash of their
+    content, so that the cached schemas never need to be invalidated.
+
+    The cached schemas are shared between the threads of the ORM and must
+    not be modified by the callers.
+    """
+    max_schemas = 256
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.schemas = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            schema = self.schemas.pop(key, None)
+            if schema is not None:
+                # most recently used schemas are kept at the end
+                self.schemas[key] = schema
+
+            return schema
+
+    def set(self, key, schema):
+        with self.lock:
+            self.schemas.pop(key, None)
+
+            while len(self.schemas) >= self.max_schemas:
+                self.schemas.popitem(last=False)
+
+            self.schemas[key] = schema
+
+    def invalidate(self):
+        with self.lock:
+            self.schemas.clear()
+
+
+GLArchivedSchemaCache = ArchivedSchemaCache()
+
+
 def _db_get_archived_questionnaire_schema(store, hash, type, language):
+    questionnaire = GLArchivedSchemaCache.get((hash, type, language))
+    if questionnaire is not None:
+        return questionnaire
+
     aqs = store.find(models.ArchivedSchema,
                      models.ArchivedSchema.hash == hash,
                      models.ArchivedSchema.type == type).one()
 
     if not aqs:
         log.err("Unable to find questionnaire schema with hash %s" % hash)
-        questionnaire = []
-    else:
-        questionnaire = copy.deepcopy(aqs.schema)
+        return []
+
+    questionnaire = copy.deepcopy(aqs.schema)
 
     for step in questionnaire:
         for field in step['children']:
             _db_get_archived_field_recursively(field, language)
         get_localized_values(step, step, models.Step.localized_keys, language)
 
+    GLArchivedSchemaCache.set((hash, type, language), questionnaire)
+
     return questionnaire
 
 
@@ -160,13 +211,33 @@ def db_save_questionnaire_answers(store, internaltip_id, entries):
     return ret
 
 
+def get_preview_fields(questionnaire):
+    return [f['id'] for s in questionnaire for f in s['children'] if f['preview']]
+
+
+def extract_fields_preview(preview_fields, answers):
+    return {f: copy.deepcopy(answers[f]) for f in preview_fields if f in answers}
+
+
 def extract_answers_preview(questionnaire, answers):
-    preview = {}
+    return extract_fields_preview(get_preview_fields(questionnaire), answers)
+
+
+def db_compile_questionnaire(store, context_id):
+    """
+    Compile the questionnaire of the context for the submissions: its
+    serialization, its hash and the ids of the fields of the preview.
 
-    preview.update({f['id']: copy.deepcopy(answers[f['id']])
-        for s in questionnaire for f in s['children'] if f['preview'] and f['id'] in answers})
+    The compiled questionnaire is kept in GLApiCache ('questionnaire') that
+    is invalidated by the admin handlers of contexts, steps and fields.
+    """
+    questionnaire = db_get_context_steps(store, context_id, None)
 
-    return preview
+    return {
+        'questionnaire': questionnaire,
+        'hash': unicode(sha256(json.dumps(questionnaire))),
+        'preview_fields': get_preview_fields(questionnaire)
+    }
 
 
 def db_archive_questionnaire_schema(store, questionnaire, questionnaire_hash):
@@ -268,16 +339,14 @@ def db_create_receivertip(store, receiver, internaltip):
 
     return receivertip.id
 
-def db_create_whistleblower_tip(store, internaltip):
+def db_create_whistleblower_tip(store, internaltip, receipt_hash):
     """
-    The plaintext receipt is returned only now, and then is
-    stored hashed in the WBtip table
+    The receipt is stored hashed in the WBtip table; the hash is computed
+    by the caller outside of the transaction (see generate_receipt)
     """
     wbtip = models.WhistleblowerTip()
 
-    receipt = unicode(rstr.xeger(GLSettings.receipt_regexp))
-
-    wbtip.receipt_hash = hash_password(receipt, GLSettings.memory_copy.receipt_salt)
+    wbtip.receipt_hash = receipt_hash
     wbtip.access_counter = 0
     wbtip.internaltip_id = internaltip.id
 
@@ -290,12 +359,24 @@ def db_create_whistleblower_tip(store, internaltip):
     if len(created_rtips):
         log.debug("The finalized submissions had created %d models.ReceiverTip(s)" % len(created_rtips))
 
-    return receipt, wbtip
+    return wbtip
 
 
 @transact
 def create_whistleblower_tip(*args):
-    return db_create_whistleblower_tip(*args)[0] # here is exported only the receipt
+    return db_create_whistleblower_tip(*args).id
+
+
+@defer.inlineCallbacks
+def generate_receipt():
+    """
+    returns a tuple (receipt, receipt_hash) with the hash computed on the KDF thread pool
+    """
+    receipt = unicode(rstr.xeger(GLSettings.receipt_regexp))
+
+    receipt_hash = yield run_kdf(hash_password, receipt, GLSettings.memory_copy.receipt_salt)
+
+    defer.returnValue((receipt, unicode(receipt_hash)))
 
 
 def import_receivers(store, submission, receiver_id_list):
@@ -324,7 +405,7 @@ def import_receivers(store, submission, receiver_id_list):
         raise errors.SubmissionValidationFailure("needed almost one receiver selected [2]")
 
 
-def db_create_submission(store, token_id, request, t2w, language):
+def db_create_submission(store, token_id, request, receipt_hash, t2w, language):
     # the .get method raise an exception if the token is invalid
     token = TokenList.get(token_id)
 
@@ -358,15 +439,15 @@ def db_create_submission(store, token_id, request, t2w, language):
         submission.identity_provided_date = datetime_now()
 
     try:
-        questionnaire = db_get_context_steps(store, context.id, None)
-        questionnaire_hash = unicode(sha256(json.dumps(questionnaire)))
+        compiled = GLApiCache.db_get(store, 'questionnaire', context.id,
+                                     db_compile_questionnaire, context.id)
 
-        submission.questionnaire_hash = questionnaire_hash
-        submission.preview = extract_answers_preview(questionnaire, answers)
+        submission.questionnaire_hash = compiled['hash']
+        submission.preview = extract_fields_preview(compiled['preview_fields'], answers)
 
         store.add(submission)
 
-        db_archive_questionnaire_schema(store, questionnaire, questionnaire_hash)
+        db_archive_questionnaire_schema(store, compiled['questionnaire'], compiled['hash'])
 
         db_save_questionnaire_answers(store, submission.id, answers)
     except Exception as excep:
@@ -395,18 +476,32 @@ def db_create_submission(store, token_id, request, t2w, language):
         log.err("Submission create: unable to create db entry for files: %s" % excep)
         raise excep
 
-    receipt, wbtip = db_create_whistleblower_tip(store, submission)
+    wbtip = db_create_whistleblower_tip(store, submission, receipt_hash)
 
-    submission_dict = serialize_usertip(store, wbtip, language)
+    return serialize_usertip(store, wbtip, language)
 
-    submission_dict.update({'receipt': receipt})
 
-    return submission_dict
+@transact
+def _create_submission(store, token_id, request, receipt_hash, t2w, language):
+    return db_create_submission(store, token_id, request, receipt_hash, t2w, language)
 
 
-@transact
-def create_submission(store, token_id, request, t2w, language):
-    return db_create_submission(store, token_id, request, t2w, language)
+@defer.inlineCallbacks
+def create_submission(token_id, request, t2w, language):
+    """
+    The plaintext receipt is returned only now; its hash is computed
+    before entering the submission transaction.
+    """
+    # the .get method raise an exception if the token is invalid
+    TokenList.get(token_id)
+
+    receipt, receipt_hash = yield generate_receipt()
+
+    submission_dict = yield _create_submission(token_id, request, receipt_hash, t2w, language)
+
+    submission_dict.update({'receipt': receipt})
+
+    defer.returnValue(submission_dict)
 
 
 class SubmissionInstance(BaseHandler):
@@ -429,5 +524,8 @@ class SubmissionInstance(BaseHandler):
         status = yield create_submission(token_id, request,
                                          get_tor2web_header(self.request.headers),
                                          self.request.language)
+
+        GLWorkBus.signal('delivery', 'notification')
+
         self.set_status(202)  # Updated, also if submission if effectively created (201)
         self.finish(status)
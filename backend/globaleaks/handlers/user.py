@@ -11,7 +11,7 @@ from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.authentication import authenticated
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.rest import requests, errors
-from globaleaks.security import change_password, GLBPGP
+from globaleaks.security import change_password, GLBPGP, GLBPGPCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import get_localized_values
 from globaleaks.utils.utility import log, datetime_to_ISO8601, datetime_now
@@ -31,6 +31,10 @@ def parse_pgp_options(user, request):
     # the default
     user.pgp_key_status = u'disabled'
 
+    if (remove_key or new_pgp_key) and user.pgp_key_fingerprint:
+        # the keyring loaded for the previous key is no more needed
+        GLBPGPCache.invalidate(user.pgp_key_fingerprint)
+
     if remove_key:
         # In all the cases below, the key is marked disabled as request
         user.pgp_key_status = u'disabled'
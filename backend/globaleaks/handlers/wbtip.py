@@ -16,6 +16,7 @@ from globaleaks.handlers.rtip import db_get_itip_receivers_list, \
     serialize_comment, serialize_message
 from globaleaks.handlers.submission import serialize_usertip, \
     db_save_questionnaire_answers, db_get_archived_questionnaire_schema
+from globaleaks.jobs.wakeup import GLWorkBus
 from globaleaks.models import WhistleblowerTip, Comment, Message, ReceiverTip
 from globaleaks.rest import errors, requests
 from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
@@ -212,6 +213,8 @@ class WBTipCommentCollection(BaseHandler):
         request = self.validate_message(self.request.body, requests.CommentDesc)
         answer = yield create_comment_wb(self.current_user.user_id, request)
 
+        GLWorkBus.signal('notification')
+
         self.set_status(201)  # Created
         self.finish(answer)
 
@@ -261,6 +264,8 @@ class WBTipMessageCollection(BaseHandler):
 
         message = yield create_message_wb(self.current_user.user_id, receiver_id, request)
 
+        GLWorkBus.signal('notification')
+
         self.set_status(201)  # Created
         self.finish(message)
 
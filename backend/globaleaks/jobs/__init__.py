@@ -4,5 +4,6 @@ __all__ = [ 'base',
             'statistics_sched',
             'cleaning_sched',
             'session_management_sched',
-            'pgp_check_sched'
+            'pgp_check_sched',
+            'wakeup'
           ]
@@ -59,9 +59,34 @@ class GLJob(task.LoopingCall):
 
     monitor = None
 
+    executing = False
+    wakeup_requested = False
+
     def __init__(self):
         task.LoopingCall.__init__(self, self._operation)
 
+    def wakeup(self):
+        """
+        Anticipate the next execution of the job; if the job is currently
+        being executed it will be executed again as soon as it completes.
+
+        The anticipated execution is scheduled apart from the looping call
+        so that the periodic executions keep their interval.
+        """
+        if not self.running or self.wakeup_requested:
+            return
+
+        self.wakeup_requested = True
+
+        if not self.executing:
+            self.clock.callLater(0, self._wakeup)
+
+    def _wakeup(self):
+        if not self.running:
+            self.wakeup_requested = False
+        elif self.wakeup_requested and not self.executing:
+            return self._operation()
+
     def stats_collection_start(self):
         self.monitor = JobMonitor(self)
 
@@ -98,6 +123,14 @@ class GLJob(task.LoopingCall):
 
     @defer.inlineCallbacks
     def _operation(self):
+        if self.executing:
+            # a periodic execution overlapping an anticipated one
+            self.wakeup_requested = True
+            return
+
+        self.executing = True
+        self.wakeup_requested = False
+
         try:
             self.stats_collection_start()
 
@@ -119,6 +152,11 @@ class GLJob(task.LoopingCall):
                 mail_exception_handler(exc_type, exc_value, exc_tb)
             except Exception:
                 pass
+        finally:
+            self.executing = False
+
+        if self.wakeup_requested:
+            self.clock.callLater(0, self._wakeup)
 
     def operation(self):
         pass # dummy skel for GLJob objects
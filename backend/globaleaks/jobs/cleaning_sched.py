@@ -10,10 +10,10 @@ from datetime import timedelta
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.orm import transact, transact_ro
-from globaleaks.handlers import admin
-from globaleaks.handlers.rtip import db_delete_itip, serialize_rtip
+from globaleaks.handlers.rtip import db_delete_itip
 from globaleaks.jobs.base import GLJob
-from globaleaks.jobs.notification_sched import EventLogger, db_save_events_on_db
+from globaleaks.jobs.notification_sched import EventLogger, db_save_events_on_db, \
+    serialize_event_tip, serialize_event_context
 from globaleaks.models import InternalTip, Receiver, ReceiverTip, Stats, EventLogs
 from globaleaks.notification import Event
 from globaleaks.settings import GLSettings
@@ -44,11 +44,9 @@ class ExpiringRTipEvent(EventLogger):
     def process_event(self, store, rtip):
         do_mail, receiver_desc = self.import_receiver(rtip.receiver)
 
-        context_desc = admin.admin_serialize_context(store,
-                                                     rtip.internaltip.context,
-                                                     self.language)
+        context_desc = serialize_event_context(rtip.internaltip.context, self.language)
 
-        expiring_tip_desc = serialize_rtip(store, rtip, self.language)
+        expiring_tip_desc = serialize_event_tip(rtip)
 
         self.events.append(Event(type=self.template_type,
                                  trigger=self.trigger,
@@ -11,15 +11,17 @@
 # kind of file has been submitted.
 
 import os
-from twisted.internet.defer import inlineCallbacks
+from storm.expr import In
+from twisted.internet.defer import inlineCallbacks, DeferredList
 
 from globaleaks.orm import transact
 from globaleaks.jobs.base import GLJob
-from globaleaks.models import InternalFile, ReceiverFile, ReceiverTip
+from globaleaks.jobs.wakeup import GLWorkBus
+from globaleaks.models import InternalFile, Receiver, ReceiverFile, ReceiverTip
 from globaleaks.settings import GLSettings
 from globaleaks.utils.mailutils import send_exception_email
 from globaleaks.utils.utility import log
-from globaleaks.security import GLBPGP, GLSecureFile
+from globaleaks.security import GLBPGPCache, GLSecureFile, run_pgp
 from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 
 
@@ -28,6 +30,9 @@ __all__ = ['DeliverySchedule']
 
 INTERNALFILES_HANDLE_RETRY_MAX = 3
 
+# size of the buffer used to decrypt the AES files
+DECRYPT_BUFFER_SIZE = 1024 * 1024
+
 
 @transact
 def receiverfile_planning(store):
@@ -35,20 +40,25 @@ def receiverfile_planning(store):
     This function roll over the InternalFile uploaded, extract a path, id and
     receivers associated, one entry for each combination. representing the
     ReceiverFile that need to be created.
+
+    The pending files, their receivertips and their receivers are loaded
+    with a fixed number of queries and each receiver is serialized once.
     """
     receiverfiles_maps = {}
 
-    ifilescnt = store.find(InternalFile, InternalFile.new == True).count()
-    ifiles = store.find(InternalFile, InternalFile.new == True)[:GLSettings.jobs_operation_limit]
+    # one more file is fetched only to know if the queue is longer than the limit
+    ifiles = list(store.find(InternalFile, InternalFile.new == True)[:GLSettings.jobs_operation_limit + 1])
 
-    if ifilescnt > GLSettings.jobs_operation_limit:
-        log.debug("Delivery iterating over %d InternalFile from a queue of %d" % (
-            GLSettings.jobs_operation_limit, ifilescnt))
-    elif ifilescnt:
-        log.debug("Delivery iterating over %d InternalFile" % ifilescnt)
+    if len(ifiles) > GLSettings.jobs_operation_limit:
+        ifiles = ifiles[:GLSettings.jobs_operation_limit]
+        log.debug("Delivery iterating over %d InternalFile from a longer queue" %
+                  GLSettings.jobs_operation_limit)
+    elif ifiles:
+        log.debug("Delivery iterating over %d InternalFile" % len(ifiles))
     else:
-        pass # 0 files to be processed
+        return receiverfiles_maps # 0 files to be processed
 
+    pending_ifiles = []
     for ifile in ifiles:
         if ifile.processing_attempts >= INTERNALFILES_HANDLE_RETRY_MAX:
             ifile.new = False
@@ -62,43 +72,56 @@ def receiverfile_planning(store):
             log.err("Failed to handle receiverfiles creation for ifile %s (retry %d/%d)" %
                     (ifile.id, ifile.processing_attempts, INTERNALFILES_HANDLE_RETRY_MAX))
 
-        
         if ifile.processing_attempts:
             log.debug("Starting handling receiverfiles creation for ifile %s retry %d/%d" %
                   (ifile.id, ifile.processing_attempts, INTERNALFILES_HANDLE_RETRY_MAX))
 
         ifile.processing_attempts = ifile.processing_attempts + 1
 
-        for receiver in ifile.internaltip.receivers:
-            rtrf = store.find(ReceiverTip, ReceiverTip.internaltip_id == ifile.internaltip_id,
-                              ReceiverTip.receiver_id == receiver.id).one()
-
+        pending_ifiles.append(ifile)
+
+    if not pending_ifiles:
+        return receiverfiles_maps
+
+    # the receivertips of all the tips involved, joined with their receivers
+    rtips_by_itip = {}
+    receivers_desc = {}
+    for rtip, receiver in store.find((ReceiverTip, Receiver),
+                                     ReceiverTip.receiver_id == Receiver.id,
+                                     In(ReceiverTip.internaltip_id,
+                                        list(set(ifile.internaltip_id for ifile in pending_ifiles)))):
+        rtips_by_itip.setdefault(rtip.internaltip_id, []).append(rtip)
+
+        if receiver.id not in receivers_desc:
+            receivers_desc[receiver.id] = admin_serialize_receiver(receiver, GLSettings.memory_copy.default_language)
+
+    for ifile in pending_ifiles:
+        receiverfiles_maps[ifile.id] = {
+          'plaintext_file_needed': False,
+          'ifile_id': ifile.id,
+          'ifile_path': ifile.file_path,
+          'ifile_size': ifile.size,
+          'rfiles': []
+        }
+
+        for rtip in rtips_by_itip.get(ifile.internaltip_id, []):
             receiverfile = ReceiverFile()
-            receiverfile.receiver_id = receiver.id
+            receiverfile.receiver_id = rtip.receiver_id
             receiverfile.internaltip_id = ifile.internaltip_id
             receiverfile.internalfile_id = ifile.id
-            receiverfile.receivertip_id = rtrf.id
+            receiverfile.receivertip_id = rtip.id
             receiverfile.file_path = ifile.file_path
             receiverfile.size = ifile.size
             receiverfile.status = u'processing'
 
             store.add(receiverfile)
 
-            if ifile.id not in receiverfiles_maps:
-                receiverfiles_maps[ifile.id] = {
-                  'plaintext_file_needed': False,
-                  'ifile_id': ifile.id,
-                  'ifile_path': ifile.file_path,
-                  'ifile_size': ifile.size,
-                  'rfiles': []
-                }
-
             receiverfiles_maps[ifile.id]['rfiles'].append({
                 'id': receiverfile.id,
                 'status': u'processing',
                 'path': ifile.file_path,
                 'size': ifile.size,
-                'receiver': admin_serialize_receiver(receiver, GLSettings.memory_copy.default_language)
+                'receiver': receivers_desc[rtip.receiver_id]
             })
 
     return receiverfiles_maps
@@ -116,100 +139,144 @@ def fsops_pgp_encrypt(fpath, recipient_pgp):
 
     required keys are checked on top
     """
-    gpoj = GLBPGP()
+    filepath = os.path.join(GLSettings.submission_path, fpath)
 
-    try:
-        gpoj.load_key(recipient_pgp['pgp_key_public'])
+    with GLBPGPCache.get(recipient_pgp['pgp_key_public'],
+                         recipient_pgp['pgp_key_fingerprint']) as gpoj, \
+         GLSecureFile(filepath) as f:
+        encrypted_file_path, encrypted_file_size = \
+            gpoj.encrypt_file(recipient_pgp['pgp_key_fingerprint'], filepath, f, GLSettings.submission_path)
 
-        filepath = os.path.join(GLSettings.submission_path, fpath)
+    return encrypted_file_path, encrypted_file_size
 
-        with GLSecureFile(filepath) as f:
-            encrypted_file_path, encrypted_file_size = \
-                gpoj.encrypt_file(recipient_pgp['pgp_key_fingerprint'], filepath, f, GLSettings.submission_path)
-    except:
-        raise
 
-    finally:
-        # the finally statement is always called also if
-        # except contains a return or a raise
-        gpoj.destroy_environment()
+def process_receiverfile(rcounter, rfileinfo):
+    """
+    Work item of the delivery pipeline: encrypts the file for a single receiver
 
-    return encrypted_file_path, encrypted_file_size
+    @param rcounter: the index of the receiver file (used for logging)
+    @param rfileinfo: the receiver file description updated with the result
+    """
+    try:
+        new_path, new_size = fsops_pgp_encrypt(rfileinfo['path'], rfileinfo['receiver'])
 
+        log.debug("%d# Switch on Receiver File for %s path %s => %s size %d => %d" %
+                  (rcounter,  rfileinfo['receiver']['name'], rfileinfo['path'],
+                   new_path, rfileinfo['size'], new_size))
 
-def process_files(receiverfiles_maps):
+        rfileinfo['path'] = new_path
+        rfileinfo['size'] = new_size
+        rfileinfo['status'] = u'encrypted'
+    except Exception as excep:
+        log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
+                rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
+        )
+        rfileinfo['status'] = u'unavailable'
+
+
+def process_plaintext_file(receiverfiles_map, plain_path):
     """
-    @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
-    @return: return None
+    Work item of the delivery pipeline: decrypts the AES file in the plaintext
+    version referenced by the receivers that do not have a PGP key
+
+    @param receiverfiles_map: the mapping of the ifile/rfiles being delivered
+    @param plain_path: the path of the plaintext file to be created
     """
-    for ifile_id, receiverfiles_map in receiverfiles_maps.iteritems():
-        ifile_path = receiverfiles_map['ifile_path']
-        ifile_name = os.path.basename(ifile_path).split('.')[0]
-        plain_path = os.path.join(GLSettings.submission_path, "%s.plain" % ifile_name)
-
-        receiverfiles_map['plaintext_file_needed'] = False
-        for rcounter, rfileinfo in enumerate(receiverfiles_map['rfiles']):
-            if rfileinfo['receiver']['pgp_key_status'] == u'enabled':
-                try:
-                    new_path, new_size = fsops_pgp_encrypt(rfileinfo['path'], rfileinfo['receiver'])
-
-                    log.debug("%d# Switch on Receiver File for %s path %s => %s size %d => %d" %
-                              (rcounter,  rfileinfo['receiver']['name'], rfileinfo['path'],
-                               new_path, rfileinfo['size'], new_size))
-
-                    rfileinfo['path'] = new_path
-                    rfileinfo['size'] = new_size
-                    rfileinfo['status'] = u'encrypted'
-                except Exception as excep:
-                    log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
-                            rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
-                    )
-                    rfileinfo['status'] = u'unavailable'
-            elif GLSettings.memory_copy.allow_unencrypted:
-                receiverfiles_map['plaintext_file_needed'] = True
-                rfileinfo['status'] = u'reference'
-                rfileinfo['path'] = plain_path
-            else:
-                rfileinfo['status'] = u'nokey'
-
-        if receiverfiles_map['plaintext_file_needed']:
-            log.debug(":( NOT all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s" %
-                      (ifile_path, plain_path))
+    ifile_path = receiverfiles_map['ifile_path']
 
-            try:
-                with open(plain_path, "wb") as plaintext_f, GLSecureFile(ifile_path) as encrypted_file:
-                    chunk_size = 4096
-                    written_size = 0
-                    while True:
-                        chunk = encrypted_file.read(chunk_size)
-                        if len(chunk) == 0:
-                            if written_size != receiverfiles_map['ifile_size']:
-                                log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
-                                        (ifile_id, receiverfiles_map['ifile_path'], receiverfiles_map['ifile_size']))
-                            break
-                        written_size += len(chunk)
-                        plaintext_f.write(chunk)
-
-                receiverfiles_map['ifile_path'] = plain_path
-            except Exception as excep:
-                log.err("Unable to create plaintext file %s: %s" % (plain_path, excep))
+    log.debug(":( NOT all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s" %
+              (ifile_path, plain_path))
+
+    try:
+        with open(plain_path, "wb") as plaintext_f, GLSecureFile(ifile_path) as encrypted_file:
+            buf = bytearray(DECRYPT_BUFFER_SIZE)
+            view = memoryview(buf)
+            written_size = 0
+            while True:
+                n = encrypted_file.readinto(buf)
+                if n == 0:
+                    if written_size != receiverfiles_map['ifile_size']:
+                        log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
+                                (receiverfiles_map['ifile_id'], receiverfiles_map['ifile_size'], written_size))
+                    break
+                written_size += n
+                plaintext_f.write(view[:n])
+
+        receiverfiles_map['ifile_path'] = plain_path
+    except Exception as excep:
+        log.err("Unable to create plaintext file %s: %s" % (plain_path, excep))
+
+
+@inlineCallbacks
+def process_internalfile(receiverfiles_map):
+    """
+    Deliver a single internal file: the work items for each receiver (and the
+    one for the plaintext version, when needed) are executed concurrently in
+    the PGP thread pool and the result is committed as soon as they complete.
+
+    @param receiverfiles_map: the mapping of the ifile/rfiles to be created on filesystem
+    """
+    ifile_path = receiverfiles_map['ifile_path']
+    ifile_name = os.path.basename(ifile_path).split('.')[0]
+    plain_path = os.path.join(GLSettings.submission_path, "%s.plain" % ifile_name)
+
+    work_items = []
+
+    receiverfiles_map['plaintext_file_needed'] = False
+    for rcounter, rfileinfo in enumerate(receiverfiles_map['rfiles']):
+        if rfileinfo['receiver']['pgp_key_status'] == u'enabled':
+            work_items.append(run_pgp(process_receiverfile, rcounter, rfileinfo))
+        elif GLSettings.memory_copy.allow_unencrypted:
+            receiverfiles_map['plaintext_file_needed'] = True
+            rfileinfo['status'] = u'reference'
+            rfileinfo['path'] = plain_path
         else:
-            log.debug("All Receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+            rfileinfo['status'] = u'nokey'
 
-        # the original AES file should always be deleted
-        log.debug("Deleting the submission AES encrypted file: %s" % ifile_path)
+    if receiverfiles_map['plaintext_file_needed']:
+        work_items.append(run_pgp(process_plaintext_file, receiverfiles_map, plain_path))
+    else:
+        log.debug("All Receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
 
-        # Remove the AES file
-        try:
-            os.remove(ifile_path)
-        except OSError as ose:
-            log.err("Unable to remove %s: %s" % (ifile_path, ose.message))
+    # work items handle their errors by marking the files as unavailable
+    yield DeferredList(work_items)
 
-        # Remove the AES file key
-        try:
-            os.remove(os.path.join(GLSettings.ramdisk_path, ("%s%s" % (GLSettings.AES_keyfile_prefix, ifile_name))))
-        except OSError as ose:
-            log.err("Unable to remove keyfile associated with %s: %s" % (ifile_path, ose.message))
+    # the original AES file should always be deleted
+    log.debug("Deleting the submission AES encrypted file: %s" % ifile_path)
+
+    # Remove the AES file
+    try:
+        os.remove(ifile_path)
+    except OSError as ose:
+        log.err("Unable to remove %s: %s" % (ifile_path, ose.message))
+
+    # Remove the AES file key
+    try:
+        os.remove(os.path.join(GLSettings.ramdisk_path, ("%s%s" % (GLSettings.AES_keyfile_prefix, ifile_name))))
+    except OSError as ose:
+        log.err("Unable to remove keyfile associated with %s: %s" % (ifile_path, ose.message))
+
+    yield update_internalfile_and_store_receiverfiles({receiverfiles_map['ifile_id']: receiverfiles_map})
+
+    # the new receiver files are to be notified
+    GLWorkBus.signal('notification')
+
+
+def process_files(receiverfiles_maps):
+    """
+    @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
+    @return: a deferred fired when all the files have been delivered
+    """
+    def process_internalfile_failed(failure, ifile_id):
+        log.err("Unable to complete the delivery of ifile %s: %s" % (ifile_id, failure.getErrorMessage()))
+
+    dl = []
+    for ifile_id, receiverfiles_map in receiverfiles_maps.iteritems():
+        d = process_internalfile(receiverfiles_map)
+        d.addErrback(process_internalfile_failed, ifile_id)
+        dl.append(d)
+
+    return DeferredList(dl)
 
 
 @transact
@@ -259,5 +326,4 @@ class DeliverySchedule(GLJob):
         receiverfiles_maps = yield receiverfile_planning()
 
         if len(receiverfiles_maps):
-            process_files(receiverfiles_maps)
-            yield update_internalfile_and_store_receiverfiles(receiverfiles_maps)
+            yield process_files(receiverfiles_maps)
@@ -3,22 +3,27 @@
 #   mailflush_sched
 #   ***************
 #
-# Flush the email that has to be sent, is based on EventLog
-# database table.
+# Flush the email that has to be sent: the notification of the events of the
+# EventLog database table are stored in the Mail outbox that is then
+# delivered with retries.
 
 from cyclone.util import ObjectDict as OD
-from storm.expr import Asc
-from twisted.internet.defer import inlineCallbacks, returnValue
+from datetime import timedelta
+
+from storm.expr import Asc, In, Not
+from twisted.internet.defer import inlineCallbacks, returnValue, DeferredList, maybeDeferred
 
 from globaleaks.orm import transact, transact_ro
-from globaleaks.models import EventLogs, Notification
+from globaleaks.models import EventLogs, Mail
 from globaleaks.handlers.admin.node import db_admin_serialize_node
-from globaleaks.handlers.admin.notification import admin_serialize_notification
+from globaleaks.handlers.admin.notification import db_get_notification
+from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 from globaleaks.jobs.base import GLJob
+from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
-from globaleaks.notification import MailNotification, update_event_notification_status
-from globaleaks.utils.mailutils import sendmail
-from globaleaks.utils.utility import deferred_sleep, log
+from globaleaks.notification import MailNotification, update_event_notification_status, get_event_ids
+from globaleaks.utils.mailutils import sendmail, schedule_email
+from globaleaks.utils.utility import datetime_now, log
 from globaleaks.utils.templating import Templating
 
 reactor_override = None
@@ -30,13 +35,43 @@ def load_complete_events(store, events_limit=GLSettings.notification_limit):
     This function do not serialize, but make an OD() of the description.
     events_limit represent the amount of event that can be returned by the function,
     events to be notified are taken in account later.
+
+    The node and notification descriptors are serialized once per language
+    and kept in GLApiCache ('mail_node' and 'mail_notification'), while the
+    receivers referenced by the events are serialized once per call.
+
+    The events of the receivers whose digest window is still open are held
+    and do not take the slots of the others; the events are loaded from the
+    oldest one.
+
+    :return: the events and the seconds to wait for the closing of the
+             digest window of the held receivers (or None)
     """
-    node_desc = db_admin_serialize_node(store, GLSettings.memory_copy.default_language)
+    node_desc = GLApiCache.db_get(store, 'mail_node', GLSettings.memory_copy.default_language,
+                                  db_admin_serialize_node, GLSettings.memory_copy.default_language)
 
     event_list = []
+    receivers_desc = {}
+
+    now = datetime_now()
+    window = timedelta(seconds=GLSettings.notification_digest_window)
+
+    # the receivers having an event older than the digest window are ready
+    ready_receivers = list(store.find(EventLogs.receiver_id,
+                                      EventLogs.mail_sent == False,
+                                      EventLogs.creation_date <= now - window).config(distinct=True))
+
+    delay = None
+    oldest_held = store.find(EventLogs,
+                             EventLogs.mail_sent == False,
+                             Not(In(EventLogs.receiver_id, ready_receivers))).min(EventLogs.creation_date)
+    if oldest_held is not None:
+        delay = max(0, (oldest_held + window - now).total_seconds())
 
     totaleventinqueue = store.find(EventLogs, EventLogs.mail_sent == False).count()
-    storedevnts = store.find(EventLogs, EventLogs.mail_sent == False)[:events_limit * 3]
+    storedevnts = store.find(EventLogs,
+                             EventLogs.mail_sent == False,
+                             In(EventLogs.receiver_id, ready_receivers)).order_by(Asc(EventLogs.creation_date))[:events_limit * 3]
 
     debug_event_counter = {}
     for i, stev in enumerate(storedevnts):
@@ -47,20 +82,26 @@ def load_complete_events(store, events_limit=GLSettings.notification_limit):
         debug_event_counter.setdefault(stev.event_reference['kind'], 0)
         debug_event_counter[stev.event_reference['kind']] += 1
 
-        if not stev.description['receiver_info']['tip_notification']:
+        if stev.receiver_id not in receivers_desc:
+            receivers_desc[stev.receiver_id] = admin_serialize_receiver(stev.receiver,
+                                                                        stev.receiver.user.language)
+
+        receiver_desc = receivers_desc[stev.receiver_id]
+
+        if not receiver_desc['tip_notification']:
             continue
 
         eventcomplete = OD()
 
-        # node level information are not stored in the node, but fetch now
-        eventcomplete.notification_settings = admin_serialize_notification(
-            store.find(Notification).one(), stev.description['receiver_info']['language']
-        )
+        # node and receiver level information are not stored in the event, but fetch now
+        language = receiver_desc['language']
+        eventcomplete.notification_settings = GLApiCache.db_get(store, 'mail_notification', language,
+                                                                db_get_notification, language)
 
         eventcomplete.node_info = node_desc
 
         # event level information are decoded form DB in the old 'Event'|nametuple format:
-        eventcomplete.receiver_info = stev.description['receiver_info']
+        eventcomplete.receiver_info = receiver_desc
         eventcomplete.tip_info = stev.description['tip_info']
         eventcomplete.subevent_info = stev.description['subevent_info']
         eventcomplete.context_info = stev.description['context_info']
@@ -69,6 +110,7 @@ def load_complete_events(store, events_limit=GLSettings.notification_limit):
         eventcomplete.trigger = stev.event_reference['kind'] # 'blah' ...
 
         eventcomplete.orm_id = stev.id
+        eventcomplete.creation_date = stev.creation_date
 
         event_list.append(eventcomplete)
 
@@ -80,16 +122,117 @@ def load_complete_events(store, events_limit=GLSettings.notification_limit):
             log.debug("load_complete_events: %s from %d Events, with a protection limit of %d" %
                       (debug_event_counter, totaleventinqueue, events_limit * 3 ))
 
-    return event_list
+    return event_list, delay
+
+
+@transact_ro
+def load_outbox(store, mails_limit=GLSettings.notification_limit):
+    """
+    Load the mails of the outbox whose delivery attempt is due
+    """
+    mails = store.find(Mail, Mail.next_attempt <= datetime_now()).order_by(Asc(Mail.next_attempt))[:mails_limit]
+
+    return [{
+        'id': mail.id,
+        'address': mail.address,
+        'subject': mail.subject,
+        'body': mail.body
+    } for mail in mails]
+
+
+@transact
+def update_outbox(store, sent_ids, failed_ids):
+    """
+    Remove from the outbox the mails sent and reschedule the failed ones
+    with an exponential backoff.
+
+    @return: the seconds to wait for the next mail of the outbox, or None
+    """
+    if len(sent_ids):
+        store.find(Mail, In(Mail.id, sent_ids)).remove()
+
+    if len(failed_ids):
+        for mail in store.find(Mail, In(Mail.id, failed_ids)):
+            mail.processing_attempts += 1
+
+            if mail.processing_attempts >= GLSettings.mail_retry_attempts_limit:
+                log.err("Mail to %s reached limit of #%d attempts without success" %
+                        (mail.address, mail.processing_attempts))
+                store.remove(mail)
+                continue
+
+            delay = min(GLSettings.mail_retry_delay * 2 ** (mail.processing_attempts - 1),
+                        GLSettings.mail_retry_delay_max)
+
+            log.debug("Mail to %s failed (attempt #%d); next attempt in %d seconds" %
+                      (mail.address, mail.processing_attempts, delay))
+
+            mail.next_attempt = datetime_now() + timedelta(seconds=delay)
+
+    mail = store.find(Mail).order_by(Asc(Mail.next_attempt)).first()
+    if mail is not None:
+        return max(0, (mail.next_attempt - datetime_now()).total_seconds())
+
+
+def aggregate_notification_events(notifque):
+    """
+    :param notifque: the current notification event queue
+    :return: the queue with the events of each receiver aggregated in a
+             digest, and the seconds to wait for the closing of the next
+             digest window (or None)
+
+    The events of a receiver are held until the oldest of them is older
+    than GLSettings.notification_digest_window; the events that are then
+    pending for the receiver are notified with a single digest mail.
+    """
+    now = datetime_now()
+    window = timedelta(seconds=GLSettings.notification_digest_window)
+
+    events_by_receiver = {}
+    for ne in notifque:
+        events_by_receiver.setdefault(ne['receiver_info']['id'], []).append(ne)
+
+    aggregated_list = []
+    delay = None
+    for receiver_id, events in events_by_receiver.iteritems():
+        window_end = min(ne['creation_date'] for ne in events) + window
+        if window_end > now:
+            receiver_delay = (window_end - now).total_seconds()
+            delay = receiver_delay if delay is None else min(delay, receiver_delay)
+            continue
+
+        if len(events) == 1:
+            aggregated_list.append(events[0])
+            continue
+
+        log.debug("Aggregating %d events in a digest for receiver %s" % (len(events), receiver_id))
+
+        digest = OD()
+        digest.type = u'digest'
+        digest.notification_settings = events[0].notification_settings
+        digest.node_info = events[0].node_info
+        digest.context_info = {}
+        digest.receiver_info = events[0].receiver_info
+        digest.tip_info = None
+        digest.subevent_info = {'events': events}
+        digest.orm_id = 0
+
+        aggregated_list.append(digest)
+
+    return aggregated_list, delay
 
 
 def filter_notification_event(notifque):
     """
     :param notifque: the current notification event queue
-    :return: a modified queue in the case some email has not to be sent
+    :return: a modified queue in the case some email has not to be sent,
+             the ids of the events to be suppressed and the seconds to wait
+             for the closing of the next digest window
     Basically performs two filtering; they are defined in:
      1) issue #444
      2) issue #798
+    Between the two, the events are aggregated per receiver by
+    aggregate_notification_events so that the threshold applies to the mails
     """
 
     # Here we collect the Storm event of Files having as key the Tip
@@ -132,6 +275,8 @@ def filter_notification_event(notifque):
             log.debug("Filtering function: Marked %d Files notification to be suppressed cause part of a submission" %
                       len(orm_id_to_be_skipped))
 
+    _tmp_list, delay = aggregate_notification_events(_tmp_list)
+
     for ne in _tmp_list:
         receiver_id = ne['receiver_info']['id']
 
@@ -140,7 +285,7 @@ def filter_notification_event(notifque):
         if sent_emails >= GLSettings.memory_copy.notification_threshold_per_hour:
             log.debug("Discarding email for receiver %s due to threshold already exceeded for the current hour" %
                       receiver_id)
-            orm_id_to_be_skipped.append(ne['orm_id'])
+            orm_id_to_be_skipped.extend(get_event_ids(ne))
             continue
 
         GLSettings.increment_mail_counter(receiver_id)
@@ -165,7 +310,7 @@ def filter_notification_event(notifque):
 
             return_filtered_list.append(anomalyevent)
 
-            orm_id_to_be_skipped.append(ne['orm_id'])
+            orm_id_to_be_skipped.extend(get_event_ids(ne))
             continue
 
         return_filtered_list.append(ne)
@@ -173,18 +318,33 @@ def filter_notification_event(notifque):
     log.debug("Mails filtering completed passing from #%d to #%d events" %
               (len(notifque), len(return_filtered_list)))
 
-    # return the new list of event and the list of Storm.id
-    return return_filtered_list, orm_id_to_be_skipped
+    # return the new list of event, the list of Storm.id and the digest delay
+    return return_filtered_list, orm_id_to_be_skipped, delay
 
 
 class MailflushSchedule(GLJob):
     name = "Mailflush"
 
-    # sorry for the double negation, we are sleeping two seconds below.
-    skip_sleep = False
-
     mail_notification = MailNotification()
 
+    retry_call = None
+
+    def schedule_wakeup(self, delay):
+        """
+        Wake up the job within delay seconds if that anticipates its next
+        execution; the earliest of the requested wakeups is kept.
+        """
+        if delay is None or delay >= GLSettings.mailflush_delta:
+            return
+
+        if self.retry_call is not None and self.retry_call.active():
+            if self.retry_call.getTime() <= self.clock.seconds() + delay:
+                return
+
+            self.retry_call.cancel()
+
+        self.retry_call = self.clock.callLater(delay, self.wakeup)
+
     def ping_mail_flush(self, notification_settings, receivers_synthesis):
         for _, data in receivers_synthesis.iteritems():
             receiver_dict, winks = data
@@ -200,31 +360,35 @@ class MailflushSchedule(GLJob):
             fakeevent.tip_info = None
             fakeevent.subevent_info = {'counter': winks}
 
-            subject = Templating().format_template(notification_settings['ping_mail_template'], fakeevent)
-            body = Templating().format_template(notification_settings['ping_mail_title'], fakeevent)
+            subject, body = Templating().format_templates([notification_settings['ping_mail_template'],
+                                                           notification_settings['ping_mail_title']],
+                                                          fakeevent)
 
-            return sendmail(receiver_email, subject, body)
+            return schedule_email(receiver_email, subject, body)
 
     @inlineCallbacks
-    def operation(self):
-        queue_events = yield load_complete_events()
+    def process_events(self):
+        queue_events, held_delay = yield load_complete_events()
+
+        # the job is woken up at the closing of the digest window of the held receivers
+        self.schedule_wakeup(held_delay)
 
         if not len(queue_events):
             returnValue(None)
 
         # remove from this list the event that has not to be sent, for example,
         # the Files uploaded during the first submission, like issue #444 (zombie edition)
-        filtered_events, to_be_suppressed = filter_notification_event(queue_events)
+        filtered_events, to_be_suppressed, delay = filter_notification_event(queue_events)
 
         if len(to_be_suppressed):
-            for eid in to_be_suppressed:
-                yield update_event_notification_status(eid, True)
+            yield update_event_notification_status(to_be_suppressed, True)
 
-        for qe in filtered_events:
-            yield self.mail_notification.do_every_notification(qe)
+        # the job is woken up at the closing of the next digest window
+        self.schedule_wakeup(delay)
 
-            if not self.skip_sleep:
-                yield deferred_sleep(2)
+        # the mails are rendered and stored in the outbox concurrently
+        yield DeferredList([self.mail_notification.do_every_notification(qe)
+                            for qe in filtered_events])
 
         # This is the notification of the ping, if configured
         receivers_synthesis = {}
@@ -232,10 +396,12 @@ class MailflushSchedule(GLJob):
             if not qe.receiver_info['ping_notification']:
                 continue
 
+            winks = len(get_event_ids(qe))
+
             if qe.receiver_info['id'] not in receivers_synthesis:
-                receivers_synthesis[qe.receiver_info['id']] = [qe.receiver_info, 1]
+                receivers_synthesis[qe.receiver_info['id']] = [qe.receiver_info, winks]
             else:
-                receivers_synthesis[qe.receiver_info['id']][1] += 1
+                receivers_synthesis[qe.receiver_info['id']][1] += winks
 
         if len(receivers_synthesis.keys()):
             # I'm taking the element [0] of the list but every element has the same
@@ -243,3 +409,28 @@ class MailflushSchedule(GLJob):
             # it is needed by Templating()
             yield self.ping_mail_flush(filtered_events[0].notification_settings,
                                        receivers_synthesis)
+
+    @inlineCallbacks
+    def flush_outbox(self):
+        mails = yield load_outbox()
+
+        if not len(mails):
+            returnValue(None)
+
+        # the mails are delivered concurrently by GLMailDispatcher that
+        # takes care of rate limiting the mails addressed to the same domain
+        results = yield DeferredList([maybeDeferred(sendmail, mail['address'], mail['subject'], mail['body'])
+                                      for mail in mails], consumeErrors=True)
+
+        sent_ids = [mail['id'] for mail, (success, _) in zip(mails, results) if success]
+        failed_ids = [mail['id'] for mail, (success, _) in zip(mails, results) if not success]
+
+        delay = yield update_outbox(sent_ids, failed_ids)
+
+        # the job is woken up for the retries scheduled before its next execution
+        self.schedule_wakeup(delay)
+
+    @inlineCallbacks
+    def operation(self):
+        yield self.process_events()
+        yield self.flush_outbox()
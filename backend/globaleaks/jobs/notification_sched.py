@@ -6,19 +6,58 @@
 # Notification implementation, documented along the others asynchronous
 # operations, in Architecture and in jobs/README.md
 
-from twisted.internet.defer import inlineCallbacks
+import time
+
+from storm.expr import Asc
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.orm import transact
 from globaleaks.anomaly import Alarm
-from globaleaks.handlers import admin
-from globaleaks.handlers.rtip import serialize_rtip, serialize_message, serialize_comment
-from globaleaks.handlers.submission import serialize_internalfile
 from globaleaks.jobs.base import GLJob
+from globaleaks.jobs.wakeup import GLWorkBus
 from globaleaks.models import EventLogs
 from globaleaks.notification import Event
 from globaleaks.settings import GLSettings
-from globaleaks.utils.utility import log
+from globaleaks.utils.structures import get_localized_values
+from globaleaks.utils.utility import log, datetime_to_ISO8601
+
+
+# The events are stored with the only fields used by the notification
+# templates; the receiver is referenced by EventLogs.receiver_id and
+# serialized by the mail flush job at the time of the rendering.
+
+def serialize_event_tip(rtip):
+    return {
+        'id': rtip.id,
+        'creation_date': datetime_to_ISO8601(rtip.internaltip.creation_date),
+        'expiration_date': datetime_to_ISO8601(rtip.internaltip.expiration_date),
+        'progressive': rtip.internaltip.progressive,
+        'label': rtip.label
+    }
+
+
+def serialize_event_context(context, language):
+    return get_localized_values({'id': context.id}, context, ['name'], language)
+
+
+def serialize_event_comment(comment):
+    return {
+        'id': comment.id,
+        'author': comment.author,
+        'type': comment.type,
+        'creation_date': datetime_to_ISO8601(comment.creation_date)
+    }
+
+
+def serialize_event_file(ifile):
+    return {
+        'id': ifile.id,
+        'name': ifile.name,
+        'content_type': ifile.content_type,
+        'size': ifile.size,
+        'creation_date': datetime_to_ISO8601(ifile.creation_date)
+    }
 
 
 def db_save_events_on_db(store, event_list):
@@ -26,7 +65,6 @@ def db_save_events_on_db(store, event_list):
         e = EventLogs()
 
         e.description = {
-            'receiver_info': evnt.receiver_info,
             'context_info': evnt.context_info,
             'tip_info': evnt.tip_info,
             'subevent_info': evnt.subevent_info,
@@ -68,47 +106,32 @@ class EventLogger(object):
         else:
             raise Exception("self.trigger of unexpected kind ? %s" % self.trigger)
 
-        receiver_desc = admin.receiver.admin_serialize_receiver(receiver, self.language)
+        return (receiver.tip_notification, {'id': receiver.id})
 
-        return (receiver.tip_notification, receiver_desc)
+    def db_pending(self, store):
+        """
+        :return: the pending elements, oldest first
+        """
+        return store.find(self.model, self.model.new == True) \
+                    .order_by(Asc(self.model.creation_date), Asc(self.model.id))
 
     def process_event(self, store, elem):
         pass
 
     @transact
-    def process_events(self, store):
+    def process_batch(self, store, batch_size):
         """
-        :return:
-            0  = No event has been processed
-           -1  = Threshold reach, emergency mode.
-           >0  = Some elements to be notified has been processed
+        Process a batch of the pending events; every event is kept, the
+        events of the same receiver are then merged in digests by
+        MailflushSchedule.
+
+        :return: the number of events processed and of the ones left pending
         """
+        self.events = []
 
-        _elemscount = store.find(self.model, self.model.new == True).count()
-
-        if _elemscount > (GLSettings.jobs_operation_limit * 10):
-            # If this situation happen, we are facing an important load.
-            # The reasonable option is that the entire Notification get skipped for this specific Trigger
-            # all the events are marked as "new = False" and "chi si è visto si è visto"!
-            # plus, the Admin get notified about it with an email.
-            log.err("Waves of new %s received, notification suspended completely for all the %d %s (Threshold %d)" %
-                     ( self.trigger, _elemscount,
-                       self.trigger, (GLSettings.jobs_operation_limit * 10) ))
-            store.find(self.model, self.model.new == True).set(new=False)
-            return -1
-
-        _elems = store.find(self.model, self.model.new == True)[:GLSettings.jobs_operation_limit]
-
-        if _elemscount > GLSettings.jobs_operation_limit:
-            log.info("Notification: Processing %d new event from a Queue of %d: %s(s) to be handled" %
-                      (_elems.count(), _elemscount, self.trigger))
-        elif _elemscount:
-            log.debug("Notification: Processing %d new event: %s(s) to be handled" %
-                      (_elems.count(), self.trigger))
-        else:
-            # No element to be processed
-            return 0
+        _elems = self.db_pending(store)[:batch_size]
 
+        processed = 0
         for e in _elems:
             # Mark event as handled as first step;
             # For resiliency reasons it's better to be sure that the
@@ -116,27 +139,100 @@ class EventLogger(object):
             # due to possible exceptions in handling
             e.new = False
             self.process_event(store, e)
+            processed += 1
+
+        pending = store.find(self.model, self.model.new == True).count()
 
         db_save_events_on_db(store, self.events)
         log.debug("Notification: generated %d notification events of type %s" %
                   (len(self.events), self.trigger))
 
-        return _elems.count()
+        return processed, pending
+
+    @transact
+    def suppress_events(self, store, events_count):
+        """
+        Suppress the oldest pending events: they have already waited the
+        longest and the events kept are the ones that can still be
+        notified within the latency budget.
+        """
+        for e in self.db_pending(store)[:events_count]:
+            e.new = False
+
+    @inlineCallbacks
+    def process_events(self, time_budget=None):
+        """
+        Drain the queue of the pending events in batches of increasing size,
+        based on the measured cost per event, until the queue is empty or
+        the time budget (in seconds) is exhausted.
+
+        The events are suppressed only when, at the measured rate, the
+        remaining backlog would not be drained by the following executions
+        of the job within GLSettings.notification_max_latency.
+
+        :return:
+            0  = No event has been processed
+           -1  = Backlog exceeding the latency budget, events suppressed.
+           >0  = Some elements to be notified has been processed
+        """
+        if time_budget is None:
+            time_budget = GLSettings.notification_time_budget
+
+        deadline = time.time() + time_budget
+        batch_size = GLSettings.jobs_operation_limit
+
+        total, pending = 0, 0
+        while True:
+            batch_start = time.time()
+            processed, pending = yield self.process_batch(batch_size)
+            total += processed
+
+            remaining_time = deadline - time.time()
+            if not processed or not pending or remaining_time <= 0:
+                break
+
+            event_cost = (time.time() - batch_start) / processed
+            batch_size = min(batch_size * 2, GLSettings.jobs_operation_limit * 10)
+            if event_cost > 0:
+                batch_size = max(1, min(batch_size, int(remaining_time / event_cost)))
+
+        if not pending:
+            if total:
+                log.debug("Notification: Processed %d new event: %s(s) handled" % (total, self.trigger))
+            returnValue(total)
+
+        # events that at the current rate can be handled within the maximum latency
+        drainable = total * GLSettings.notification_max_latency / GLSettings.notification_delta
+        if pending <= drainable:
+            log.info("Notification: Processed %d new event: %s(s), %d left to the next executions" %
+                     (total, self.trigger, pending))
+            returnValue(total)
+
+        # If this situation happen, we are facing an important load that could
+        # not be handled in the latency budget; the admin get notified about it.
+        log.err("Waves of new %s received, notification suppressed for %d %s over %d pending (%d processed)" %
+                (self.trigger, pending - drainable, self.trigger, pending, total))
+        yield self.suppress_events(pending - drainable)
+        returnValue(-1)
 
 
 class TipEventLogger(EventLogger):
     trigger = 'Tip'
     model = models.ReceiverTip
 
-    def process_event(self, store, rtip):
-        tip_desc = serialize_rtip(store, rtip, self.language)
-
-        context_desc = admin.context.admin_serialize_context(store,
-                                                             rtip.internaltip.context,
-                                                             self.language)
+    def db_pending(self, store):
+        # the receiver tips are dated by their internaltip
+        return store.find(models.ReceiverTip,
+                          models.ReceiverTip.new == True,
+                          models.ReceiverTip.internaltip_id == models.InternalTip.id) \
+                    .order_by(Asc(models.InternalTip.creation_date), Asc(models.ReceiverTip.id))
 
+    def process_event(self, store, rtip):
         do_mail, receiver_desc = self.import_receiver(rtip.receiver)
 
+        tip_desc = serialize_event_tip(rtip)
+        context_desc = serialize_event_context(rtip.internaltip.context, self.language)
+
         self.events.append(Event(type=self.template_type,
                                  trigger=self.trigger,
                                  node_info={},
@@ -152,20 +248,16 @@ class MessageEventLogger(EventLogger):
     model = models.Message
 
     def process_event(self, store, message):
-        message_desc = serialize_message(message)
-
         # message.type can be 'receiver' or 'wb' at the moment, we care of the latter
         if message.type == u"receiver":
             return
 
-        tip_desc = serialize_rtip(store, message.receivertip, self.language)
-
-        context_desc = admin.context.admin_serialize_context(store,
-                                                             message.receivertip.internaltip.context,
-                                                             self.language)
-
         do_mail, receiver_desc = self.import_receiver(message.receivertip.receiver)
 
+        message_desc = serialize_event_comment(message)
+        tip_desc = serialize_event_tip(message.receivertip)
+        context_desc = serialize_event_context(message.receivertip.internaltip.context, self.language)
+
         self.events.append(Event(type=self.template_type,
                                  trigger=self.trigger,
                                  node_info={},
@@ -181,11 +273,7 @@ class CommentEventLogger(EventLogger):
     model = models.Comment
 
     def process_event(self, store, comment):
-        comment_desc = serialize_comment(comment)
-
-        context_desc = admin.context.admin_serialize_context(store,
-                                                             comment.internaltip.context,
-                                                             self.language)
+        comment_desc = serialize_event_comment(comment)
 
         # for every comment, iterate on the associated receiver(s)
         log.debug("Comments from %s - Receiver(s) %d" % \
@@ -200,10 +288,11 @@ class CommentEventLogger(EventLogger):
                                      (models.ReceiverTip.internaltip_id == comment.internaltip_id,
                                       models.ReceiverTip.receiver_id == receiver.id)).one()
 
-            tip_desc = serialize_rtip(store, receivertip, self.language)
-
             do_mail, receiver_desc = self.import_receiver(receiver)
 
+            tip_desc = serialize_event_tip(receivertip)
+            context_desc = serialize_event_context(comment.internaltip.context, self.language)
+
             self.events.append(Event(type=self.template_type,
                                      trigger=self.trigger,
                                      node_info={},
@@ -218,15 +307,20 @@ class FileEventLogger(EventLogger):
     trigger = 'File'
     model = models.ReceiverFile
 
-    def process_event(self, store, rfile):
-        context_desc = admin.context.admin_serialize_context(store,
-                                                             rfile.internalfile.internaltip.context,
-                                                             self.language)
+    def db_pending(self, store):
+        # the receiver files are dated by their internalfile
+        return store.find(models.ReceiverFile,
+                          models.ReceiverFile.new == True,
+                          models.ReceiverFile.internalfile_id == models.InternalFile.id) \
+                    .order_by(Asc(models.InternalFile.creation_date), Asc(models.ReceiverFile.id))
 
-        tip_desc = serialize_rtip(store, rfile.receivertip, self.language)
-        file_desc = serialize_internalfile(rfile.internalfile)
+    def process_event(self, store, rfile):
         do_mail, receiver_desc = self.import_receiver(rfile.receiver)
 
+        tip_desc = serialize_event_tip(rfile.receivertip)
+        file_desc = serialize_event_file(rfile.internalfile)
+        context_desc = serialize_event_context(rfile.internalfile.internaltip.context, self.language)
+
         self.events.append(Event(type=self.template_type,
                                  trigger=self.trigger,
                                  node_info={},
@@ -242,18 +336,24 @@ class NotificationSchedule(GLJob):
 
     @inlineCallbacks
     def operation(self):
-        tip_mngd = yield TipEventLogger().process_events()
-        if tip_mngd == -1:
-            Alarm.stress_levels['notification'].append('Tip')
+        """
+        The time budget of the execution is shared between the event
+        loggers, each one taking over the time left unused by the previous.
+        """
+        deadline = time.time() + GLSettings.notification_time_budget
+
+        loggers = [TipEventLogger(), CommentEventLogger(), MessageEventLogger(), FileEventLogger()]
+
+        managed = []
+        for i, logger in enumerate(loggers):
+            time_budget = max(0, deadline - time.time()) / (len(loggers) - i)
 
-        comment_mngd = yield CommentEventLogger().process_events()
-        if comment_mngd == -1:
-            Alarm.stress_levels['notification'].append('Comment')
+            mngd = yield logger.process_events(time_budget)
+            if mngd == -1:
+                Alarm.stress_levels['notification'].append(logger.trigger)
 
-        messages_mngd = yield MessageEventLogger().process_events()
-        if messages_mngd == -1:
-            Alarm.stress_levels['notification'].append('Message')
+            managed.append(mngd)
 
-        file_mngs = yield FileEventLogger().process_events()
-        if file_mngs == -1:
-            Alarm.stress_levels['notification'].append('File')
+        if any(mngd != 0 for mngd in managed):
+            # the generated events are to be mailed
+            GLWorkBus.signal('mailflush')
@@ -21,8 +21,10 @@ from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 from globaleaks.handlers.admin.notification import get_notification
 from globaleaks.handlers.admin.user import get_admin_users
 from globaleaks.jobs.base import GLJob
+from globaleaks.jobs.wakeup import GLWorkBus
+from globaleaks.security import GLBPGPCache
 from globaleaks.settings import GLSettings
-from globaleaks.utils.mailutils import sendmail
+from globaleaks.utils.mailutils import schedule_email
 from globaleaks.utils.utility import datetime_now, datetime_null
 from globaleaks.utils.templating import Templating
 
@@ -47,6 +49,7 @@ class PGPCheckSchedule(GLJob):
                         # If the node wont accept this the pgp key status
                         # will remain enabled and mail won't be sent by regular flow.
                         rcvr.user.pgp_key_status = u'disabled'
+                        GLBPGPCache.invalidate(rcvr.user.pgp_key_fingerprint)
                 elif rcvr.user.pgp_key_expiration < datetime_now() - timedelta(days=15):
                     expired_or_expiring.append(admin_serialize_receiver(rcvr, GLSettings.memory_copy.default_language))
 
@@ -66,12 +69,13 @@ class PGPCheckSchedule(GLJob):
         fakeevent.tip_info = None
         fakeevent.subevent_info = {'expired_or_expiring': expired_or_expiring}
 
-        subject = Templating().format_template(notification_settings['admin_pgp_alert_mail_title'], fakeevent)
-        body = Templating().format_template(notification_settings['admin_pgp_alert_mail_template'], fakeevent)
+        subject, body = Templating().format_templates([notification_settings['admin_pgp_alert_mail_title'],
+                                                       notification_settings['admin_pgp_alert_mail_template']],
+                                                      fakeevent)
 
         admin_users = yield get_admin_users()
         for u in admin_users:
-            yield sendmail(u['mail_address'], subject, body)
+            yield schedule_email(u['mail_address'], subject, body)
 
     @inlineCallbacks
     def send_pgp_alerts(self, receiver_desc):
@@ -87,10 +91,11 @@ class PGPCheckSchedule(GLJob):
         fakeevent.tip_info = None
         fakeevent.subevent_info = None
 
-        subject = Templating().format_template(notification_settings['pgp_alert_mail_title'], fakeevent)
-        body = Templating().format_template(notification_settings['pgp_alert_mail_template'], fakeevent)
+        subject, body = Templating().format_templates([notification_settings['pgp_alert_mail_title'],
+                                                       notification_settings['pgp_alert_mail_template']],
+                                                      fakeevent)
 
-        yield sendmail(receiver_desc['mail_address'], subject, body)
+        yield schedule_email(receiver_desc['mail_address'], subject, body)
 
     @inlineCallbacks
     def operation(self):
@@ -105,3 +110,5 @@ class PGPCheckSchedule(GLJob):
             if not GLSettings.memory_copy.disable_receiver_notification_emails:
                 for receiver_desc in expired_or_expiring:
                     yield self.send_pgp_alerts(receiver_desc)
+
+            GLWorkBus.signal('mailflush')
@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+#
+#   wakeup
+#   ******
+#
+# In-process notification of pending work: the handlers producing work for
+# the scheduled jobs signal it here so that the jobs are executed as soon
+# as possible instead of waiting for their next periodic execution, that is
+# kept only as a safety net.
+
+__all__ = ['GLWorkBus']
+
+
+class WorkBus(object):
+    def __init__(self):
+        self.jobs = {}
+
+    def register(self, topic, job):
+        """
+        Register the job in charge of the specified kind of work
+
+        @param topic: the kind of work (e.g. 'delivery', 'notification')
+        @param job: the GLJob to be woken up when the work is signaled
+        """
+        self.jobs[topic] = job
+
+    def unregister(self, topic):
+        self.jobs.pop(topic, None)
+
+    def signal(self, *topics):
+        """
+        Signal pending work; to be called from the reactor thread once the
+        transaction that created the work has been committed.
+        """
+        for topic in topics:
+            job = self.jobs.get(topic, None)
+            if job is not None:
+                job.wakeup()
+
+
+GLWorkBus = WorkBus()
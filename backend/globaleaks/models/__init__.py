@@ -758,6 +758,18 @@ class EventLogs(Model):
     mail_attempts = Int(default=0)
 
 
+class Mail(Model):
+    """
+    Class used to implement the outbox of the mails to be sent
+    """
+    creation_date = DateTime(default_factory=datetime_now)
+    address = Unicode()
+    subject = Unicode()
+    body = Unicode()
+    processing_attempts = Int(default=0)
+    next_attempt = DateTime(default_factory=datetime_now)
+
+
 class Field(Model):
     x = Int(default=0)
     y = Int(default=0)
@@ -1222,7 +1234,7 @@ models_list = [Node,
                InternalTip, ReceiverTip, WhistleblowerTip,
                Comment, Message,
                InternalFile, ReceiverFile, Notification,
-               Stats, Anomalies, EventLogs,
+               Stats, Anomalies, EventLogs, Mail,
                SecureFileDelete,
                IdentityAccessRequest,
                ArchivedSchema, ApplicationData]
@@ -4,14 +4,15 @@
 
 from collections import namedtuple
 
-from twisted.internet.defer import inlineCallbacks, fail
+from storm.expr import In
+from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.orm import transact
 from globaleaks.models import EventLogs
 from globaleaks.utils.utility import log
-from globaleaks.utils.mailutils import sendmail
+from globaleaks.utils.mailutils import db_schedule_email
 from globaleaks.utils.templating import Templating
-from globaleaks.security import GLBPGP
+from globaleaks.security import pgp_encrypt_message, run_pgp
 from globaleaks.settings import GLSettings
 
 
@@ -21,11 +22,9 @@ Event = namedtuple('Event',
                     'subevent_info', 'do_mail'])
 
 
-@transact
-def update_event_notification_status(store, event_id, mail_sent):
+def db_update_event_notification_status(store, event_ids, mail_sent):
     attempts_limit = GLSettings.mail_attempts_limit
-    event = store.find(EventLogs, EventLogs.id == event_id).one()
-    if event:
+    for event in store.find(EventLogs, In(EventLogs.id, event_ids)):
         event.mail_attempts += 1
         if mail_sent:
             event.mail_sent = True
@@ -39,11 +38,32 @@ def update_event_notification_status(store, event_id, mail_sent):
                        (event.id, event.title, event.mail_attempts))
 
 
+@transact
+def update_event_notification_status(store, event_ids, mail_sent):
+    db_update_event_notification_status(store, event_ids, mail_sent)
+
+
+@transact
+def schedule_event_email(store, event_ids, address, subject, body):
+    """
+    Store the mail of the events in the outbox and mark the events as notified
+    """
+    db_schedule_email(store, address, subject, body)
+    db_update_event_notification_status(store, event_ids, True)
+
+
+def get_event_ids(event):
+    """
+    :return: the ids of the EventLogs notified by the event or by the digest
+    """
+    if event.type == u'digest':
+        return [e.orm_id for e in event.subevent_info['events']]
+
+    return [event.orm_id]
+
+
 class MailNotification(object):
     def get_mail_subject_and_body(self, event):
-        def replace_variables(template, event):
-            return Templating().format_template(template, event)
-
         if event.type in [u'tip', u'file', u'comment', u'message', u'tip_expiration', 'receiver_notification_limit_reached']:
             subject_template = event.notification_settings[event.type + '_mail_title']
             body_template = event.notification_settings[event.type + '_mail_template']
@@ -53,53 +73,67 @@ class MailNotification(object):
         if event.type in [u'tip', u'file', u'comment', u'message', u'tip_expiration']:
             subject_template = "%TipNum%%TipLabel%" + subject_template
 
-        subject = replace_variables(subject_template, event)
-        body = replace_variables(body_template, event)
+        subject, body = Templating().format_templates([subject_template, body_template], event)
+
+        return subject, body
+
+    def get_digest_subject_and_body(self, digest):
+        """
+        The digest is composed by the mails of the aggregated events,
+        under the title configured in notification_digest_mail_title
+        """
+        subject = Templating().format_template(digest.notification_settings['notification_digest_mail_title'],
+                                               digest)
+
+        body = u''
+        for event in digest.subevent_info['events']:
+            event_subject, event_body = self.get_mail_subject_and_body(event)
+            body += u"%s\n%s\n%s\n\n" % (event_subject.strip(), u'=' * len(event_subject.strip()), event_body)
 
         return subject, body
 
     def do_notify(self, event):
-        if event.type == 'digest':
-            subject = event.tip_info['body']
-            body = event.tip_info['title']
+        if event.type == u'digest':
+            subject, body = self.get_digest_subject_and_body(event)
         else:
             subject, body = self.get_mail_subject_and_body(event)
 
+        event_ids = get_event_ids(event)
+
         receiver_mail = event.receiver_info['mail_address']
 
         # If the receiver has encryption enabled (for notification), encrypt the mail body
         if event.receiver_info['pgp_key_status'] == u'enabled':
-            gpob = GLBPGP()
-            try:
-                gpob.load_key(event.receiver_info['pgp_key_public'])
-                body = gpob.encrypt_message(event.receiver_info['pgp_key_fingerprint'], body)
-            except Exception as excep:
+            def encryption_failed(failure):
                 log.err("Error in PGP interface object (for %s: %s)! (notification+encryption)" %
-                        (event.receiver_info['username'], str(excep)))
+                        (event.receiver_info['username'], failure.getErrorMessage()))
 
                 # On this condition (PGP enabled but key invalid) the only
-                # thing to do is to return None;
+                # thing to do is to fail the notification;
                 # It will be duty of the PGP check schedule will disable the key
                 # and advise the user and the admin about that action.
-                return fail(None)
-            finally:
-                # the finally statement is always called also if
-                # except contains a return or a raise
-                gpob.destroy_environment()
+                return failure
+
+            d = run_pgp(pgp_encrypt_message,
+                        event.receiver_info['pgp_key_public'],
+                        event.receiver_info['pgp_key_fingerprint'],
+                        body)
+            d.addCallbacks(lambda encrypted_body: schedule_event_email(event_ids, receiver_mail, subject, encrypted_body),
+                           encryption_failed)
+            return d
 
-        return sendmail(receiver_mail, subject, body)
+        return schedule_event_email(event_ids, receiver_mail, subject, body)
 
     @inlineCallbacks
     def do_every_notification(self, eventOD):
+        """
+        Render and encrypt the mail of the event storing it in the outbox;
+        the delivery is then performed by MailflushSchedule.flush_outbox
+        """
         notify = self.do_notify(eventOD)
-        notify.addCallbacks(self.every_notification_succeeded, self.every_notification_failed,
-                            callbackArgs=(eventOD.orm_id,), errbackArgs=(eventOD.orm_id,))
+        notify.addErrback(self.every_notification_failed, get_event_ids(eventOD))
         yield notify
 
     @inlineCallbacks
-    def every_notification_succeeded(self, result, event_id):
-        yield update_event_notification_status(event_id, True)
-
-    @inlineCallbacks
-    def every_notification_failed(self, failure, event_id):
-        yield update_event_notification_status(event_id, False)
+    def every_notification_failed(self, failure, event_ids):
+        yield update_event_notification_status(event_ids, False)
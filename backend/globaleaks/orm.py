@@ -14,6 +14,7 @@ from twisted.internet import reactor
 from twisted.internet.defer import succeed
 from twisted.internet.threads import deferToThreadPool
 
+from globaleaks.rest.apicache import GLApiCache
 from globaleaks.rest.errors import DatabaseIntegrityError
 from globaleaks.settings import GLSettings
 
@@ -61,11 +62,17 @@ class transact(object):
     """
     Class decorator for managing transactions.
     Because Storm sucks.
+
+    Read/write transactions are serialized on the single writer lane
+    (GLSettings.orm_tp) while read only transactions are executed
+    concurrently on the pool of readers (GLSettings.orm_ro_tp).
     """
     readonly = False
 
+    # high watermark of the queue depth observed on each thread pool
+    max_queued = {'rw': 0, 'ro': 0}
+
     def __init__(self, method):
-        self.store = None
         self.method = method
         self.instance = None
         self.debug = GLSettings.orm_debug
@@ -78,15 +85,24 @@ class transact(object):
         return self
 
     def __call__(self, *args, **kwargs):
-        return self.run(self._wrap, self.method, *args, **kwargs)
+        # the instance is bound here on the reactor thread because the
+        # same decorator may be concurrently used by different instances
+        return self.run(self._wrap, self.method, self.instance, *args, **kwargs)
 
-    @staticmethod
-    def run(function, *args, **kwargs):
+    def run(self, function, *args, **kwargs):
         """
-        Defer provided function to thread
+        Defer provided function to the thread pool serving the transaction
         """
-        return deferToThreadPool(reactor, GLSettings.orm_tp,
-                                 function, *args, **kwargs)
+        lane = 'ro' if self.readonly and GLSettings.orm_ro_threads else 'rw'
+        tp = GLSettings.orm_ro_tp if lane == 'ro' else GLSettings.orm_tp
+
+        d = deferToThreadPool(reactor, tp, function, *args, **kwargs)
+
+        queued = tp.q.qsize()
+        if queued > transact.max_queued[lane]:
+            transact.max_queued[lane] = queued
+
+        return d
 
     @staticmethod
     def get_store():
@@ -98,18 +114,38 @@ class transact(object):
 
         return zstorm.get(GLSettings.store_name)
 
-    def _wrap(self, function, *args, **kwargs):
+    @staticmethod
+    def stats():
+        """
+        Returns the queue depth and the number of busy threads of the ORM thread pools
+        """
+        ret = {}
+        for lane, tp in [('rw', GLSettings.orm_tp), ('ro', GLSettings.orm_ro_tp)]:
+            ret[lane] = {
+                'threads': tp.max,
+                'working': len(tp.working),
+                'queued': tp.q.qsize(),
+                'max_queued': transact.max_queued[lane]
+            }
+
+        return ret
+
+    def _wrap(self, function, instance, *args, **kwargs):
         """
         Wrap provided function calling it inside a thread and
         passing the store to it.
         """
-        self.store = self.get_store()
+        store = self.get_store()
+
+        # the values cached by GLApiCache.db_get are discarded if the cache
+        # gets invalidated while the transaction is running
+        store.cache_generation = GLApiCache.generation
 
         try:
-            if self.instance:
-                result = function(self.instance, self.store, *args, **kwargs)
+            if instance:
+                result = function(instance, store, *args, **kwargs)
             else:
-                result = function(self.store, *args, **kwargs)
+                result = function(store, *args, **kwargs)
 
         except exceptions.DisconnectionError as e:
             transaction.abort()
@@ -124,17 +160,17 @@ class transact(object):
             raise excep
         except:
             transaction.abort()
-            self.store.close()
+            store.close()
             # propagate the exception
             raise
         else:
             if not self.readonly:
-                self.store.commit()
+                store.commit()
             else:
-                self.store.flush()
-                self.store.invalidate()
+                store.flush()
+                store.invalidate()
         finally:
-            self.store.close()
+            store.close()
 
         return result
 
@@ -1,9 +1,41 @@
+import gzip
+import hashlib
+import threading
+
+from StringIO import StringIO
+
+from cyclone import escape
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks.utils.utility import log
 
+
+class CachedResponse(object):
+    """
+    The JSON encoding of a cached value together with its gzip compressed
+    variant and the strong ETag identifying it, so that the handlers serve
+    the value without encoding and compressing it at every request.
+    """
+    def __init__(self, value):
+        self.value = value
+        self.body = escape.json_encode(value)
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+
+        # mtime is fixed in order to obtain the same bytes for the same body
+        buf = StringIO()
+        with gzip.GzipFile(mode='wb', fileobj=buf, compresslevel=9, mtime=0) as f:
+            f.write(self.body)
+        self.gzip_body = buf.getvalue()
+
+
 class GLApiCache(object):
     memory_cache_dict = {}
+    response_cache_dict = {}
+
+    # bumped by every invalidation; a value computed on data read before an
+    # invalidation is returned to its caller but it is not stored
+    generation = 0
+    lock = threading.Lock()
 
     @classmethod
     @inlineCallbacks
@@ -13,15 +45,56 @@ class GLApiCache(object):
                     and language in cls.memory_cache_dict[resource_name]:
                 returnValue(cls.memory_cache_dict[resource_name][language])
 
+            generation = cls.generation
             value = yield function(*args, **kwargs)
-            if resource_name not in cls.memory_cache_dict:
-                cls.memory_cache_dict[resource_name] = {}
-            cls.memory_cache_dict[resource_name][language] = value
+            if generation == cls.generation:
+                if resource_name not in cls.memory_cache_dict:
+                    cls.memory_cache_dict[resource_name] = {}
+                cls.memory_cache_dict[resource_name][language] = value
             returnValue(value)
         except KeyError:
             log.debug("KeyError exception while operating on the cache; probable race")
             returnValue(None)
 
+    @classmethod
+    @inlineCallbacks
+    def get_response(cls, resource_name, language, function, *args, **kwargs):
+        """
+        Version of get() returning the CachedResponse of the value
+        """
+        try:
+            returnValue(cls.response_cache_dict[resource_name][language])
+        except KeyError:
+            pass
+
+        generation = cls.generation
+        value = yield cls.get(resource_name, language, function, *args, **kwargs)
+        response = CachedResponse(value)
+
+        # None is returned by get() on a race and it is not cached
+        if value is not None and generation == cls.generation:
+            cls.response_cache_dict.setdefault(resource_name, {})[language] = response
+
+        returnValue(response)
+
+    @classmethod
+    def db_get(cls, store, resource_name, language, function, *args, **kwargs):
+        """
+        Synchronous version of get() to be used inside a transaction:
+        function is called with the store of the transaction.
+
+        The value is stored only if the cache has not been invalidated since
+        the beginning of the transaction (store.cache_generation).
+        """
+        try:
+            return cls.memory_cache_dict[resource_name][language]
+        except KeyError:
+            value = function(store, *args, **kwargs)
+            with cls.lock:
+                if getattr(store, 'cache_generation', cls.generation) == cls.generation:
+                    cls.memory_cache_dict.setdefault(resource_name, {})[language] = value
+            return value
+
     @classmethod
     def set(cls, resource_name, language, value):
         try:
@@ -29,6 +102,7 @@ class GLApiCache(object):
                 cls.memory_cache_dict[resource_name] = {}
 
             cls.memory_cache_dict[resource_name][language] = value
+            cls.response_cache_dict.get(resource_name, {}).pop(language, None)
         except KeyError:
             log.debug("KeyError exception while operating on the cache; probable race")
             returnValue(None)
@@ -39,7 +113,12 @@ class GLApiCache(object):
         When a function has an update, all the language need to be
         invalidated, because the change is still effective
         """
-        if resource_name is None:
-            cls.memory_cache_dict = {}
-        else:
-            cls.memory_cache_dict.pop(resource_name, None)
+        with cls.lock:
+            cls.generation += 1
+
+            if resource_name is None:
+                cls.memory_cache_dict = {}
+                cls.response_cache_dict = {}
+            else:
+                cls.memory_cache_dict.pop(resource_name, None)
+                cls.response_cache_dict.pop(resource_name, None)
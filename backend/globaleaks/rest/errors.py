@@ -400,3 +400,12 @@ class ModelNotFound(GLException):
             self.reason = "Model not found"
         else:
             self.reason = "Model of type {} has not been found".format(model)
+
+
+class ServiceOverloaded(GLException):
+    """
+    The request has been rejected because the node is too busy to process it
+    """
+    reason = "The service is overloaded, retry later"
+    error_code = 60
+    status_code = 503 # Service not available
@@ -18,6 +18,8 @@ from globaleaks.jobs import session_management_sched, statistics_sched, \
     notification_sched, delivery_sched, cleaning_sched, \
     pgp_check_sched, mailflush_sched, secure_file_delete_sched
 
+from globaleaks.jobs.wakeup import GLWorkBus
+
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log, datetime_now
 
@@ -46,12 +48,15 @@ class GlobaLeaksRunner(UnixApplicationRunner):
 
         delivery = delivery_sched.DeliverySchedule()
         self._reactor.callLater(1, delivery.start, GLSettings.delivery_delta)
+        GLWorkBus.register('delivery', delivery)
 
         notification = notification_sched.NotificationSchedule()
         self._reactor.callLater(1, notification.start, GLSettings.notification_delta)
+        GLWorkBus.register('notification', notification)
 
         mailflush = mailflush_sched.MailflushSchedule()
         self._reactor.callLater(1, mailflush.start, GLSettings.mailflush_delta)
+        GLWorkBus.register('mailflush', mailflush)
 
         secure_file_delete = secure_file_delete_sched.SecureFileDeleteSchedule()
         self._reactor.callLater(1, secure_file_delete.start, GLSettings.secure_file_delete_delta)
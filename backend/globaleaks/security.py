@@ -12,11 +12,18 @@ import pickle
 import random
 import shutil
 import scrypt
+import threading
 import time
 
+from collections import OrderedDict
+from contextlib import contextmanager
+
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
+from twisted.internet import reactor
+from twisted.internet.defer import fail
+from twisted.internet.threads import deferToThreadPool
 from datetime import datetime
 from gnupg import GPG
 from tempfile import _TemporaryFileWrapper
@@ -117,6 +124,10 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
     """
     last_action = 'init'
 
+    # update_into() requires an output buffer larger than its input
+    # of the cipher block size minus one byte
+    decrypt_overhead = algorithms.AES.block_size / 8 - 1
+
     def __init__(self, filedir):
         """
         filedir: directory where to store files
@@ -140,6 +151,8 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
         self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
         self.encryptor = self.cipher.encryptor()
         self.decryptor = self.cipher.decryptor()
+        self.decryptor_finalized = False
+        self.readbuf = None
 
     def create_key(self):
         """
@@ -210,7 +223,7 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
 
         return _TemporaryFileWrapper.close(self)
 
-    def read(self, c=None):
+    def start_reading(self):
         """
         The first time 'read' is called after a write, seek(0) is performed
         """
@@ -224,6 +237,16 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
             log.debug("First seek on %s" % self.filepath)
             self.last_action = 'read'
 
+    def finalize_decryptor(self):
+        if self.decryptor_finalized:
+            return ''
+
+        self.decryptor_finalized = True
+        return self.decryptor.finalize()
+
+    def read(self, c=None):
+        self.start_reading()
+
         data = None
         if c is None:
             data = self.file.read()
@@ -233,7 +256,39 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
         if len(data):
             return self.decryptor.update(data)
         else:
-            return self.decryptor.finalize()
+            return self.finalize_decryptor()
+
+    def readinto(self, b):
+        """
+        Decrypt data into the preallocated buffer 'b' (a bytearray or a
+        writable memoryview) and return the number of bytes read, 0 on EOF.
+
+        Each call reads at most len(b) - decrypt_overhead bytes so that the
+        decryption can be performed directly into 'b'.
+        """
+        self.start_reading()
+
+        output = memoryview(b)
+        size = len(output) - self.decrypt_overhead
+        if size <= 0:
+            raise ValueError("Buffer too small to decrypt into")
+
+        if self.readbuf is None or len(self.readbuf) < size:
+            self.readbuf = bytearray(size)
+
+        data = memoryview(self.readbuf)[:size]
+        n = self.file.readinto(data)
+        if not n:
+            self.finalize_decryptor()
+            return 0
+
+        if hasattr(self.decryptor, 'update_into'):
+            self.decryptor.update_into(data[:n], output)
+        else:
+            # cryptography < 1.8 does not implement update_into()
+            output[:n] = self.decryptor.update(data[:n].tobytes())
+
+        return n
 
 
 class GLSecureFile(GLSecureTemporaryFile):
@@ -320,6 +375,21 @@ def hash_password(proposed_password, salt_input):
     return binascii.b2a_hex(hashed_passwd)
 
 
+def run_kdf(function, *args, **kwargs):
+    """
+    Defer a key derivation function (e.g. hash_password, check_password)
+    to the KDF thread pool so that scrypt never runs inside the ORM threads.
+
+    @return: a deferred firing with the function result or failing
+             with ServiceOverloaded if too many KDF requests are queued.
+    """
+    if GLSettings.kdf_tp.q.qsize() >= GLSettings.kdf_queue_limit:
+        log.err("KDF queue limit reached (%d): request rejected" % GLSettings.kdf_queue_limit)
+        return fail(errors.ServiceOverloaded())
+
+    return deferToThreadPool(reactor, GLSettings.kdf_tp, function, *args, **kwargs)
+
+
 def check_password_format(password):
     """
     @param password:
@@ -443,31 +513,36 @@ class GLBPGP(object):
 
     def encrypt_file(self, key_fingerprint, plainpath, filestream, output_path):
         """
-        @param pgp_key_public:
-        @param plainpath:
-        @return:
+        Encrypt a file streaming it through gpg: the plaintext chunks read
+        from filestream are piped into gpg that writes the ciphertext
+        directly to the destination path, so that the file is never
+        kept in memory.
+
+        @param key_fingerprint: the fingerprint of the recipient key
+        @param plainpath: the path of the plaintext file (used for logging)
+        @param filestream: the file-like object providing the plaintext
+        @param output_path: the directory where to write the encrypted file
+        @return: the path and the size of the encrypted file
         """
-        encrypt_obj = self.pgph.encrypt_file(filestream, str(key_fingerprint))
-
-        if not encrypt_obj.ok:
-            raise errors.PGPKeyInvalid
-
-        log.debug("Encrypting for key %s file %s (%d bytes)" %
-                  (key_fingerprint,
-                   plainpath, len(str(encrypt_obj))))
-
         encrypted_path = os.path.join(os.path.abspath(output_path),
                                       "pgp_encrypted-%s" % rstr.xeger(r'[A-Za-z0-9]{16}'))
 
         try:
-            with open(encrypted_path, "w+") as f:
-                f.write(str(encrypt_obj))
+            encrypt_obj = self.pgph.encrypt_file(filestream, str(key_fingerprint), output=encrypted_path)
 
-            return encrypted_path, len(str(encrypt_obj))
-        except Exception as excep:
-            log.err("Error in writing PGP file output: %s (%s) bytes %d" %
-                    (excep.message, encrypted_path, len(str(encrypt_obj)) ))
-            raise errors.InternalServerError("Error in writing [%s]" % excep.message)
+            if not encrypt_obj.ok:
+                raise errors.PGPKeyInvalid
+
+            encrypted_size = os.path.getsize(encrypted_path)
+        except:
+            if os.path.exists(encrypted_path):
+                os.remove(encrypted_path)
+            raise
+
+        log.debug("Encrypting for key %s file %s (%d bytes)" %
+                  (key_fingerprint, plainpath, encrypted_size))
+
+        return encrypted_path, encrypted_size
 
     def encrypt_message(self, key_fingerprint, plaintext):
         """
@@ -501,3 +576,124 @@ class GLBPGP(object):
             shutil.rmtree(self.pgph.gnupghome)
         except Exception as excep:
             log.err("Unable to clean temporary PGP environment: %s: %s" % (self.pgph.gnupghome, excep))
+
+
+class PGPKeyringCache(object):
+    """
+    Long lived GnuPG keyrings, one for each public key, indexed by
+    fingerprint; each key is imported only once and its keyring is then
+    reused by every encryption until the key changes or is invalidated.
+
+    A replaced keyring is destroyed only when no thread is still using it.
+    The lock protects only the index: the keys are imported and the keyrings
+    are destroyed without holding it.
+    """
+    max_keyrings = 128
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keyrings = OrderedDict()
+
+    def _retire(self, keyring, retired):
+        keyring['retired'] = True
+        if not keyring['users']:
+            retired.append(keyring['pgp'])
+
+    def _lookup(self, key, fingerprint, retired):
+        """
+        To be called holding the lock: return the valid keyring of the
+        fingerprint, if any, marking it as used.
+        """
+        keyring = self.keyrings.pop(fingerprint, None)
+        if keyring is None:
+            return None
+
+        if keyring['key'] != key or not os.path.isdir(keyring['pgp'].pgph.gnupghome):
+            self._retire(keyring, retired)
+            return None
+
+        # most recently used keyrings are kept at the end
+        self.keyrings[fingerprint] = keyring
+        keyring['users'] += 1
+        return keyring
+
+    def _acquire(self, key, fingerprint):
+        retired = []
+        pgp = None
+
+        try:
+            with self.lock:
+                keyring = self._lookup(key, fingerprint, retired)
+
+            if keyring is None:
+                # the key is imported without holding the lock, so that
+                # a cache miss does not block the other PGP threads
+                pgp = GLBPGP()
+                pgp.load_key(key)
+
+                with self.lock:
+                    # the key could have been imported by another thread
+                    keyring = self._lookup(key, fingerprint, retired)
+                    if keyring is None:
+                        keyring = {'key': key, 'pgp': pgp, 'users': 1, 'retired': False}
+                        pgp = None
+
+                        while len(self.keyrings) >= self.max_keyrings:
+                            self._retire(self.keyrings.popitem(last=False)[1], retired)
+
+                        self.keyrings[fingerprint] = keyring
+        finally:
+            # the keyrings are destroyed after releasing the lock
+            if pgp is not None:
+                retired.append(pgp)
+
+            for x in retired:
+                x.destroy_environment()
+
+        return keyring
+
+    @contextmanager
+    def get(self, key, fingerprint):
+        keyring = self._acquire(key, fingerprint)
+
+        try:
+            yield keyring['pgp']
+        finally:
+            with self.lock:
+                keyring['users'] -= 1
+                destroy = keyring['retired'] and not keyring['users']
+
+            if destroy:
+                keyring['pgp'].destroy_environment()
+
+    def invalidate(self, fingerprint=None):
+        retired = []
+
+        with self.lock:
+            if fingerprint is None:
+                fingerprints = self.keyrings.keys()
+            else:
+                fingerprints = [fingerprint]
+
+            for f in fingerprints:
+                keyring = self.keyrings.pop(f, None)
+                if keyring is not None:
+                    self._retire(keyring, retired)
+
+        for pgp in retired:
+            pgp.destroy_environment()
+
+
+GLBPGPCache = PGPKeyringCache()
+
+
+def pgp_encrypt_message(key, fingerprint, plaintext):
+    with GLBPGPCache.get(key, fingerprint) as pgp:
+        return pgp.encrypt_message(fingerprint, plaintext)
+
+
+def run_pgp(function, *args, **kwargs):
+    """
+    Defer a PGP operation to the PGP thread pool
+    """
+    return deferToThreadPool(reactor, GLSettings.pgp_tp, function, *args, **kwargs)
@@ -70,8 +70,28 @@ class GLSettingssClass(object):
         # daemon
         self.nodaemon = False
 
-        # thread pool size of 1
+        # ORM thread pools:
+        #   - orm_tp is the single writer lane serializing every @transact
+        #   - orm_ro_tp is the pool of readers serving every @transact_ro;
+        #     each reader uses its own SQLite connection (WAL journal mode)
+        #     and when orm_ro_threads is 0 the readers share the writer lane
         self.orm_tp = ThreadPool(0, 1)
+        self.orm_ro_threads = 4
+        self.orm_ro_tp = ThreadPool(0, self.orm_ro_threads)
+
+        # KDF thread pool: the scrypt hashing of passwords and receipts is
+        # performed here and never inside a database transaction;
+        # requests exceeding kdf_queue_limit are rejected as overload.
+        self.kdf_threads = 2
+        self.kdf_queue_limit = 64
+        self.kdf_tp = ThreadPool(0, self.kdf_threads)
+
+        # PGP thread pool: the delivery work items (one for each file and
+        # receiver) and the encryption of mails are performed here using the
+        # keyrings kept by security.GLBPGPCache; its size bounds the
+        # parallelism of the delivery.
+        self.pgp_threads = 2
+        self.pgp_tp = ThreadPool(0, self.pgp_threads)
 
         self.bind_addresses = '127.0.0.1'
 
@@ -138,8 +158,10 @@ class GLSettingssClass(object):
 
         # default timings for scheduled jobs
         self.session_management_delta = 60
-        self.notification_delta = 60
-        self.delivery_delta = 20
+        # delivery and notification are woken up by the handlers producing
+        # work (see jobs/wakeup.py); their periodic execution is a safety net
+        self.notification_delta = 300
+        self.delivery_delta = 300
         self.anomaly_delta = 10
         self.mailflush_delta = 300
         self.secure_file_delete_delta = 3600
@@ -198,6 +220,20 @@ class GLSettingssClass(object):
         self.notification_limit = 30
         self.jobs_operation_limit = 20
 
+        # maximum number of tips returned by a page of /receiver/tips
+        self.receiver_tips_page_limit = 100
+
+        # the notification job drains the pending events in batches of
+        # increasing size within a time budget (seconds) for each execution;
+        # the events are suppressed only if at the measured rate the backlog
+        # could not be notified within notification_max_latency (seconds)
+        self.notification_time_budget = 60
+        self.notification_max_latency = 24 * 3600
+
+        # the events of a receiver are held for notification_digest_window
+        # (seconds) from the first of them and then notified with a digest
+        self.notification_digest_window = 60
+
         self.user = getpass.getuser()
         self.group = getpass.getuser()
         self.uid = os.getuid()
@@ -265,8 +301,28 @@ class GLSettingssClass(object):
         self.mail_timeout = 15 # seconds
         self.mail_attempts_limit = 3 # per mail limit
 
+        # outbox retry scheduling: the n-th failed delivery of a mail is
+        # retried after mail_retry_delay * 2^(n-1) seconds (at most
+        # mail_retry_delay_max) up to mail_retry_attempts_limit attempts
+        self.mail_retry_delay = 60 # seconds
+        self.mail_retry_delay_max = 3600 # seconds
+        self.mail_retry_attempts_limit = 10
+
+        # SMTP dispatcher (see utils/mailutils.py): number of concurrent
+        # sessions, mails delivered on each session and minimum interval
+        # between two mails addressed to the same domain
+        self.smtp_sessions = 4
+        self.smtp_session_mails = 10
+        self.mail_domain_interval = 1 # seconds
+
         reactor.addSystemEventTrigger('after', 'shutdown', self.orm_tp.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', self.orm_ro_tp.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', self.kdf_tp.stop)
+        reactor.addSystemEventTrigger('after', 'shutdown', self.pgp_tp.stop)
         self.orm_tp.start()
+        self.orm_ro_tp.start()
+        self.kdf_tp.start()
+        self.pgp_tp.start()
 
     def increment_mail_counter(self, receiver_id):
         if receiver_id in self.mail_counters:
@@ -296,7 +352,7 @@ class GLSettingssClass(object):
         self.db_schema = os.path.join(self.static_db_source, 'sqlite.sql')
         self.db_file_name = 'glbackend-%d.db' % DATABASE_VERSION
         self.db_file_path = os.path.join(os.path.abspath(os.path.join(self.db_path, self.db_file_name)))
-        self.db_uri = 'sqlite:' + self.db_file_path + '?foreign_keys=ON'
+        self.db_uri = 'sqlite:' + self.db_file_path + '?foreign_keys=ON&journal_mode=WAL'
 
         self.logfile = os.path.abspath(os.path.join(self.log_path, 'globaleaks.log'))
         self.httplogfile = os.path.abspath(os.path.join(self.log_path, "http.log"))
@@ -396,6 +452,24 @@ class GLSettingssClass(object):
 
         self.socks_host = self.cmdline_options.socks_host
 
+        if self.cmdline_options.orm_ro_threads < 0:
+            print "Invalid number of ORM reader threads: %d" % self.cmdline_options.orm_ro_threads
+            quit(-1)
+        self.orm_ro_threads = self.cmdline_options.orm_ro_threads
+        self.orm_ro_tp.adjustPoolsize(0, max(self.orm_ro_threads, 1))
+
+        if self.cmdline_options.kdf_threads < 1:
+            print "Invalid number of KDF threads: %d" % self.cmdline_options.kdf_threads
+            quit(-1)
+        self.kdf_threads = self.cmdline_options.kdf_threads
+        self.kdf_tp.adjustPoolsize(0, self.kdf_threads)
+
+        if self.cmdline_options.pgp_threads < 1:
+            print "Invalid number of PGP threads: %d" % self.cmdline_options.pgp_threads
+            quit(-1)
+        self.pgp_threads = self.cmdline_options.pgp_threads
+        self.pgp_tp.adjustPoolsize(0, self.pgp_threads)
+
         if not self.validate_port(self.cmdline_options.socks_port):
             quit(-1)
         self.socks_port = self.cmdline_options.socks_port
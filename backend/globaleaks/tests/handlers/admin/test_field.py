@@ -116,7 +116,7 @@ class TestFieldInstance(helpers.TestHandler):
             values['step_id'] = yield get_step_id(context['id'])
             wrong_sample_field.update(type='nonexistingfieldtype')
             handler = self.request(wrong_sample_field, role='admin')
-            self.assertFailure(handler.put(field['id']), errors.InvalidInputFormat)
+            yield self.assertFailure(handler.put(field['id']), errors.InvalidInputFormat)
 
         @inlineCallbacks
         def test_delete(self):
@@ -133,7 +133,7 @@ class TestFieldInstance(helpers.TestHandler):
             yield handler.delete(field['id'])
             self.assertEqual(handler.get_status(), 200)
             # second deletion operation should fail
-            self.assertFailure(handler.delete(field['id']), errors.FieldIdNotFound)
+            yield self.assertFailure(handler.delete(field['id']), errors.FieldIdNotFound)
 
 
 class TestFieldTemplateInstance(helpers.TestHandlerWithPopulatedDB):
@@ -185,7 +185,7 @@ class TestFieldTemplateInstance(helpers.TestHandlerWithPopulatedDB):
             wrong_sample_field = self.get_dummy_field()
             wrong_sample_field.update(type='nonexistingfieldtype')
             handler = self.request(wrong_sample_field, role='admin')
-            self.assertFailure(handler.put(field['id']), errors.InvalidInputFormat)
+            yield self.assertFailure(handler.put(field['id']), errors.InvalidInputFormat)
 
         @inlineCallbacks
         def test_put_2(self):
@@ -216,14 +216,14 @@ class TestFieldTemplateInstance(helpers.TestHandlerWithPopulatedDB):
             generalities_fieldgroup = yield self._get_field(generalities_fieldgroup_id)
             self.responses[0]['children'] = [generalities_fieldgroup]
             handler = self.request(self.responses[0], role='admin')
-            self.assertFailure(handler.put(generalities_fieldgroup_id), errors.InvalidInputFormat)
+            yield self.assertFailure(handler.put(generalities_fieldgroup_id), errors.InvalidInputFormat)
 
             # a field not of type 'fieldgroup' MUST never have children.
             yield handler.get(name_field_id)
             sex_field = yield self._get_field(sex_field_id)
             self.responses[2]['children'] = [sex_field]
             handler = self.request(self.responses[2], role='admin')
-            self.assertFailure(handler.put(name_field_id), errors.InvalidInputFormat)
+            yield self.assertFailure(handler.put(name_field_id), errors.InvalidInputFormat)
 
             children = yield self._get_children(sex_field_id)
             self.assertNotIn(name_field_id, children)
@@ -241,7 +241,7 @@ class TestFieldTemplateInstance(helpers.TestHandlerWithPopulatedDB):
             yield handler.delete(field['id'])
             self.assertEqual(handler.get_status(), 200)
             # second deletion operation should fail
-            self.assertFailure(handler.delete(field['id']), errors.FieldIdNotFound)
+            yield self.assertFailure(handler.delete(field['id']), errors.FieldIdNotFound)
 
 
 class TestFieldTemplatesCollection(helpers.TestHandlerWithPopulatedDB):
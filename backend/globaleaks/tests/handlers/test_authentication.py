@@ -84,7 +84,7 @@ class TestAuthentication(helpers.TestHandlerWithPopulatedDB):
             'password': 'globaleaks'
         }, headers={'X-Tor2Web': 'whatever'})
         GLSettings.memory_copy.tor2web_access['admin'] = False
-        self.assertFailure(handler.post(), errors.TorNetworkRequired)
+        return self.assertFailure(handler.post(), errors.TorNetworkRequired)
 
     @inlineCallbacks
     def test_successful_logout(self):
@@ -203,7 +203,7 @@ class TestReceiptAuth(helpers.TestHandlerWithPopulatedDB):
             'receipt': self.dummySubmission['receipt']
         }, headers={'X-Tor2Web': 'whatever'})
         GLSettings.memory_copy.tor2web_access['whistleblower'] = False
-        self.assertFailure(handler.post(), errors.TorNetworkRequired)
+        yield self.assertFailure(handler.post(), errors.TorNetworkRequired)
 
     @inlineCallbacks
     def test_successful_whistleblower_logout(self):
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 import json
+import os
+
+from StringIO import StringIO
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.test import proto_helpers
 from twisted.trial import unittest
 
 from globaleaks.handlers import base
 from globaleaks.rest.errors import InvalidInputFormat
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import deferred_sleep
 
 
 class MockHandler(base.BaseHandler):
@@ -15,6 +20,78 @@ class MockHandler(base.BaseHandler):
         pass
 
 
+class MockConnection(object):
+    def __init__(self):
+        self.transport = proto_helpers.StringTransport()
+
+
+class MockRequest(object):
+    def __init__(self):
+        self.connection = MockConnection()
+
+
+class MockStreamingHandler(object):
+    def __init__(self):
+        self.request = MockRequest()
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def flush(self):
+        pass
+
+
+class TestFileProducer(unittest.TestCase):
+    data = os.urandom(GLSettings.file_chunk_size * 10 + 1)
+
+    @inlineCallbacks
+    def test_file_is_streamed_in_chunks(self):
+        handler = MockStreamingHandler()
+        yield base.FileProducer(handler, StringIO(self.data)).start()
+        self.assertEqual(len(handler.chunks), 11)
+        self.assertEqual(''.join(handler.chunks), self.data)
+        self.assertEqual(handler.request.connection.transport.producer, None)
+
+    @inlineCallbacks
+    def test_paused_producer_does_not_write(self):
+        handler = MockStreamingHandler()
+        producer = base.FileProducer(handler, StringIO(self.data))
+        d = producer.start()
+        producer.pauseProducing()
+        yield deferred_sleep(0.1)
+        self.assertEqual(handler.chunks, [])
+
+        producer.resumeProducing()
+        yield d
+        self.assertEqual(''.join(handler.chunks), self.data)
+
+    @inlineCallbacks
+    def test_stop_producing(self):
+        handler = MockStreamingHandler()
+        fd = StringIO(self.data)
+        producer = base.FileProducer(handler, fd)
+        d = producer.start()
+        producer.stopProducing()
+        yield d
+        self.assertTrue(fd.closed)
+        self.assertEqual(handler.chunks, [])
+
+
+class FailingProducer(base.ChunkProducer):
+    def read_chunk(self):
+        raise IOError
+
+
+class TestChunkProducer(unittest.TestCase):
+    def test_read_failure(self):
+        handler = MockStreamingHandler()
+        d = FailingProducer(handler).start()
+        self.assertFailure(d, IOError)
+        d.addCallback(lambda _: self.assertEqual(handler.request.connection.transport.producer, None))
+        return d
+
+
 class TestValidate(unittest.TestCase):
     _handler = base.BaseHandler
     def test_validate_jmessage_valid(self):
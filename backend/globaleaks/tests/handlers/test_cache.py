@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import gzip
+import json
+
+from StringIO import StringIO
+
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.orm import transact
@@ -18,6 +23,26 @@ class TestGLApiCache(helpers.TestGL):
     def mario(store, arg1, arg2, arg3):
         return arg1 + " " + arg2 + " " + arg3
 
+    @staticmethod
+    @transact
+    def nothing(store):
+        return None
+
+    @staticmethod
+    @transact
+    def db_get_mario(store, arg):
+        return GLApiCache.db_get(store, "passante_di_professione", "it", lambda store, x: x, arg)
+
+    @staticmethod
+    @transact
+    def db_get_mario_invalidated(store, arg):
+        def mario(store, x):
+            # an invalidation concurrent to the transaction
+            GLApiCache.invalidate("passante_di_professione")
+            return x
+
+        return GLApiCache.db_get(store, "passante_di_professione", "it", mario, arg)
+
     @inlineCallbacks
     def test_get(self):
         self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
@@ -48,3 +73,45 @@ class TestGLApiCache(helpers.TestGL):
         self.assertEqual(pdp_it, "come una catapulta!")
         yield GLApiCache.invalidate("passante_di_professione")
         self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
+
+    @inlineCallbacks
+    def test_db_get(self):
+        self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
+        pdp_it = yield self.db_get_mario("come una catapulta!")
+        self.assertEqual(pdp_it, "come una catapulta!")
+        pdp_it = yield self.db_get_mario("already cached")
+        self.assertEqual(pdp_it, "come una catapulta!")
+        GLApiCache.invalidate("passante_di_professione")
+        pdp_it = yield self.db_get_mario("ma io ho visto tutto!")
+        self.assertEqual(pdp_it, "ma io ho visto tutto!")
+
+    @inlineCallbacks
+    def test_db_get_invalidated(self):
+        pdp_it = yield self.db_get_mario_invalidated("come una catapulta!")
+        self.assertEqual(pdp_it, "come una catapulta!")
+        self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
+
+    @inlineCallbacks
+    def test_get_response(self):
+        self.assertTrue("passante_di_professione" not in GLApiCache.response_cache_dict)
+        pdp_it = yield GLApiCache.get_response("passante_di_professione", "it", self.mario, "come", "una", "catapulta!")
+        self.assertEqual(pdp_it.value, "come una catapulta!")
+        self.assertEqual(json.loads(pdp_it.body), "come una catapulta!")
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(pdp_it.gzip_body)).read(), pdp_it.body)
+
+        pdp_it_again = yield GLApiCache.get_response("passante_di_professione", "it", self.mario, "already", "cached")
+        self.assertTrue(pdp_it_again is pdp_it)
+
+        yield GLApiCache.set("passante_di_professione", "it", "ma io ho visto tutto!")
+        pdp_it_set = yield GLApiCache.get_response("passante_di_professione", "it", self.mario, "already", "cached")
+        self.assertEqual(pdp_it_set.value, "ma io ho visto tutto!")
+        self.assertNotEqual(pdp_it_set.etag, pdp_it.etag)
+
+        GLApiCache.invalidate("passante_di_professione")
+        self.assertTrue("passante_di_professione" not in GLApiCache.response_cache_dict)
+
+    @inlineCallbacks
+    def test_get_response_none(self):
+        response = yield GLApiCache.get_response("passante_di_professione", "it", self.nothing)
+        self.assertEqual(response.value, None)
+        self.assertTrue("passante_di_professione" not in GLApiCache.response_cache_dict)
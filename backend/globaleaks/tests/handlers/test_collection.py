@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import shutil
+import zipfile
+
+from StringIO import StringIO
 
 from twisted.internet.defer import inlineCallbacks
 
@@ -29,6 +32,11 @@ class TestCollectionDownload(helpers.TestHandlerWithPopulatedDB):
         rtips_desc = yield self.get_rtips()
 
         for rtip_desc in rtips_desc:
+            self.responses = []
             handler = self.request({}, role='receiver')
             handler.current_user.user_id = rtip_desc['receiver_id']
             yield handler.post(rtip_desc['rtip_id'])
+
+            archive = zipfile.ZipFile(StringIO(''.join(self.responses)))
+            self.assertEqual(archive.testzip(), None)
+            self.assertTrue('COLLECTION_INFO.txt' in archive.namelist())
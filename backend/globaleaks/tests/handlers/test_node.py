@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
+import gzip
 import json
 
+from StringIO import StringIO
+
 from twisted.internet.defer import inlineCallbacks
+from globaleaks import models
+from globaleaks.orm import transact_ro
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
 from globaleaks.handlers import node, admin
@@ -17,7 +22,7 @@ class TestNodeInstance(helpers.TestHandlerWithPopulatedDB):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.NodeDesc)
+        self._handler.validate_message(self.responses[0], requests.NodeDesc)
 
 
 class TestAhmiaDescriptionHandler(helpers.TestHandlerWithPopulatedDB):
@@ -47,7 +52,7 @@ class TestAhmiaDescriptionHandler(helpers.TestHandlerWithPopulatedDB):
         yield handler.get()
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.AhmiaDesc)
+        self._handler.validate_message(self.responses[0], requests.AhmiaDesc)
 
 
 class TestContextsCollection(helpers.TestHandlerWithPopulatedDB):
@@ -60,7 +65,40 @@ class TestContextsCollection(helpers.TestHandlerWithPopulatedDB):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.ContextCollectionDesc)
+        self._handler.validate_message(self.responses[0], requests.ContextCollectionDesc)
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request({}, role='admin')
+        yield handler.get()
+
+        etag = handler._headers['Etag']
+
+        handler = self.request({}, role='admin', headers={'If-None-Match': etag})
+        yield handler.get()
+
+        self.assertEqual(handler.get_status(), 304)
+        self.assertEqual(len(self.responses), 1)
+
+    @inlineCallbacks
+    def test_get_gzip(self):
+        handler = self.request({}, role='admin')
+        yield handler.get()
+
+        handler = self.request({}, role='admin', headers={'Accept-Encoding': 'gzip, deflate'})
+        handler.request.version = 'HTTP/1.1'
+        yield handler.get()
+
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(self.responses), 2)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(self.responses[1])).read(), self.responses[0])
+
+        # the plain body is sent to the HTTP/1.0 clients
+        handler = self.request({}, role='admin', headers={'Accept-Encoding': 'gzip'})
+        yield handler.get()
+
+        self.assertFalse('Content-Encoding' in handler._headers)
+        self.assertEqual(self.responses[2], self.responses[0])
 
 
 class TestReceiversCollection(helpers.TestHandlerWithPopulatedDB):
@@ -73,4 +111,63 @@ class TestReceiversCollection(helpers.TestHandlerWithPopulatedDB):
 
         self.assertTrue(isinstance(self.responses, list))
         self.assertEqual(len(self.responses), 1)
-        self._handler.validate_message(json.dumps(self.responses[0]), requests.ReceiverCollectionDesc)
+        self._handler.validate_message(self.responses[0], requests.ReceiverCollectionDesc)
+
+
+class TestQuestionnaireTree(helpers.TestGLWithPopulatedDB):
+    def assertTreeMatchesReferences(self, store, tree):
+        # the children are compared in order as the questionnaire hash depends on it
+        for context_id, steps in tree.steps.items():
+            context = store.find(models.Context, models.Context.id == context_id).one()
+            self.assertEqual([s.id for s in context.steps], [s.id for s in steps])
+
+            for step in steps:
+                self.assertEqual([f.id for f in step.children],
+                                 [f.id for f in tree.step_children[step.id]])
+
+        for field in tree.fields.values():
+            self.assertEqual([f.id for f in field.children],
+                             [f.id for f in tree.field_children[field.id]])
+            self.assertEqual([a.id for a in field.attrs],
+                             [a.id for a in tree.attrs[field.id]])
+            self.assertEqual([o.id for o in field.options],
+                             [o.id for o in tree.options[field.id]])
+            self.assertEqual([o.id for o in field.activated_by_options],
+                             tree.field_activations[field.id])
+
+            if field.template_id:
+                self.assertTrue(field.template_id in tree.fields)
+
+            for option in field.options:
+                self.assertEqual([f.id for f in option.activated_fields],
+                                 tree.option_activations[option.id])
+
+    @inlineCallbacks
+    def test_tree_matches_references(self):
+        yield self.check_trees()
+
+    @transact_ro
+    def check_trees(self, store):
+        self.assertTreeMatchesReferences(store, node.QuestionnaireTree(store))
+
+        for context in store.find(models.Context):
+            tree = node.QuestionnaireTree(store, [context.id])
+            self.assertEqual(set(s.id for s in context.steps), set(s.id for s in tree.steps[context.id]))
+            self.assertTreeMatchesReferences(store, tree)
+
+            # only the fields of the questionnaire of the context are loaded
+            fields = [f for s in context.steps for f in s.children]
+            reachable = set()
+            while fields:
+                field = fields.pop()
+                reachable.add(field.id)
+                fields.extend(field.children)
+                if field.template_id:
+                    fields.append(field.template)
+
+            self.assertEqual(set(tree.fields), reachable)
+
+        templates = store.find(models.Field, models.Field.instance == u'template')
+        tree = node.QuestionnaireTree(store, [], field_ids=[f.id for f in templates])
+        self.assertEqual(tree.steps, {})
+        self.assertTreeMatchesReferences(store, tree)
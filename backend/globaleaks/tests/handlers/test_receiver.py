@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
+import copy
 import unittest
 import random
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.handlers import receiver, admin
+from globaleaks.models import InternalTip
+from globaleaks.orm import transact
 from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
@@ -29,6 +33,12 @@ class TestUserInstance(helpers.TestHandlerWithPopulatedDB):
         yield handler.put()
 
 
+@transact
+def set_tips_context(store, context_id, count):
+    for itip in store.find(InternalTip)[:count]:
+        itip.context_id = context_id
+
+
 class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsCollection
 
@@ -42,6 +52,62 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
         yield handler.get()
 
+    @inlineCallbacks
+    def test_get_page(self):
+        for _ in xrange(3):
+            yield self.perform_full_submission_actions()
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.arguments = {'limit': ['2'], 'offset': ['1'],
+                                     'sort': ['progressive'], 'order': ['asc']}
+        yield handler.get()
+
+        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        progressives = sorted(rtip['progressive'] for rtip in rtips)
+
+        self.assertEqual([rtip['progressive'] for rtip in self.responses[0]], progressives[1:3])
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.arguments = {'sort': ['context'], 'order': ['asc']}
+        yield handler.get()
+
+        context_names = [rtip['context_name'] for rtip in self.responses[1]]
+        self.assertEqual(len(context_names), len(rtips))
+        self.assertEqual(context_names, sorted(context_names))
+
+    @inlineCallbacks
+    def test_get_page_sorted_by_context(self):
+        for _ in xrange(3):
+            yield self.perform_full_submission_actions()
+
+        context = copy.deepcopy(self.dummyContext)
+        context['name'] = u'A context sorted first'
+        context = yield admin.context.create_context(context, 'en')
+        yield set_tips_context(context['id'], 2)
+
+        for order, first in [('asc', context['name']), ('desc', self.dummyContext['name'])]:
+            handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+            handler.request.arguments = {'sort': ['context'], 'order': [order], 'limit': ['1']}
+            yield handler.get()
+
+            self.assertEqual(self.responses[-1][0]['context_name'], first)
+
+    @inlineCallbacks
+    def test_get_default_limit(self):
+        yield self.perform_full_submission_actions()
+        self.patch(GLSettings, 'receiver_tips_page_limit', 1)
+
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        yield handler.get()
+
+        self.assertEqual(len(self.responses[0]), 1)
+        self.assertEqual(handler._headers['X-Total-Count'], '2')
+
+    def test_get_invalid_page(self):
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.arguments = {'limit': ['0']}
+        return self.assertFailure(handler.get(), errors.InvalidInputFormat)
+
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsOperations
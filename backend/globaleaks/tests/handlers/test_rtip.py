@@ -154,7 +154,7 @@ class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
         for rtip_desc in rtips_desc:
             handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'])
 
-            self.assertFailure(handler.delete("unexistent_tip"), errors.TipIdNotFound)
+            yield self.assertFailure(handler.delete("unexistent_tip"), errors.TipIdNotFound)
 
     @inlineCallbacks
     def test_delete_existent_tip_by_existent_and_logged_but_wrong_receiver(self):
@@ -163,7 +163,7 @@ class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
         for rtip_desc in rtips_desc:
             handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'])
 
-            self.assertFailure(handler.delete("unexistent_tip"), errors.TipIdNotFound)
+            yield self.assertFailure(handler.delete("unexistent_tip"), errors.TipIdNotFound)
 
 
 class TestRTipCommentCollection(helpers.TestHandlerWithPopulatedDB):
@@ -8,9 +8,11 @@ from globaleaks.jobs import delivery_sched
 from globaleaks.handlers import authentication, wbtip
 from globaleaks.handlers.admin.context import get_context_steps
 from globaleaks.handlers.admin.receiver import create_receiver
-from globaleaks.handlers.submission import create_whistleblower_tip, SubmissionInstance
+from globaleaks.handlers.submission import create_whistleblower_tip, SubmissionInstance, \
+    ArchivedSchemaCache, db_get_archived_questionnaire_schema
 from globaleaks.models import InternalTip
 from globaleaks.rest import errors
+from globaleaks.rest.apicache import GLApiCache
 from globaleaks.tests import helpers
 from globaleaks.utils.token import Token
 
@@ -18,6 +20,12 @@ from globaleaks.utils.token import Token
 from globaleaks.handlers.submission import create_submission
 
 
+@transact_ro
+def get_archived_questionnaire_schema(store, language):
+    itip = store.find(InternalTip).any()
+    return db_get_archived_questionnaire_schema(store, itip.questionnaire_hash, language)
+
+
 class TestSubmission(helpers.TestGLWithPopulatedDB):
     encryption_scenario = 'ALL_PLAINTEXT'
 
@@ -61,6 +69,51 @@ class TestSubmission(helpers.TestGLWithPopulatedDB):
 
         self.assertTrue('answers' in wbtip_desc)
 
+    @inlineCallbacks
+    def test_archived_schema_cache(self):
+        self.submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
+        self.submission_desc = yield self.create_submission(self.submission_desc)
+
+        # the localized schema is cached and shared by the following requests
+        schema_en_1 = yield get_archived_questionnaire_schema('en')
+        schema_en_2 = yield get_archived_questionnaire_schema('en')
+        schema_it = yield get_archived_questionnaire_schema('it')
+        self.assertTrue(schema_en_1 is schema_en_2)
+        self.assertFalse(schema_en_1 is schema_it)
+
+    @inlineCallbacks
+    def test_compiled_questionnaire(self):
+        self.submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
+        yield self.create_submission(self.submission_desc)
+
+        # the questionnaire is compiled once for the context
+        compiled = GLApiCache.memory_cache_dict['questionnaire'][self.dummyContext['id']]
+
+        self.submission_desc = yield self.get_dummy_submission(self.dummyContext['id'])
+        yield self.create_submission(self.submission_desc)
+        self.assertTrue(GLApiCache.memory_cache_dict['questionnaire'][self.dummyContext['id']] is compiled)
+
+        @transact_ro
+        def get_questionnaire_hashes(store):
+            return set(itip.questionnaire_hash for itip in store.find(InternalTip))
+
+        hashes = yield get_questionnaire_hashes()
+        self.assertTrue(compiled['hash'] in hashes)
+
+    def test_archived_schema_cache_eviction(self):
+        cache = ArchivedSchemaCache()
+        cache.max_schemas = 2
+
+        cache.set(('a', u'preview', 'en'), [1])
+        cache.set(('b', u'preview', 'en'), [2])
+        cache.get(('a', u'preview', 'en'))
+        cache.set(('c', u'preview', 'en'), [3])
+
+        # the least recently used schema is evicted
+        self.assertEqual(cache.get(('b', u'preview', 'en')), None)
+        self.assertEqual(cache.get(('a', u'preview', 'en')), [1])
+        self.assertEqual(cache.get(('c', u'preview', 'en')), [3])
+
     @inlineCallbacks
     def test_create_receiverfiles_allow_unencrypted_true_no_keys_loaded(self):
         yield self.test_create_submission_attach_files_finalize_and_access_wbtip()
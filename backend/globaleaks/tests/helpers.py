@@ -104,6 +104,7 @@ def init_glsettings_for_unit_tests():
     GLSettings.ramdisk_path = os.path.join(GLSettings.working_path, 'ramdisk')
 
     GLSettings.eval_paths()
+    security.GLBPGPCache.invalidate()
     GLSettings.remove_directories()
     GLSettings.create_directories()
 
@@ -181,6 +182,7 @@ class TestGL(unittest.TestCase):
         anomaly.Alarm.reset()
         event.EventTrackQueue.reset()
         statistics_sched.StatisticsSchedule.reset()
+        GLApiCache.invalidate()
 
         self.internationalized_text = load_appdata()['node']['whistleblowing_button']
 
@@ -611,9 +613,14 @@ class TestHandler(TestGLWithPopulatedDB):
                 self.responses.append(response)
 
 
+        def mock_flush(cls, include_footers=False):
+            pass
+
         self._handler.write = mock_write
         # we make the assumption that we will always use call finish on write.
         self._handler.finish = mock_write
+        # streamed responses flush every chunk written
+        self._handler.flush = mock_flush
 
         # we need to reset settings.session to keep each test independent
         GLSettings.sessions = dict()
@@ -1,11 +1,120 @@
 # -*- coding: utf-8 -*-
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet import task
+from twisted.internet.defer import inlineCallbacks, Deferred
 
 from globaleaks.tests import helpers
 
 from globaleaks.jobs import base
+from globaleaks.jobs.wakeup import WorkBus
+
+
+class CountingJob(base.GLJob):
+    def __init__(self):
+        base.GLJob.__init__(self)
+        self.clock = task.Clock()
+        self.executions = 0
+        self.pending = None
+
+    def operation(self):
+        self.executions += 1
+        if self.pending is not None:
+            return self.pending
+
 
 class TestGLJob(helpers.TestGLWithPopulatedDB):
     @inlineCallbacks
     def test_base_scheduler(self):
         yield base.GLJob()._operation()
+
+    def test_wakeup(self):
+        job = CountingJob()
+
+        # the wakeup of a job not yet started is ignored
+        job.wakeup()
+        job.start(300, False)
+        self.assertEqual(job.executions, 0)
+
+        job.wakeup()
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 1)
+
+        # the periodic execution is kept as a safety net
+        job.clock.advance(600)
+        self.assertEqual(job.executions, 2)
+
+        job.stop()
+
+    def test_wakeup_keeps_interval(self):
+        job = CountingJob()
+        job.start(300, False)
+
+        for _ in range(10):
+            job.clock.advance(10)
+            job.wakeup()
+            job.clock.advance(0)
+
+        self.assertEqual(job.executions, 10)
+
+        # the periodic execution is still performed at t=300
+        job.clock.advance(300 - job.clock.seconds())
+        self.assertEqual(job.executions, 11)
+
+        job.clock.advance(300)
+        self.assertEqual(job.executions, 12)
+
+        job.stop()
+
+    def test_wakeup_after_restart(self):
+        job = CountingJob()
+        job.start(300, False)
+
+        job.wakeup()
+        job.stop()
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 0)
+
+        job.start(300, False)
+        job.wakeup()
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 1)
+
+        job.stop()
+
+    def test_wakeup_while_running(self):
+        job = CountingJob()
+        job.start(300, False)
+
+        job.pending = Deferred()
+        job.wakeup()
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 1)
+
+        # the job is executed again after the current execution
+        job.wakeup()
+        d, job.pending = job.pending, None
+        d.callback(None)
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 2)
+
+        job.stop()
+
+    def test_workbus_signal(self):
+        bus = WorkBus()
+        job = CountingJob()
+        job.start(300, False)
+
+        bus.register('delivery', job)
+        bus.signal('notification')
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 0)
+
+        bus.signal('delivery', 'notification')
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 1)
+
+        bus.unregister('delivery')
+        bus.signal('delivery')
+        job.clock.advance(0)
+        self.assertEqual(job.executions, 1)
+
+        job.stop()
@@ -0,0 +1,55 @@
+from storm import tracer
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.tests import helpers
+
+from globaleaks.jobs.delivery_sched import DeliverySchedule, receiverfile_planning
+
+
+class SelectCounter(tracer.BaseStatementTracer):
+    count = 0
+
+    def _expanded_raw_execute(self, connection, raw_cursor, statement):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.count += 1
+
+
+class TestDeliverySchedule(helpers.TestGLWithPopulatedDB):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGLWithPopulatedDB.setUp(self)
+        self.perform_submission_start()
+        yield self.perform_submission_uploads()
+        yield self.perform_submission_actions()
+
+    @inlineCallbacks
+    def test_receiverfile_planning(self):
+        counter = SelectCounter()
+        tracer.install_tracer(counter)
+        try:
+            receiverfiles_maps = yield receiverfile_planning()
+        finally:
+            tracer.remove_tracer(counter)
+
+        self.assertEqual(len(receiverfiles_maps), 10)
+
+        # the number of queries does not depend on the number of files
+        self.assertTrue(counter.count < len(receiverfiles_maps))
+
+        receivers = {}
+        for receiverfiles_map in receiverfiles_maps.values():
+            self.assertEqual(len(receiverfiles_map['rfiles']), len(self.dummyContext['receivers']))
+
+            for rfile in receiverfiles_map['rfiles']:
+                # each receiver is serialized only once
+                receiver = receivers.setdefault(rfile['receiver']['id'], rfile['receiver'])
+                self.assertIs(receiver, rfile['receiver'])
+
+        self.assertEqual(set(receivers.keys()), set(self.dummyContext['receivers']))
+
+    @inlineCallbacks
+    def test_delivery_schedule(self):
+        yield DeliverySchedule().operation()
+
+        receiverfiles_maps = yield receiverfile_planning()
+        self.assertEqual(len(receiverfiles_maps), 0)
@@ -1,11 +1,41 @@
+from cyclone.util import ObjectDict as OD
+from datetime import timedelta
+
 from twisted.internet.defer import inlineCallbacks
 
+from globaleaks.models import EventLogs, ReceiverFile
+from globaleaks.orm import transact_ro
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 
-from globaleaks.jobs.mailflush_sched import MailflushSchedule
-from globaleaks.jobs.notification_sched import NotificationSchedule
+from globaleaks.jobs.mailflush_sched import MailflushSchedule, load_outbox, update_outbox, \
+    aggregate_notification_events, load_complete_events
+from globaleaks.jobs.notification_sched import NotificationSchedule, TipEventLogger, FileEventLogger
+from globaleaks.notification import MailNotification
+from globaleaks.utils.mailutils import schedule_email
+from globaleaks.utils.utility import datetime_now
+
+
+@transact_ro
+def get_events_descriptions(store):
+    return [e.description for e in store.find(EventLogs)]
+
+
+@transact_ro
+def get_events_count(store, trigger):
+    return store.find(EventLogs, EventLogs.title == trigger).count()
+
+
+@transact_ro
+def get_receiverfiles_count(store):
+    return store.find(ReceiverFile).count()
+
+
+@transact_ro
+def get_pending_receiverfiles(store):
+    return [(f.internalfile.creation_date, f.id) for f in store.find(ReceiverFile, ReceiverFile.new == True)]
 
 
 class TestNotificationSchedule(helpers.TestGLWithPopulatedDB):
@@ -16,12 +46,159 @@ class TestNotificationSchedule(helpers.TestGLWithPopulatedDB):
 
     @inlineCallbacks
     def test_notification_schedule(self):
+        self.patch(GLSettings, 'notification_digest_window', 0)
+
         yield DeliverySchedule().operation()
         yield NotificationSchedule().operation()
 
-        mail_schedule = MailflushSchedule()
-        mail_schedule.skip_sleep = True
-        yield mail_schedule.operation()
+        yield MailflushSchedule().operation()
+
+        # the mails stored in the outbox have been flushed
+        mails = yield load_outbox()
+        self.assertEqual(mails, [])
 
         # TODO to be completed with real tests.
         #      now we simply perform operations to raise code coverage
+
+    @inlineCallbacks
+    def test_digest_notification(self):
+        self.patch(GLSettings, 'notification_digest_window', 0)
+
+        yield DeliverySchedule().operation()
+        yield NotificationSchedule().operation()
+
+        events, _ = yield load_complete_events()
+        aggregated, _ = aggregate_notification_events(events)
+
+        digests = [e for e in aggregated if e.type == u'digest']
+        self.assertTrue(len(digests))
+
+        for digest in digests:
+            yield MailNotification().do_notify(digest)
+
+        mails = yield load_outbox()
+        self.assertEqual(len(mails), len(digests))
+
+        # the events aggregated in the digests are marked as notified
+        events, _ = yield load_complete_events()
+        self.assertEqual(len(events), len(aggregated) - len(digests))
+
+    @inlineCallbacks
+    def test_held_receivers(self):
+        yield DeliverySchedule().operation()
+        yield NotificationSchedule().operation()
+
+        # the events just created are held within the digest window
+        events, delay = yield load_complete_events()
+        self.assertEqual(events, [])
+        self.assertTrue(0 < delay <= GLSettings.notification_digest_window)
+
+    @inlineCallbacks
+    def test_compact_events(self):
+        yield DeliverySchedule().operation()
+        yield NotificationSchedule().operation()
+
+        descriptions = yield get_events_descriptions()
+        self.assertTrue(len(descriptions))
+
+        # the receiver is referenced by the event and not stored within it
+        for description in descriptions:
+            self.assertFalse('receiver_info' in description)
+            self.assertFalse('questionnaire' in description['tip_info'])
+            self.assertEqual(set(description['context_info'].keys()), set(['id', 'name']))
+
+    @inlineCallbacks
+    def test_adaptive_batches(self):
+        self.patch(GLSettings, 'jobs_operation_limit', 1)
+
+        # the two tips are drained in batches of increasing size
+        processed = yield TipEventLogger().process_events()
+        self.assertEqual(processed, 2)
+
+    @inlineCallbacks
+    def test_backlog_without_loss(self):
+        self.patch(GLSettings, 'jobs_operation_limit', 1)
+
+        yield DeliverySchedule().operation()
+
+        # under backlog every file of the same tip is still notified
+        yield FileEventLogger().process_events()
+
+        files_count = yield get_receiverfiles_count()
+        events_count = yield get_events_count(u'File')
+        self.assertTrue(files_count > 1)
+        self.assertEqual(events_count, files_count)
+
+    @inlineCallbacks
+    def test_backlog_suppression(self):
+        self.patch(GLSettings, 'jobs_operation_limit', 1)
+        self.patch(GLSettings, 'notification_max_latency', 0)
+
+        # the time budget is exhausted by the first batch and the backlog
+        # could not be drained within the latency budget
+        processed = yield TipEventLogger().process_events(0)
+        self.assertEqual(processed, -1)
+
+        processed = yield TipEventLogger().process_events()
+        self.assertEqual(processed, 0)
+
+    @inlineCallbacks
+    def test_suppress_oldest_events(self):
+        yield DeliverySchedule().operation()
+
+        pending = yield get_pending_receiverfiles()
+        self.assertTrue(len(pending) > 1)
+
+        # only the newest pending event is kept
+        yield FileEventLogger().suppress_events(len(pending) - 1)
+        left = yield get_pending_receiverfiles()
+        self.assertEqual(left, [max(pending)])
+
+
+class TestDigest(helpers.TestGL):
+    def get_event(self, receiver_id, seconds_ago):
+        event = OD()
+        event.type = u'tip'
+        event.notification_settings = {}
+        event.node_info = {}
+        event.receiver_info = {'id': receiver_id}
+        event.creation_date = datetime_now() - timedelta(seconds=seconds_ago)
+        event.orm_id = receiver_id + str(seconds_ago)
+        return event
+
+    def test_aggregate_notification_events(self):
+        window = GLSettings.notification_digest_window
+
+        queue = [self.get_event('a', window + 10), self.get_event('a', 0),
+                 self.get_event('b', window + 10),
+                 self.get_event('c', 10)]
+
+        aggregated, delay = aggregate_notification_events(queue)
+
+        # the events of 'a' are aggregated in a digest, the one of 'b' is
+        # notified as is and the one of 'c' is held until the window closes
+        self.assertEqual(len(aggregated), 2)
+        digest = [e for e in aggregated if e.type == u'digest'][0]
+        self.assertEqual(len(digest.subevent_info['events']), 2)
+        self.assertEqual(digest.receiver_info['id'], 'a')
+        self.assertTrue(0 < delay <= window - 10)
+
+
+class TestMailOutbox(helpers.TestGL):
+    @inlineCallbacks
+    def test_outbox_retry(self):
+        yield schedule_email(u'receiver@example.net', u'subject', u'body')
+
+        mails = yield load_outbox()
+        self.assertEqual(len(mails), 1)
+
+        # the failed mail is rescheduled in the future
+        delay = yield update_outbox([], [mails[0]['id']])
+        self.assertTrue(0 < delay <= GLSettings.mail_retry_delay)
+
+        due_mails = yield load_outbox()
+        self.assertEqual(due_mails, [])
+
+        # the mail sent is removed from the outbox
+        delay = yield update_outbox([mails[0]['id']], [])
+        self.assertEqual(delay, None)
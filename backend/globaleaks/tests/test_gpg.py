@@ -11,7 +11,8 @@ from globaleaks.handlers.admin.context import create_context, get_context_list
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.notification import Event
 from globaleaks.rest import errors
-from globaleaks.security import GLBPGP
+from globaleaks.security import GLBPGP, GLBPGPCache, GLSecureTemporaryFile, GLSecureFile, \
+    pgp_encrypt_message, run_pgp
 from globaleaks.settings import GLSettings
 from globaleaks.tests.helpers import MockDict, TestHandlerWithPopulatedDB, VALID_PGP_KEY1, VALID_PGP_KEY2, EXPIRED_PGP_KEY
 from globaleaks.utils.token import Token
@@ -156,6 +157,143 @@ class TestPGP(TestHandlerWithPopulatedDB):
 
         # TODO checks the lacking of the plaintext file!, then would be completed in absolute love
 
+    @inlineCallbacks
+    def test_submission_file_delivery_mixed(self):
+        new_context = MockDict().dummyContext
+        new_context['name'] = "this uniqueness is no more checked due to the lang"
+        new_context_output = yield create_context(new_context, 'en')
+
+        receivers = []
+        for i in range(0, 4):
+            rcvr = self.get_dummy_receiver("mixed%d" % i)
+            if i % 2:
+                rcvr['pgp_key_public'] = unicode(VALID_PGP_KEY1)
+            rcvr['contexts'] = [new_context_output['id']]
+            rcvr_output = yield receiver.create_receiver(rcvr, 'en')
+            receivers.append(rcvr_output['id'])
+
+        new_subm = dict(MockDict().dummySubmission)
+        new_subm['finalize'] = False
+        new_subm['context_id'] = new_context_output['id']
+        new_subm['receivers'] = receivers
+        new_subm['identity_provided'] = False
+        new_subm['answers'] = yield self.fill_random_answers(new_context_output['id'])
+
+        token = Token('submission')
+        token.proof_of_work = False
+        yield self.emulate_file_upload(token, 3)
+
+        new_subm_output = yield submission.create_submission(token.id, new_subm, False, 'en')
+
+        GLSettings.pgp_tp.adjustPoolsize(0, 4)
+        try:
+            yield DeliverySchedule().operation()
+        finally:
+            GLSettings.pgp_tp.adjustPoolsize(0, GLSettings.pgp_threads)
+
+        ifilist = yield self.get_internalfiles_by_wbtip(new_subm_output['id'])
+        self.assertEqual(len(ifilist), 3)
+
+        rfilist = yield self.get_receiverfiles_by_wbtip(new_subm_output['id'])
+        self.assertEqual(len(rfilist), 12)
+
+        statuses = [rfile['status'] for rfile in rfilist]
+        self.assertEqual(statuses.count(u'encrypted'), 6)
+        self.assertEqual(statuses.count(u'reference'), 6)
+
+        for rfile in rfilist:
+            self.assertTrue(os.path.exists(os.path.join(GLSettings.submission_path, rfile['file_path'])))
+
+    def test_encrypt_secure_file(self):
+        a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        a.avoid_delete()
+        a.write("Decrypt the Cat!\n" * 262144)
+        a.close()
+
+        pgpobj = GLBPGP()
+        pgpobj.load_key(VALID_PGP_KEY1)
+
+        with GLSecureFile(a.filepath) as f:
+            encrypted_file_path, encrypted_file_size = \
+                pgpobj.encrypt_file(u"CF4A22020873A76D1DCB68D32B25551568E49345",
+                                    a.filepath, f, GLSettings.submission_path)
+
+        pgpobj.destroy_environment()
+
+        self.assertEqual(encrypted_file_size, os.path.getsize(encrypted_file_path))
+
+        with file(encrypted_file_path, "r") as f:
+            self.assertSubstring('-----BEGIN PGP MESSAGE-----', f.readline())
+
+    def test_encrypt_file_with_invalid_fingerprint(self):
+        pgpobj = GLBPGP()
+        pgpobj.load_key(VALID_PGP_KEY1)
+
+        files = os.listdir(GLSettings.submission_path)
+
+        tempsource = os.path.join(GLSettings.tmp_upload_path, "temp_source.txt")
+        with file(tempsource, 'w+') as f:
+            f.write("Decrypt the Cat!\n")
+            f.seek(0)
+
+            self.assertRaises(errors.PGPKeyInvalid, pgpobj.encrypt_file,
+                              u"0000000000000000000000000000000000000000",
+                              tempsource, f, GLSettings.submission_path)
+
+        pgpobj.destroy_environment()
+
+        self.assertEqual(files, os.listdir(GLSettings.submission_path))
+
+    def test_keyring_cache_reuse(self):
+        fingerprint = u"CF4A22020873A76D1DCB68D32B25551568E49345"
+
+        with GLBPGPCache.get(VALID_PGP_KEY1, fingerprint) as pgpobj1:
+            pass
+
+        with GLBPGPCache.get(VALID_PGP_KEY1, fingerprint) as pgpobj2:
+            self.assertIs(pgpobj1, pgpobj2)
+
+        GLBPGPCache.invalidate(fingerprint)
+        self.assertFalse(os.path.exists(pgpobj1.pgph.gnupghome))
+
+        with GLBPGPCache.get(VALID_PGP_KEY1, fingerprint) as pgpobj3:
+            self.assertIsNot(pgpobj1, pgpobj3)
+
+    def test_keyring_cache_key_change(self):
+        fingerprint = u"CF4A22020873A76D1DCB68D32B25551568E49345"
+
+        with GLBPGPCache.get(VALID_PGP_KEY1, fingerprint) as pgpobj1:
+            # the keyring in use is kept until released
+            with GLBPGPCache.get(VALID_PGP_KEY2, fingerprint) as pgpobj2:
+                self.assertIsNot(pgpobj1, pgpobj2)
+                self.assertTrue(os.path.exists(pgpobj1.pgph.gnupghome))
+
+        self.assertFalse(os.path.exists(pgpobj1.pgph.gnupghome))
+        self.assertTrue(os.path.exists(pgpobj2.pgph.gnupghome))
+
+    def test_keyring_cache_import_without_lock(self):
+        fingerprint = u"CF4A22020873A76D1DCB68D32B25551568E49345"
+        load_key = GLBPGP.load_key
+
+        def check_load_key(pgp, key):
+            self.assertFalse(GLBPGPCache.lock.locked())
+            return load_key(pgp, key)
+
+        self.patch(GLBPGP, 'load_key', check_load_key)
+
+        with GLBPGPCache.get(VALID_PGP_KEY1, fingerprint) as pgpobj1:
+            with GLBPGPCache.get(VALID_PGP_KEY2, fingerprint) as pgpobj2:
+                self.assertIsNot(pgpobj1, pgpobj2)
+
+    @inlineCallbacks
+    def test_encrypt_message_in_pgp_threadpool(self):
+        encrypted_body = yield run_pgp(pgp_encrypt_message,
+                                       VALID_PGP_KEY1,
+                                       u"CF4A22020873A76D1DCB68D32B25551568E49345",
+                                       u"Decrypt the Cat!")
+
+        self.assertSubstring('-----BEGIN PGP MESSAGE-----', encrypted_body)
+
     def test_pgp_read_expirations(self):
         pgpobj = GLBPGP()
 
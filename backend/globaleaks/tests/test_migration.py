@@ -24,8 +24,11 @@ def test_dbs_migration(directory):
             os.mkdir(GLSettings.db_path)
             dbpath = os.path.join(path, f)
             shutil.copyfile(dbpath, ('%s/%s' % (GLSettings.db_path, f)))
-            check_db_files()
-            shutil.rmtree(GLSettings.db_path)
+            try:
+                # check_db_files reports a failed migration returning -1
+                assert check_db_files() != -1, 'Migration of %s failed' % dbpath
+            finally:
+                shutil.rmtree(GLSettings.db_path)
 
 
 class TestMigrationRoutines(unittest.TestCase):
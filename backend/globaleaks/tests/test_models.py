@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
-
 from storm import exceptions
+from storm.expr import State
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.orm import transact, transact_ro
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_now
 
 
 class TestModels(helpers.TestGL):
@@ -306,3 +307,45 @@ class TestField(helpers.TestGL):
 
         yield self.field_delete(self.generalities_id)
         yield self.assert_model_not_exists(models.Field, self.generalities_id)
+
+
+@transact_ro
+def query_plan(store, *args):
+    """
+    :return: the plan of the query that Storm generates for store.find(*args)
+    """
+    state = State()
+    statement = store._connection.compile(store.find(*args)._get_select(), state)
+    rows = store.execute("EXPLAIN QUERY PLAN " + statement, state.parameters).get_all()
+    return ' '.join(unicode(row[-1]) for row in rows)
+
+
+class TestIndexes(helpers.TestGLWithPopulatedDB):
+    # the queries performed by the receipt login, by the tip lists, by the
+    # cleaning and by the scheduled jobs, with the index that each one is
+    # expected to use
+    queries = [
+        ((models.ReceiverTip, models.ReceiverTip.receiver_id == u'x'), 'receivertip__receiver_id_index'),
+        ((models.ReceiverTip, models.ReceiverTip.internaltip_id == u'x'), 'receivertip__internaltip_id_index'),
+        ((models.ReceiverFile, models.ReceiverFile.receivertip_id == u'x'), 'receiverfile__receivertip_id_index'),
+        ((models.ReceiverFile, models.ReceiverFile.internalfile_id == u'x'), 'receiverfile__internalfile_id_index'),
+        ((models.ReceiverFile, models.ReceiverFile.receiver_id == u'x'), 'receiverfile__receiver_id_index'),
+        ((models.InternalFile, models.InternalFile.internaltip_id == u'x'), 'internalfile__internaltip_id_index'),
+        ((models.Comment, models.Comment.internaltip_id == u'x'), 'comment__internaltip_id_index'),
+        ((models.Message, models.Message.receivertip_id == u'x'), 'message__receivertip_id_index'),
+        ((models.WhistleblowerTip, models.WhistleblowerTip.receipt_hash == u'x'), 'whistleblowertip__receipt_hash_index'),
+        ((models.EventLogs, models.EventLogs.mail_sent == False), 'eventlogs__mail_sent_index'),
+        ((models.EventLogs, models.EventLogs.receivertip_id == u'x'), 'eventlogs__receivertip_id_index'),
+        ((models.InternalTip, models.InternalTip.expiration_date < datetime_now()), 'internaltip__expiration_date_index'),
+        ((models.ReceiverTip, models.ReceiverTip.new == True), 'receivertip__new_index'),
+        ((models.ReceiverFile, models.ReceiverFile.new == True), 'receiverfile__new_index'),
+        ((models.InternalFile, models.InternalFile.new == True), 'internalfile__new_index'),
+        ((models.Comment, models.Comment.new == True), 'comment__new_index'),
+        ((models.Message, models.Message.new == True), 'message__new_index')
+    ]
+
+    @inlineCallbacks
+    def test_query_plans(self):
+        for args, index in self.queries:
+            plan = yield query_plan(*args)
+            self.assertTrue(index in plan, "%s not using %s: %s" % (args, index, plan))
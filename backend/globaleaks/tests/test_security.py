@@ -3,9 +3,11 @@ import binascii
 import os
 import scrypt
 from cryptography.hazmat.primitives import hashes
+from twisted.internet.defer import inlineCallbacks
 from twisted.trial import unittest
 from globaleaks.tests import helpers
 from globaleaks.security import get_salt, hash_password, check_password, change_password, check_password_format, \
+    run_kdf, \
     SALT_LENGTH, \
     directory_traversal_check, GLSecureTemporaryFile, GLSecureFile, crypto_backend
 from globaleaks.settings import GLSettings
@@ -52,6 +54,27 @@ class TestPasswordManagement(unittest.TestCase):
 
         self.assertTrue(check_password(dummy_password, hashed_once, dummy_salt_input))
 
+    @inlineCallbacks
+    def test_run_kdf(self):
+        dummy_password = "focaccina"
+        dummy_salt_input = "vecna@focaccina.net"
+
+        hashed = yield run_kdf(hash_password, dummy_password, dummy_salt_input)
+        self.assertEqual(hashed, hash_password(dummy_password, dummy_salt_input))
+
+        valid = yield run_kdf(check_password, dummy_password, hashed, dummy_salt_input)
+        self.assertTrue(valid)
+
+    def test_run_kdf_overloaded(self):
+        kdf_queue_limit = GLSettings.kdf_queue_limit
+        GLSettings.kdf_queue_limit = 0
+
+        try:
+            return self.assertFailure(run_kdf(hash_password, "focaccina", "vecna@focaccina.net"),
+                                      errors.ServiceOverloaded)
+        finally:
+            GLSettings.kdf_queue_limit = kdf_queue_limit
+
     def test_change_password(self):
         dummy_salt_input = "xxxxxxxx"
         first_pass = helpers.VALID_PASSWORD1
@@ -131,6 +154,32 @@ class TestGLSecureFiles(helpers.TestGL):
         self.assertTrue(antani == b.read())
         b.close()
 
+    def test_temporary_file_readinto(self):
+        a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        a.avoid_delete()
+        antani = "0123456789" * 10000
+        a.write(antani)
+        a.close()
+
+        b = GLSecureFile(a.filepath)
+        buf = bytearray(4096)
+        data = []
+        while True:
+            n = b.readinto(buf)
+            if n == 0:
+                break
+            self.assertTrue(n <= len(buf) - b.decrypt_overhead)
+            data.append(str(buf[:n]))
+        b.close()
+
+        self.assertEqual(''.join(data), antani)
+
+    def test_temporary_file_readinto_too_small_buffer(self):
+        a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+        a.write("0123456789")
+        self.assertRaises(ValueError, a.readinto, bytearray(a.decrypt_overhead))
+        a.close()
+
     def test_temporary_file_lost_key_due_to_eventual_bug_or_reboot(self):
         a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
         a.avoid_delete()
@@ -236,7 +236,7 @@ class TestTip(helpers.TestGL):
     def receiver1_delete_tip(self):
         yield rtip.delete_rtip(self.receiver1_desc['id'], self.rtip1_id)
 
-        self.assertFailure(rtip.get_rtip(self.receiver1_desc['id'], self.rtip1_id, 'en'),
+        yield self.assertFailure(rtip.get_rtip(self.receiver1_desc['id'], self.rtip1_id, 'en'),
                            errors.TipIdNotFound)
 
         count = yield self.get_count_of_itip_using_archived_schema(self.rtip1_questionnaire_hash)
@@ -1,4 +1,7 @@
 
+import threading
+
+from twisted.internet import defer
 from twisted.internet.defer import inlineCallbacks
 from storm import exceptions
 
@@ -6,6 +9,7 @@ from globaleaks.tests import helpers
 
 from globaleaks.orm import transact, transact_ro
 from globaleaks.models import *
+from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import datetime_null
 
 class TestTransaction(helpers.TestGL):
@@ -118,3 +122,27 @@ class TestTransaction(helpers.TestGL):
     def test_transact_ro(self):
         created_id = yield self._transact_ro_add_context()
         yield self._transact_ro_context_bla_bla(created_id)
+
+    @transact_ro
+    def _transact_ro_current_thread(self, store):
+        return threading.current_thread()
+
+    @transact
+    def _transact_current_thread(self, store):
+        return threading.current_thread()
+
+    @inlineCallbacks
+    def test_transact_ro_and_transact_run_on_different_lanes(self):
+        ro_thread = yield self._transact_ro_current_thread()
+        rw_thread = yield self._transact_current_thread()
+        self.assertNotEqual(ro_thread, rw_thread)
+
+        stats = transact.stats()
+        self.assertEqual(stats['rw']['threads'], 1)
+        self.assertEqual(stats['ro']['threads'], GLSettings.orm_ro_threads)
+
+    @inlineCallbacks
+    def test_transact_ro_concurrent_readers(self):
+        results = yield defer.gatherResults([self._transact_ro_context_bla_bla(u'unexistent')
+                                             for _ in range(GLSettings.orm_ro_threads * 2)])
+        self.assertEqual(len(results), GLSettings.orm_ro_threads * 2)
@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+from twisted.internet import task
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
+
+from globaleaks import models
+from globaleaks.orm import transact_ro
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils import mailutils
+from globaleaks.utils.mailutils import MailDispatcher
+
+
+@transact_ro
+def get_outbox_count(store):
+    return store.find(models.Mail).count()
+
+
+class TestMailDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = MailDispatcher()
+        self.dispatcher.clock = task.Clock()
+        self.dispatcher.dispatch = lambda: None
+
+    def test_domain_rate_limit(self):
+        for to_address in ['a@example.net', 'b@example.net', 'c@example.org']:
+            self.dispatcher.enqueue(to_address, None).addErrback(lambda _: None)
+
+        self.assertEqual(self.dispatcher.ready_delay(), 0)
+        self.assertEqual(self.dispatcher.next_mail()['to_address'], 'a@example.net')
+
+        # the second mail to example.net is delayed in favour of example.org
+        self.assertEqual(self.dispatcher.next_mail()['to_address'], 'c@example.org')
+        self.assertEqual(self.dispatcher.next_mail(), None)
+        self.assertEqual(self.dispatcher.ready_delay(), GLSettings.mail_domain_interval)
+
+        self.dispatcher.clock.advance(GLSettings.mail_domain_interval)
+        self.assertEqual(self.dispatcher.ready_delay(), 0)
+        self.assertEqual(self.dispatcher.next_mail()['to_address'], 'b@example.net')
+
+    def test_fail_queue(self):
+        failures = []
+        for to_address in ['a@example.net', 'b@example.net']:
+            self.dispatcher.enqueue(to_address, None).addErrback(failures.append)
+
+        self.dispatcher.sessions = 1
+        self.dispatcher.fail_queue(Exception('test'))
+        self.assertEqual(len(failures), 0)
+
+        self.dispatcher.sessions = 0
+        self.dispatcher.fail_queue(Exception('test'))
+        self.assertEqual(len(failures), 2)
+        self.assertEqual(self.dispatcher.queue, [])
+
+
+class TestExceptionEmail(helpers.TestGL):
+    @inlineCallbacks
+    def test_exception_email_not_stored(self):
+        sent = []
+        self.patch(GLSettings, 'exceptions', {})
+        self.patch(GLSettings, 'exceptions_email_count', 0)
+        self.patch(mailutils.reactor, 'callFromThread', lambda f, *args: f(*args))
+        self.patch(mailutils, 'sendmail', lambda *args: sent.append(args))
+
+        mailutils.send_exception_email("Traceback (most recent call last):")
+
+        # the traceback is sent directly and it is not written in the outbox
+        self.assertEqual(len(sent), 1)
+        count = yield get_outbox_count()
+        self.assertEqual(count, 0)
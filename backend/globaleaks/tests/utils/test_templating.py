@@ -1,6 +1,7 @@
 # -*- encoding: utf-8 -*-
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.trial import unittest
 
 from globaleaks.tests import helpers
 from globaleaks.handlers import admin
@@ -172,3 +173,33 @@ class notifTemplateTest(helpers.TestGLWithPopulatedDB):
                 self.assertSubstring(self.context_dict['name'], gentext)
                 self.assertSubstring(self.node_dict['public_site'], gentext)
                 self.assertSubstring(self.node_dict['hidden_service'], gentext)
+
+
+class TestTemplatingCompilation(unittest.TestCase):
+    def setUp(self):
+        self.event = Event(type=u'ping_mail',
+                           trigger='Tip',
+                           node_info={'name': u'node'},
+                           receiver_info={'name': u'%EventCount%'},
+                           context_info={},
+                           tip_info=None,
+                           subevent_info={'counter': 42},
+                           do_mail=False)
+
+    def test_single_pass_rendering(self):
+        template = u'%RecipientName% %EventCount% %NodeName% %TipNum%'
+
+        # the values are not rendered again and the keywords not supported
+        # by the event type are left untouched
+        self.assertEqual(Templating().format_template(template, self.event),
+                         u'%EventCount% 42 node %TipNum%')
+
+    def test_compiled_templates_cache(self):
+        Templating.invalidate()
+
+        subject, body = Templating().format_templates([u'%NodeName%', u'%EventCount%'], self.event)
+        self.assertEqual((subject, body), (u'node', u'42'))
+        self.assertEqual(len(Templating.compiled_templates), 2)
+
+        Templating.invalidate()
+        self.assertEqual(len(Templating.compiled_templates), 0)
@@ -1,13 +1,15 @@
 # -*- encoding: utf-8 -*-
 
 import os
-from zipfile import ZipFile
+from StringIO import StringIO
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.db.appdata import load_appdata
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
+from globaleaks.utils import zipstream
 from globaleaks.utils.zipstream import ZipStream
 
 class TestCollection(helpers.TestGL):
@@ -29,3 +31,33 @@ class TestCollection(helpers.TestGL):
 
         with ZipFile(self.test_collection_file, 'r') as f:
             self.assertIsNone(f.testzip())
+
+    def test_collection_with_incompressible_files(self):
+        files = [
+            {'name': 'file.txt', 'buf': 'A' * 10000},
+            {'name': 'file.txt.pgp', 'buf': 'A' * 10000},
+            {'name': 'random.bin', 'buf': os.urandom(10000)}
+        ]
+
+        with ZipFile(StringIO(''.join(ZipStream(files))), 'r') as f:
+            self.assertIsNone(f.testzip())
+            compress_types = [zinfo.compress_type for zinfo in f.infolist()]
+
+        self.assertEqual(compress_types, [ZIP_DEFLATED, ZIP_STORED, ZIP_STORED])
+
+    def test_collection_zip64(self):
+        self.patch(zipstream, 'ZIP64_LIMIT', 1024)
+
+        with open(self.test_collection_file, 'w') as f:
+            f.write(os.urandom(50000))
+
+        files = [
+            {'name': 'file.txt', 'buf': 'A' * 10000},
+            {'name': 'random.bin', 'path': self.test_collection_file},
+            {'name': 'file.txt.pgp', 'buf': os.urandom(10000)}
+        ]
+
+        with ZipFile(StringIO(''.join(ZipStream(files))), 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertEqual(len(f.infolist()), 3)
+            self.assertEqual(f.read('random.bin'), open(self.test_collection_file, 'rb').read())
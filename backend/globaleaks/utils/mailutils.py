@@ -19,18 +19,19 @@ from email import Charset
 
 from twisted.internet.endpoints import TCP4ClientEndpoint
 from twisted.internet import reactor, protocol, error,  defer
-from twisted.mail.smtp import ESMTPSenderFactory, SMTPClient, SMTPClientError, SMTPError
+from twisted.mail.smtp import ESMTPClient, SMTPClientError, SMTPError, SMTPDeliveryError, \
+    CramMD5ClientAuthenticator, LOGINAuthenticator, PLAINAuthenticator, DNSNAME, SUCCESS
 from twisted.internet.ssl import ClientContextFactory
 from twisted.protocols import tls
-from twisted.python.failure import Failure
 
 from OpenSSL import SSL
 from txsocksx.client import SOCKS5ClientEndpoint
 
-from globaleaks import __version__
+from globaleaks import __version__, models
+from globaleaks.orm import transact
 from globaleaks.utils.utility import log
 from globaleaks.settings import GLSettings
-from globaleaks.security import GLBPGP, sha256
+from globaleaks.security import pgp_encrypt_message, sha256
 
 
 def rfc822_date():
@@ -67,76 +68,219 @@ class GLClientContextFactory(ClientContextFactory):
         return ctx
 
 
-def sendmail(to_address, subject, body):
+class GLSMTPSession(ESMTPClient):
     """
-    Sends an email using SMTPS/SMTP+TLS and torify the connection
-
-    @param to_address: the to address field of the email
-    @param subject: the mail subject
-    @param body: the mail body
-    @param event: the event description, needed to keep track of failure/success
+    ESMTP client delivering on a single connection the mails handed over by
+    the MailDispatcher; every mail is sent in its own MAIL FROM/RSET cycle.
     """
-    try:
-        if GLSettings.disable_mail_notification:
-            return defer.succeed(None)
-
-        if to_address == "":
+    def __init__(self, username, secret, contextFactory, *args, **kw):
+        self.heloFallback = 0
+        self.username = username
+        ESMTPClient.__init__(self, secret, contextFactory, *args, **kw)
+
+        self.registerAuthenticator(CramMD5ClientAuthenticator(username))
+        self.registerAuthenticator(LOGINAuthenticator(username))
+        self.registerAuthenticator(PLAINAuthenticator(username))
+
+        self.mail = None
+        self.delivered = 0
+        self.failure = None
+        self.delayed_from = None
+
+    def smtpState_from(self, code, resp):
+        # the session is kept open waiting for the rate limit of the queued
+        # mails as long as the wait is shorter than the SMTP timeout
+        self.delayed_from = None
+
+        delay = self.factory.dispatcher.ready_delay()
+        if 0 < delay < self.timeout and self.delivered < GLSettings.smtp_session_mails:
+            self.delayed_from = reactor.callLater(delay, self.smtpState_from, code, resp)
             return
 
-        result_deferred = defer.Deferred()
+        ESMTPClient.smtpState_from(self, code, resp)
+
+    def getMailFrom(self):
+        self.mail = None
+
+        if self.delivered < GLSettings.smtp_session_mails:
+            self.mail = self.factory.dispatcher.next_mail()
+
+        if self.mail is None:
+            return None
+
+        self.delivered += 1
+
+        return self.factory.from_address
+
+    def getMailTo(self):
+        return [self.mail['to_address']]
+
+    def getMailData(self):
+        return self.mail['message']
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        mail, self.mail = self.mail, None
+
+        if code not in SUCCESS:
+            mail['deferred'].errback(SMTPDeliveryError(code, resp, log.str(), addresses))
+        else:
+            mail['deferred'].callback((numOk, addresses))
+
+    def sendError(self, exc):
+        # the base class closes the connection with the SMTP server
+        ESMTPClient.sendError(self, exc)
+
+        self.failure = exc
+
+        if self.mail is not None:
+            mail, self.mail = self.mail, None
+            mail['deferred'].errback(exc)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        ESMTPClient.connectionLost(self, reason)
+
+        if self.delayed_from is not None and self.delayed_from.active():
+            self.delayed_from.cancel()
+
+        if self.failure is None and not reason.check(error.ConnectionDone):
+            self.failure = reason
+
+        if self.mail is not None:
+            mail, self.mail = self.mail, None
+            mail['deferred'].errback(reason)
 
-        def errback(reason, *args, **kwargs):
+        self.factory.dispatcher.session_closed(self)
+
+
+class GLSMTPSessionFactory(protocol.ClientFactory):
+    protocol = GLSMTPSession
+
+    def __init__(self, dispatcher, context_factory):
+        self.dispatcher = dispatcher
+        self.context_factory = context_factory
+        self.username = GLSettings.memory_copy.notif_username.encode('utf-8')
+        self.password = GLSettings.memory_copy.notif_password.encode('utf-8')
+        self.from_address = GLSettings.memory_copy.notif_source_email
+        self.security = GLSettings.memory_copy.notif_security
+
+    def buildProtocol(self, addr):
+        p = self.protocol(self.username, self.password, self.context_factory, DNSNAME)
+        p.factory = self
+        p.requireAuthentication = True
+        p.requireTransportSecurity = (self.security != 'SSL')
+        p.timeout = GLSettings.mail_timeout
+        return p
+
+
+class MailDispatcher(object):
+    """
+    Queue of the outgoing mails delivered on a bounded number of concurrent
+    SMTP sessions (GLSettings.smtp_sessions) each one reused for several
+    mails; the mails addressed to the same domain are spaced by at least
+    GLSettings.mail_domain_interval seconds.
+    """
+    def __init__(self):
+        self.queue = []
+        self.sessions = 0
+        self.last_delivery = {}
+        self.wakeup_call = None
+        self.clock = reactor
+
+    def enqueue(self, to_address, message):
+        """
+        @param to_address: the recipient of the mail
+        @param message: the file-like object of the MIME message
+        @return: a deferred fired when the mail has been delivered
+        """
+        def errback(reason):
             # TODO: here it should be written a complete debugging of the possible
             #       errors by writing clear log lines in relation to all the stack:
             #       e.g. it should debugged all errors related to: TCP/SOCKS/TLS/SSL/SMTP/SFIGA
-            if isinstance(reason, Failure):
-                log.err("SMTP connection failed (Exception: %s)" % reason.value)
-                log.debug(reason)
+            log.err("SMTP delivery to %s failed (Exception: %s)" % (to_address, reason.value))
+            log.debug(reason)
+            return reason
 
-            return result_deferred.errback(reason)
+        d = defer.Deferred()
+        d.addErrback(errback)
 
-        authentication_username=GLSettings.memory_copy.notif_username
-        authentication_password=GLSettings.memory_copy.notif_password
-        from_address=GLSettings.memory_copy.notif_source_email
-        smtp_host=GLSettings.memory_copy.notif_server
-        smtp_port=GLSettings.memory_copy.notif_port
-        security=GLSettings.memory_copy.notif_security
+        self.queue.append({
+            'to_address': to_address,
+            'domain': to_address.split('@')[-1].lower(),
+            'message': message,
+            'deferred': d
+        })
 
-        message = MIME_mail_build(GLSettings.memory_copy.notif_source_name,
-                                  GLSettings.memory_copy.notif_source_email,
-                                  to_address,
-                                  to_address,
-                                  subject,
-                                  body)
+        self.dispatch()
+
+        return d
+
+    def domain_delay(self, domain, now):
+        """
+        @return: the seconds to wait before a mail can be delivered to the domain
+        """
+        if domain not in self.last_delivery:
+            return 0
+
+        return max(0, self.last_delivery[domain] + GLSettings.mail_domain_interval - now)
+
+    def ready_delay(self):
+        """
+        @return: the seconds to wait before one of the queued mails can be delivered
+        """
+        if not len(self.queue):
+            return 0
+
+        now = self.clock.seconds()
+
+        return min(self.domain_delay(mail['domain'], now) for mail in self.queue)
 
-        log.debug('Sending email to %s using SMTP server [%s:%d] [%s]' %
-                  (to_address, smtp_host, smtp_port, security))
+    def next_mail(self):
+        """
+        @return: the first queued mail that can be delivered, or None
+        """
+        now = self.clock.seconds()
+
+        for i, mail in enumerate(self.queue):
+            if self.domain_delay(mail['domain'], now) == 0:
+                self.last_delivery[mail['domain']] = now
+                return self.queue.pop(i)
+
+    def dispatch(self):
+        if self.wakeup_call is not None and self.wakeup_call.active():
+            self.wakeup_call.cancel()
+
+        self.wakeup_call = None
+
+        if not len(self.queue):
+            return
+
+        delay = self.ready_delay()
+        if delay > 0:
+            # the open sessions wait by themselves the rate limit
+            if self.sessions == 0:
+                self.wakeup_call = self.clock.callLater(delay, self.dispatch)
+            return
+
+        while self.sessions < min(GLSettings.smtp_sessions, len(self.queue)):
+            self.open_session()
+
+    def open_session(self):
+        self.sessions += 1
+
+        smtp_host = GLSettings.memory_copy.notif_server
+        smtp_port = GLSettings.memory_copy.notif_port
+        security = GLSettings.memory_copy.notif_security
+
+        log.debug('Opening SMTP session with server [%s:%d] [%s] (%d queued mails)' %
+                  (smtp_host, smtp_port, security, len(self.queue)))
 
         context_factory = GLClientContextFactory()
 
-        esmtp_deferred = defer.Deferred()
-        esmtp_deferred.addCallbacks(result_deferred.callback, errback)
-
-        factory = ESMTPSenderFactory(
-            authentication_username.encode('utf-8'),
-            authentication_password.encode('utf-8'),
-            from_address,
-            to_address,
-            message,
-            esmtp_deferred,
-            contextFactory=context_factory,
-            requireAuthentication=True,
-            requireTransportSecurity=(security != 'SSL'),
-            retries=0,
-            timeout=GLSettings.mail_timeout)
+        factory = GLSMTPSessionFactory(self, context_factory)
 
         if security == "SSL":
             factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
 
-        if GLSettings.testing:
-            #  Hooking the test down to here is a trick to be able to test all the above code :)
-            return defer.succeed(None)
-
         if not GLSettings.disable_mail_torification:
             socksProxy = TCP4ClientEndpoint(reactor, GLSettings.socks_host, GLSettings.socks_port, timeout=GLSettings.mail_timeout)
             endpoint = SOCKS5ClientEndpoint(smtp_host.encode('utf-8'), smtp_port, socksProxy)
@@ -144,9 +288,68 @@ def sendmail(to_address, subject, body):
             endpoint = TCP4ClientEndpoint(reactor, smtp_host.encode('utf-8'), smtp_port, timeout=GLSettings.mail_timeout)
 
         d = endpoint.connect(factory)
-        d.addErrback(errback)
+        d.addErrback(self.session_failed)
+
+    def session_failed(self, reason):
+        log.err("SMTP connection failed (Exception: %s)" % reason.value)
+        log.debug(reason)
+
+        self.sessions -= 1
+        self.fail_queue(reason)
+
+    def session_closed(self, session):
+        self.sessions -= 1
+
+        if session.failure is not None and session.delivered == 0:
+            # new sessions are not opened for a server that is failing;
+            # the queue is left to the sessions that are still open
+            self.fail_queue(session.failure)
+            return
 
-        return result_deferred
+        self.dispatch()
+
+    def fail_queue(self, reason):
+        if self.sessions > 0:
+            return
+
+        queue, self.queue = self.queue, []
+        for mail in queue:
+            mail['deferred'].errback(reason)
+
+
+GLMailDispatcher = MailDispatcher()
+
+
+def sendmail(to_address, subject, body):
+    """
+    Sends an email using SMTPS/SMTP+TLS and torify the connection
+
+    @param to_address: the to address field of the email
+    @param subject: the mail subject
+    @param body: the mail body
+    @return: a deferred fired when the mail has been delivered by GLMailDispatcher
+    """
+    try:
+        if GLSettings.disable_mail_notification:
+            return defer.succeed(None)
+
+        if to_address == "":
+            return
+
+        message = MIME_mail_build(GLSettings.memory_copy.notif_source_name,
+                                  GLSettings.memory_copy.notif_source_email,
+                                  to_address,
+                                  to_address,
+                                  subject,
+                                  body)
+
+        log.debug('Queueing email to %s' % to_address)
+
+        if GLSettings.testing:
+            #  Hooking the test down to here is a trick to be able to test all the above code :)
+            return defer.succeed(None)
+
+        return GLMailDispatcher.enqueue(to_address, message)
 
     except Exception as excep:
         # we strongly need to avoid raising exception inside email logic to avoid chained errors
@@ -154,6 +357,26 @@ def sendmail(to_address, subject, body):
         return defer.fail()
 
 
+def db_schedule_email(store, address, subject, body):
+    """
+    Store a rendered (and when needed encrypted) mail in the outbox;
+    the delivery is performed with retries by the mailflush job.
+    """
+    def to_unicode(value):
+        return value if isinstance(value, unicode) else unicode(value, 'utf-8', 'replace')
+
+    mail = models.Mail()
+    mail.address = to_unicode(address)
+    mail.subject = to_unicode(subject)
+    mail.body = to_unicode(body)
+    store.add(mail)
+
+
+@transact
+def schedule_email(store, address, subject, body):
+    db_schedule_email(store, address, subject, body)
+
+
 def MIME_mail_build(src_name, src_mail, dest_name, dest_mail, title, mail_body):
     # Override python's weird assumption that utf-8 text should be encoded with
     # base64, and instead use quoted-printable (for both subject and body).  I
@@ -254,10 +477,10 @@ def send_exception_email(mail_body, mail_reason="GlobaLeaks Exception"):
 
         # If the receiver has encryption enabled (for notification), encrypt the mail body
         if GLSettings.memory_copy.exception_email_pgp_key_status == u'enabled':
-            gpob = GLBPGP()
             try:
-                gpob.load_key(GLSettings.memory_copy.exception_email_pgp_key_public)
-                mail_body = gpob.encrypt_message(GLSettings.memory_copy.exception_email_pgp_key_fingerprint, mail_body)
+                mail_body = pgp_encrypt_message(GLSettings.memory_copy.exception_email_pgp_key_public,
+                                                GLSettings.memory_copy.exception_email_pgp_key_fingerprint,
+                                                mail_body)
             except Exception as excep:
                 # If exception emails are configured to be subject to encryption an the key
                 # expires the only thing to do is to disable the email.
@@ -265,13 +488,14 @@ def send_exception_email(mail_body, mail_reason="GlobaLeaks Exception"):
                 #       this could be done simply here replacing the email subject and body.
                 log.err("Error while encrypting exception email: %s" % str(excep))
                 return None
-            finally:
-                # the finally statement is always called also if
-                # except contains a return or a raise
-                gpob.destroy_environment()
 
-        # avoid to wait for the notification to happen  but rely on  background completion
-        sendmail(GLSettings.memory_copy.exception_email_address, mail_subject,  mail_body)
+        # the exception mails carry tracebacks and so they are not stored
+        # in the outbox but sent directly on a best effort basis; the mail
+        # is queued in the reactor thread because this function may be
+        # called by the threads of the ORM
+        reactor.callFromThread(sendmail,
+                               GLSettings.memory_copy.exception_email_address,
+                               mail_subject, mail_body)
 
     except Exception as excep:
         # we strongly need to avoid raising exception inside email logic to avoid chained errors
@@ -8,6 +8,8 @@
 # supporter KeyWords are here documented:
 # https://github.com/globaleaks/GlobaLeaks/wiki/Customization-guide#customize-notification
 
+import re
+
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import ISO8601_to_pretty_str, ISO8601_to_day_str, \
     ISO8601_to_datetime, datetime_now
@@ -31,7 +33,7 @@ class Keyword(object):
     be used only in specific Event.
     """
 
-    shared_keywords = [
+    keyword_list = [
         '%NodeName%',
         '%HiddenService%',
         '%PublicSite%',
@@ -41,9 +43,6 @@ class Keyword(object):
     ]
 
     def __init__(self, node_desc, context_desc, receiver_desc):
-
-        self.keyword_list = Keyword.shared_keywords
-
         self.node = node_desc
         self.context = context_desc
         self.receiver = receiver_desc
@@ -70,7 +69,7 @@ class Keyword(object):
         return self.node.get('name', '')
 
 class TipKeyword(Keyword):
-    tip_keywords = [
+    keyword_list = Keyword.keyword_list + [
         '%TipTorURL%',
         '%TipT2WURL%',
         '%TorURL%',
@@ -87,7 +86,6 @@ class TipKeyword(Keyword):
         super(TipKeyword, self).__init__(node_desc, context_desc,
                                          receiver_desc)
 
-        self.keyword_list += TipKeyword.tip_keywords
         self.tip = tip_desc
 
     def TipTorURL(self):
@@ -138,7 +136,7 @@ class TipKeyword(Keyword):
         return unicode(missing_hours)
 
 class CommentKeyword(TipKeyword):
-    comment_keywords = [
+    keyword_list = TipKeyword.keyword_list + [
         '%CommentSource%',
         '%EventTime%'
     ]
@@ -146,7 +144,6 @@ class CommentKeyword(TipKeyword):
     def __init__(self, node_desc, context_desc, receiver_desc, tip_desc, comment_desc):
         super(CommentKeyword, self).__init__(node_desc, context_desc, receiver_desc, tip_desc)
 
-        self.keyword_list += CommentKeyword.comment_keywords
         self.comment = comment_desc
 
     def CommentSource(self):
@@ -157,7 +154,7 @@ class CommentKeyword(TipKeyword):
 
 
 class MessageKeyword(TipKeyword):
-    message_keywords = [
+    keyword_list = TipKeyword.keyword_list + [
         '%MessageSource%',
         '%EventTime%'
     ]
@@ -167,7 +164,6 @@ class MessageKeyword(TipKeyword):
                                              receiver_desc,
                                              tip_desc)
 
-        self.keyword_list += MessageKeyword.message_keywords
         self.message = message_desc
 
     def MessageSource(self):
@@ -178,7 +174,7 @@ class MessageKeyword(TipKeyword):
 
 
 class FileKeyword(TipKeyword):
-    file_keywords = [
+    keyword_list = TipKeyword.keyword_list + [
         '%FileName%',
         '%EventTime%',
         '%FileSize%',
@@ -190,7 +186,6 @@ class FileKeyword(TipKeyword):
                                           receiver_desc,
                                           tip_desc)
 
-        self.keyword_list += FileKeyword.file_keywords
         self.file = file_desc
 
     def FileName(self):
@@ -207,7 +202,7 @@ class FileKeyword(TipKeyword):
 
 
 class ArchiveDescription(TipKeyword):
-    archive_description_keywords = [
+    keyword_list = TipKeyword.keyword_list + [
         '%FileList%',
         '%FilesNumber%',
         '%TotalSize%'
@@ -218,7 +213,6 @@ class ArchiveDescription(TipKeyword):
                                              receiver_desc,
                                              tip_desc)
 
-        self.keyword_list += ArchiveDescription.archive_description_keywords
         self.archive = archive_desc
 
     def FileList(self):
@@ -232,8 +226,7 @@ class ArchiveDescription(TipKeyword):
 
 
 class PingMailKeyword(Keyword):
-    ping_mail_keywords = [
-        '%RecipientName%',
+    keyword_list = Keyword.keyword_list + [
         '%EventCount%'
     ]
 
@@ -244,8 +237,6 @@ class PingMailKeyword(Keyword):
         """
         super(PingMailKeyword, self).__init__(node_desc, context_desc, receiver_desc)
 
-        self.keyword_list += PingMailKeyword.ping_mail_keywords
-
         self.name = receiver_desc.get('name', '')
         self.counter = ping_desc.get('counter', 0)
 
@@ -257,15 +248,13 @@ class PingMailKeyword(Keyword):
 
 
 class AdminPGPAlertKeyword(Keyword):
-    admin_pgp_alert_keywords = [
+    keyword_list = Keyword.keyword_list + [
         "%PGPKeyInfoList%"
     ]
 
     def __init__(self, node_desc, context_desc, receiver_desc, tip_desc, alert_desc):
         super(AdminPGPAlertKeyword, self).__init__(node_desc, context_desc, receiver_desc)
 
-        self.keyword_list += AdminPGPAlertKeyword.admin_pgp_alert_keywords
-
         self.alert = alert_desc
 
     def PGPKeyInfoList(self):
@@ -284,15 +273,13 @@ class AdminPGPAlertKeyword(Keyword):
 
 
 class PGPAlertKeyword(Keyword):
-    pgp_alert_keywords = [
+    keyword_list = Keyword.keyword_list + [
         "%PGPKeyInfo%"
     ]
 
     def __init__(self, node_desc, context_desc, receiver_desc, tip_desc, *x):
         super(PGPAlertKeyword, self).__init__(node_desc, context_desc, receiver_desc)
 
-        self.keyword_list += PGPAlertKeyword.pgp_alert_keywords
-
     def PGPKeyInfo(self):
         fingerprint = self.receiver.get('pgp_key_fingerprint', None)
         if fingerprint is not None:
@@ -326,11 +313,47 @@ class Templating(object):
         u'admin_pgp_expiration_alert': AdminPGPAlertKeyword,
         u'pgp_expiration_alert': PGPAlertKeyword,
         u'tip_expiration': TipKeyword,
-        u'receiver_notification_limit_reached': ReceiverKeyword
+        u'receiver_notification_limit_reached': ReceiverKeyword,
+        u'digest': ReceiverKeyword
     }
 
-    def format_template(self, raw_template, event_dicts):
-        if event_dicts.type not in self.supported_event_types.keys():
+    # the keywords supported by each event type
+    supported_keywords = dict((event_type, frozenset(keyword_class.keyword_list))
+                              for event_type, keyword_class in supported_event_types.iteritems())
+
+    # the split by this regexp alternates the literal text of the templates
+    # (even positions) with the keywords (odd positions)
+    keyword_regexp = re.compile('(%s)' % '|'.join(re.escape(kw) for kw in
+                                                  set.union(*[set(kws) for kws in supported_keywords.values()])))
+
+    # cache of the compiled templates indexed by their text and so by
+    # (notification template, language); it is invalidated on every
+    # update of the Notification settings.
+    compiled_templates = {}
+    compiled_templates_limit = 1024
+
+    @classmethod
+    def compile_template(cls, raw_template):
+        tokens = cls.compiled_templates.get(raw_template, None)
+        if tokens is None:
+            if len(cls.compiled_templates) >= cls.compiled_templates_limit:
+                cls.compiled_templates.clear()
+
+            tokens = tuple(cls.keyword_regexp.split(raw_template))
+            cls.compiled_templates[raw_template] = tokens
+
+        return tokens
+
+    @classmethod
+    def invalidate(cls):
+        cls.compiled_templates.clear()
+
+    def format_templates(self, raw_templates, event_dicts):
+        """
+        Render the templates in a single pass each, sharing between them
+        the keyword converter and the value of the keywords.
+        """
+        if event_dicts.type not in self.supported_event_types:
             raise AssertionError("%s at the moment supported: [%s] is NOT " %
                                  (self.supported_event_types.keys(), event_dicts.type))
 
@@ -340,18 +363,33 @@ class Templating(object):
                                           event_dicts.receiver_info, event_dicts.tip_info,
                                           event_dicts.subevent_info)
 
-        # we've now:
-        # 1) template => directly from Notification.*_template
-        # 2) keyword_converter => object aligned with Event type and data
-
-        for kw in keyword_converter.keyword_list:
-            if raw_template.count(kw):
-                # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
-                variable_content = getattr(keyword_converter, kw[1:-1])()
-                raw_template = raw_template.replace(kw, variable_content)
-
-        # Is no more Raw, because all the keywords that shall be converted in
-        # the Event.type, has been converted. So if you have request %TipFields% in
-        # a Comment notification template, you would get just a message with a not
-        # converted keyword.
-        return raw_template
+        supported_keywords = self.supported_keywords[event_dicts.type]
+        values = {}
+
+        ret = []
+        for raw_template in raw_templates:
+            tokens = self.compile_template(raw_template)
+
+            chunks = list(tokens)
+            for i in xrange(1, len(tokens), 2):
+                kw = tokens[i]
+
+                # A keyword not supported by the Event.type is not converted. So if
+                # you have request %TipFields% in a Comment notification template,
+                # you would get just a message with a not converted keyword.
+                if kw not in supported_keywords:
+                    continue
+
+                if kw not in values:
+                    # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
+                    value = getattr(keyword_converter, kw[1:-1])()
+                    values[kw] = value if isinstance(value, basestring) else unicode(value)
+
+                chunks[i] = values[kw]
+
+            ret.append(''.join(chunks))
+
+        return ret
+
+    def format_template(self, raw_template, event_dicts):
+        return self.format_templates([raw_template], event_dicts)[0]
@@ -21,6 +21,21 @@ except ImportError:
 __all__ = ["ZIP_STORED", "ZIP_DEFLATED", "ZipStream"]
 
 ZIP64_LIMIT= (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+
+# Extensions of files whose content is already compressed or encrypted;
+# deflating them would just burn CPU so they are always stored.
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    'pgp', 'gpg', 'asc',
+    'zip', 'gz', 'tgz', 'bz2', 'xz', 'lzma', '7z', 'rar',
+    'jpg', 'jpeg', 'png', 'gif', 'webp',
+    'mp3', 'ogg', 'oga', 'm4a', 'aac', 'flac', 'opus',
+    'mp4', 'm4v', 'mkv', 'avi', 'mov', 'webm', 'ogv',
+    'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'epub', 'jar', 'apk'
+])
+
+# Ratio over which a sample of the content is considered incompressible
+INCOMPRESSIBLE_RATIO = 0.95
 
 # constants for Zip file compression methods
 ZIP_STORED = 0
@@ -98,6 +113,7 @@ class ZipInfo(object):
             'CRC',
             'compress_size',
             'file_size',
+            'zip64',
         )
 
     def __init__(self, filename="NoName", date_time=(1980,1,1,0,0,0), compression=ZIP_DEFLATED):
@@ -147,6 +163,7 @@ class ZipInfo(object):
         self.CRC = 0
         self.compress_size = 0
         self.file_size = 0
+        self.zip64 = False               # Sizes are written in ZIP64 format
 
     def _encodeFilenameFlags(self):
         if isinstance(self.filename, unicode):
@@ -158,7 +175,7 @@ class ZipInfo(object):
             return self.filename, self.flag_bits
 
     def DataDescriptor(self):
-        if self.compress_size > ZIP64_LIMIT or self.file_size > ZIP64_LIMIT:
+        if self.zip64:
             fmt = "<4slQQ"
         else:
             fmt = "<4slLL"
@@ -179,9 +196,11 @@ class ZipInfo(object):
 
         extra = self.extra
 
-        if file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+        if self.zip64 or file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
             # File is larger than what fits into a 4 byte integer,
-            # fall back to the ZIP64 extension
+            # fall back to the ZIP64 extension; the sizes in the data
+            # descriptor are then written with 8 bytes too.
+            self.zip64 = True
             fmt = '<hhqq'
             extra = extra + struct.pack(fmt,
                     1, struct.calcsize(fmt)-4, file_size, compress_size)
@@ -200,8 +219,27 @@ class ZipInfo(object):
 
         return header + filename + extra
 
+def choose_compression(arcname, sample, compression):
+    """
+    Select the compression method for an entry given its name and a sample
+    of its content; already compressed or encrypted content is stored.
+    """
+    if compression == ZIP_STORED:
+        return ZIP_STORED
+
+    if arcname.rsplit('.', 1)[-1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return ZIP_STORED
+
+    if sample and len(zlib.compress(sample, 1)) >= len(sample) * INCOMPRESSIBLE_RATIO:
+        return ZIP_STORED
+
+    return compression
+
+
 class ZipStream(object):
     """
+    Generates a ZIP archive as a sequence of chunks while reading the
+    files it is composed of.
     """
 
     def __init__(self, files, compression=ZIP_DEFLATED):
@@ -264,20 +302,27 @@ class ZipStream(object):
         as described in section V. of the PKZIP Application Note:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
-        zinfo = ZipInfo(arcname, self.time, self.compression)
-        zinfo.header_offset = self.data_ptr
-        yield self.update_data_ptr(zinfo.FileHeader())
+        with open(filename, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
 
-        if zinfo.compress_type == ZIP_DEFLATED:
-            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
-        else:
-            cmpr = None
+            # the first chunk is read before writing the header in order
+            # to select the compression method on the base of the content
+            buf = fp.read(1024 * 8)
 
-        with open(filename, "rb") as fp:
-            while 1:
-                buf = fp.read(1024 * 8)
-                if not buf:
-                    break
+            zinfo = ZipInfo(arcname, self.time, choose_compression(arcname, buf, self.compression))
+            zinfo.header_offset = self.data_ptr
+
+            # deflate may slightly expand incompressible data
+            zinfo.zip64 = size + (size >> 10) + 1024 > ZIP64_LIMIT
+
+            yield self.update_data_ptr(zinfo.FileHeader())
+
+            if zinfo.compress_type == ZIP_DEFLATED:
+                cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            else:
+                cmpr = None
+
+            while buf:
                 zinfo.file_size += len(buf)
                 zinfo.CRC = binascii.crc32(buf, zinfo.CRC)
                 if cmpr:
@@ -285,6 +330,8 @@ class ZipStream(object):
                     zinfo.compress_size += len(buf)
                 yield self.update_data_ptr(buf)
 
+                buf = fp.read(1024 * 8)
+
         if cmpr:
             buf = cmpr.flush()
             zinfo.compress_size += len(buf)
@@ -310,8 +357,14 @@ class ZipStream(object):
         as described in section V. of the PKZIP Application Note:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
-        zinfo = ZipInfo(arcname, self.time, self.compression)
+        if isinstance(filebuf, unicode):
+            buf = filebuf.encode('utf-8')
+        else:
+            buf = filebuf
+
+        zinfo = ZipInfo(arcname, self.time, choose_compression(arcname, buf[:1024 * 8], self.compression))
         zinfo.header_offset = self.data_ptr
+        zinfo.zip64 = len(buf) + (len(buf) >> 10) + 1024 > ZIP64_LIMIT
 
         yield self.update_data_ptr(zinfo.FileHeader())
 
@@ -320,13 +373,8 @@ class ZipStream(object):
         else:
             cmpr = None
 
-        zinfo.file_size = len(filebuf)
-        zinfo.CRC = binascii.crc32(filebuf, zinfo.CRC)
-
-        if isinstance(filebuf, unicode):
-            buf = filebuf.encode('utf-8')
-        else:
-            buf = filebuf
+        zinfo.file_size = len(buf)
+        zinfo.CRC = binascii.crc32(buf, zinfo.CRC)
 
         if cmpr:
             buf = cmpr.compress(buf)
@@ -412,7 +460,7 @@ class ZipStream(object):
 
         pos2 = self.data_ptr
         # Write end-of-zip-archive record
-        if pos1 > ZIP64_LIMIT:
+        if pos1 > ZIP64_LIMIT or pos2 - pos1 > ZIP64_LIMIT or count >= ZIP_FILECOUNT_LIMIT:
             # Need to write the ZIP64 end-of-archive records
             zip64endrec = struct.pack(structEndArchive64, stringEndArchive64,
                                       44, 45, 45, 0, 0, count, count, pos2 - pos1, pos1)
@@ -422,8 +470,13 @@ class ZipStream(object):
                                       stringEndArchive64Locator, 0, pos2, 1)
             data.append( self.update_data_ptr(zip64locrec))
 
+            # the values that do not fit are set to -1 (all one bits)
+            # and read from the ZIP64 records
+            count_32 = min(count, ZIP_FILECOUNT_LIMIT)
+            centdir_size = pos2 - pos1 if pos2 - pos1 <= ZIP64_LIMIT else -1
+
             endrec = struct.pack(structEndArchive, stringEndArchive,
-                                 0, 0, count, count, pos2 - pos1, -1, 0)
+                                 0, 0, count_32, count_32, centdir_size, -1, 0)
             data.append( self.update_data_ptr(endrec))
 
         else:
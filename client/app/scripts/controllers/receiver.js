@@ -5,9 +5,60 @@ GLClient.controller('ReceiverSidebarCtrl', ['$scope', '$location', function($sco
 }]);
 
 
-GLClient.controller('ReceiverTipsCtrl', ['$scope',  '$http', '$route', '$location', '$uibModal', 'ReceiverTips',
-  function($scope, $http, $route, $location, $uibModal, ReceiverTips) {
-  $scope.tips = ReceiverTips.query();
+GLClient.controller('ReceiverTipsCtrl', ['$scope',  '$http', '$route', '$location', '$filter', '$uibModal', 'ReceiverTips',
+  function($scope, $http, $route, $location, $filter, $uibModal, ReceiverTips) {
+  // the tips are sorted and paginated by the backend; the counters are
+  // not sortable by the backend and sort only the tips of the page
+  var local_sort_keys = {
+    'files': 'file_counter',
+    'comments': 'comment_counter',
+    'messages': 'message_counter'
+  };
+
+  $scope.tips = [];
+  $scope.tips_total = 0;
+  $scope.tips_page = 1;
+  $scope.tips_per_page = 100; // the maximum page size of the backend
+  $scope.sortKey = 'creation_date';
+  $scope.sortReverse = true;
+
+  var sort_page = function() {
+    if ($scope.sortKey in local_sort_keys) {
+      $scope.tips = $filter('orderBy')($scope.tips, local_sort_keys[$scope.sortKey], $scope.sortReverse);
+    }
+  };
+
+  $scope.load_tips = function() {
+    var query = {
+      'limit': $scope.tips_per_page,
+      'offset': ($scope.tips_page - 1) * $scope.tips_per_page
+    };
+
+    if (!($scope.sortKey in local_sort_keys)) {
+      query.sort = $scope.sortKey;
+      query.order = $scope.sortReverse ? 'desc' : 'asc';
+    }
+
+    ReceiverTips.query(query, function(tips, headers) {
+      $scope.tips = tips;
+      $scope.tips_total = parseInt(headers('X-Total-Count'), 10);
+      sort_page();
+    });
+  };
+
+  $scope.sort_tips = function(key) {
+    $scope.sortKey = key;
+    $scope.sortReverse = !$scope.sortReverse;
+
+    if (key in local_sort_keys) {
+      sort_page();
+    } else {
+      $scope.tips_page = 1;
+      $scope.load_tips();
+    }
+  };
+
+  $scope.load_tips();
 
   $scope.selected_tips = [];
 